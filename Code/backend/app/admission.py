@@ -0,0 +1,290 @@
+"""
+Admission control for the upstream-bound endpoints.
+
+Without it every request is accepted and parked on a threadpool thread
+behind slow Gemini / ElevenLabs calls, so under a spike all requests
+time out together. Instead, per worker:
+
+  * at most admission_max_concurrency requests run at once; the rest
+    wait in a bounded queue per endpoint class
+  * waiting requests are admitted by priority (interactive chat before
+    TTS before batch), FIFO within a class
+  * batch / background callers (evaluation runs, prefetching) send
+    "X-Request-Class: batch" on any gated route. Batch queues behind
+    everything else and has the shortest deadline and queue, so it is
+    the first work shed under load. The header can only lower a
+    request's priority, never raise it
+  * a request whose expected queue wait exceeds its class deadline is
+    rejected at once with 503 + Retry-After, as is one that waits past
+    the deadline or finds its queue full
+  * each client (remote address; run uvicorn with --proxy-headers behind
+    a proxy) has a token bucket per class; an empty bucket gets 429
+
+Waiting happens on the event loop, so queued requests hold no threads
+and /health and static files stay fast. Counters are in /health under
+"admission".
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+from .settings import settings
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+# ============================================================
+# Per-class state
+# ============================================================
+
+class RequestClass:
+    """One priority class (lower priority value = admitted first)."""
+
+    def __init__(self, name: str, priority: int, max_queue: int, deadline: float, rate_per_minute: float):
+        self.name = name
+        self.priority = priority
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.rate = rate_per_minute / 60.0  # tokens per second, 0 = unlimited
+
+        self.queued = 0
+        self.running = 0
+        self.service_ewma = 1.0  # seconds; first guess until measured
+        self.waits = deque(maxlen=512)
+        self.counters = {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "shed_timeout": 0, "rate_limited": 0}
+
+    def observe_service(self, seconds: float, alpha: float = 0.2):
+        self.service_ewma += alpha * (seconds - self.service_ewma)
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        pick = lambda q: round(waits[int(q * (len(waits) - 1))] * 1000, 1) if waits else None
+        return {
+            "priority": self.priority,
+            "queue_depth": self.queued,
+            "running": self.running,
+            "wait_p50_ms": pick(0.5),
+            "wait_p95_ms": pick(0.95),
+            "service_ewma_ms": round(self.service_ewma * 1000, 1),
+            **self.counters,
+        }
+
+
+class TokenBuckets:
+    """Per (client, class) token buckets; full (idle) buckets are dropped."""
+
+    def __init__(self, burst: int, max_clients: int = 10000):
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = {}  # (client, class) -> [tokens, last refill, rate]
+
+    def take(self, client: str, cls: RequestClass) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        if cls.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        bucket = self._buckets.get((client, cls.name))
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._prune(now)
+            bucket = self._buckets[(client, cls.name)] = [float(self.burst), now, cls.rate]
+
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * cls.rate)
+        bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / cls.rate
+
+    def _prune(self, now: float):
+        full = [key for key, (tokens, last, rate) in self._buckets.items() if tokens + (now - last) * rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+# ============================================================
+# Controller
+# ============================================================
+
+class AdmissionController:
+    """
+    Priority gate around `capacity` execution slots. Only touched from
+    the event loop, so no locking is needed.
+    """
+
+    def __init__(self, capacity: int, classes: list, routes: dict, burst: int):
+        self.capacity = capacity
+        self.classes = {c.name: c for c in classes}
+        self.routes = routes
+        self.buckets = TokenBuckets(burst)
+
+        self.running = 0
+        self._waiters = []  # heap of (priority, seq, future, class)
+        self._seq = itertools.count()
+
+    def classify(self, path: str, requested: Optional[str] = None) -> Optional[RequestClass]:
+        name = self.routes.get(path.rstrip("/") or "/")
+        cls = self.classes.get(name) if name else None
+        if cls is None or not requested:
+            return cls
+
+        # A client may ask for a lower-priority class, not a higher one
+        lower = self.classes.get(requested)
+        return lower if lower is not None and lower.priority >= cls.priority else cls
+
+    def expected_wait(self, cls: RequestClass) -> float:
+        """Work queued at or above cls's priority, spread over all slots."""
+        if self.running < self.capacity and not self._waiters:
+            return 0.0
+        ahead = sum(c.service_ewma for p, _, f, c in self._waiters if p <= cls.priority and not f.done())
+        # plus, on average, half of one running request
+        return (ahead + 0.5 * cls.service_ewma) / self.capacity
+
+    async def acquire(self, cls: RequestClass, client: str) -> float:
+        """Wait for a slot. Returns the time waited; raises Rejected."""
+        retry = self.buckets.take(client, cls)
+        if retry > 0:
+            cls.counters["rate_limited"] += 1
+            raise Rejected(429, "rate_limited", retry)
+
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)  # timed out / cancelled waiters
+        if self.running < self.capacity and not self._waiters:
+            self._admit(cls)
+            cls.waits.append(0.0)
+            return 0.0
+
+        if cls.queued >= cls.max_queue:
+            cls.counters["shed_queue_full"] += 1
+            raise Rejected(503, "queue_full", self.expected_wait(cls))
+
+        estimate = self.expected_wait(cls)
+        if estimate > cls.deadline:
+            cls.counters["shed_deadline"] += 1
+            raise Rejected(503, "overloaded", estimate)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (cls.priority, next(self._seq), future, cls))
+        cls.queued += 1
+        t0 = time.monotonic()
+
+        try:
+            await asyncio.wait_for(future, cls.deadline)
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                cls.counters["shed_timeout"] += 1
+                raise Rejected(503, "queue_timeout", self.expected_wait(cls) or cls.service_ewma)
+            # Granted a slot in the same tick the deadline fired: it is ours to use
+        except asyncio.CancelledError:
+            # Client went away; hand a slot granted meanwhile to the next waiter
+            if future.done() and not future.cancelled():
+                cls.running -= 1
+                self._release_slot()
+            raise
+        finally:
+            cls.queued -= 1
+
+        # The slot was counted as running when it was handed over
+        waited = time.monotonic() - t0
+        cls.waits.append(waited)
+        return waited
+
+    def _admit(self, cls: RequestClass):
+        self.running += 1
+        cls.running += 1
+        cls.counters["admitted"] += 1
+
+    def _release_slot(self):
+        self.running -= 1
+        while self._waiters and self.running < self.capacity:
+            _, _, future, cls = heapq.heappop(self._waiters)
+            if future.done():  # timed out or cancelled
+                continue
+            future.set_result(None)
+            self._admit(cls)
+
+    def release(self, cls: RequestClass, service_seconds: float):
+        cls.running -= 1
+        cls.observe_service(service_seconds)
+        self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "running": self.running,
+            "queued": sum(1 for *_, f, _ in self._waiters if not f.done()),
+            "classes": {name: c.stats() for name, c in self.classes.items()},
+        }
+
+
+# ============================================================
+# ASGI middleware
+# ============================================================
+
+CLASS_HEADER = b"x-request-class"
+
+
+class AdmissionMiddleware:
+    """Gates the routes of `controller`; everything else passes straight through."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        cls = None
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            requested = dict(scope.get("headers") or []).get(CLASS_HEADER, b"")
+            cls = self.controller.classify(scope["path"], requested.decode("latin-1").strip().lower())
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        client = (scope.get("client") or ("unknown",))[0]
+        try:
+            await self.controller.acquire(cls, client)
+        except Rejected as e:
+            print(f"[WARN] {e.status} {e.reason} for {scope['path']} (retry after {e.retry_after}s)")
+            response = JSONResponse(
+                {"error": e.reason, "retry_after": e.retry_after},
+                status_code=e.status,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            return await response(scope, receive, send)
+
+        t0 = time.monotonic()
+        try:
+            await self.app(scope, receive, send)  # returns once the body (incl. streams) is sent
+        finally:
+            self.controller.release(cls, time.monotonic() - t0)
+
+
+# ============================================================
+# Deployment configuration
+# ============================================================
+
+CLASSES = [
+    RequestClass("chat", 0, settings.chat_max_queue, settings.chat_queue_deadline_seconds, settings.chat_rate_per_minute),
+    RequestClass("tts", 1, settings.tts_max_queue, settings.tts_queue_deadline_seconds, settings.tts_rate_per_minute),
+    RequestClass("batch", 2, settings.batch_max_queue, settings.batch_queue_deadline_seconds, settings.batch_rate_per_minute),
+]
+ROUTES = {
+    "/chat": "chat",
+    "/chat/speech": "chat",
+    "/tts": "tts",
+}
+
+controller = AdmissionController(settings.admission_max_concurrency, CLASSES, ROUTES, settings.client_burst)
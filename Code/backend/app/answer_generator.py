@@ -4,29 +4,101 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from textwrap import dedent
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 
 # Google Gemini API
 from google import genai  
 from google.genai.types import GenerateContentConfig
 
-from .retriever import retrieve_chunks
+from .extractive import CLOSING_LINES, extractive_answer
+from .fake_gemini import FakeGeminiClient
+from .fake_upstreams import parse_latency
+from .prompt_cache import CacheHandle, ContextCacheRegistry
+from .hits import Hit, blend_followup
+from .sessions import Session, SessionStore
+from .settings import settings
+from .singleflight import SingleFlight
+
+# Retrieval runs in-process, in a shared sidecar process that holds the
+# model + index for all API workers, or scatter-gathered over index
+# shards (same function names either way)
+if settings.retrieval_backend == "sidecar":
+    from .retrieval_sidecar import client as retrieval
+elif settings.retrieval_backend == "sharded":
+    from .sharding import client as retrieval
+else:
+    from . import retriever as retrieval
 
 
 # ============================================================
 # Load Gemini Client (Google GenAI)
 # ============================================================
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-print("[DEBUG] GEMINI API KEY LOADED:", bool(os.getenv("GEMINI_API_KEY")))
+if settings.llm_backend == "fake":
+    print("[INFO] Using offline fake Gemini client")
+    gemini_client = FakeGeminiClient(
+        latency=parse_latency(settings.fake_llm_latency),
+        error_rate=settings.fake_llm_error_rate,
+    )
+else:
+    gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    print("[DEBUG] GEMINI API KEY LOADED:", bool(os.getenv("GEMINI_API_KEY")))
+
+
+# ============================================================
+# Static prompt parts
+# ============================================================
+SYSTEM_INSTRUCTION = dedent("""
+    You are TrustMedAI, a safe and helpful medical education assistant.
+
+    GUIDELINES:
+    - Base your answer ONLY on the provided context.
+    - DO NOT invent facts or add medical advice.
+    - DO NOT diagnose or suggest treatments/medications.
+    - Write clearly and cite sources (“According to Mayo Clinic…”).
+    - Keep tone factual and calm.
+
+    RESPONSE STYLE:
+    - Keep the answer **short, clear, and easy to read**.
+    - Use **2–5 bullet points**, not long paragraphs.
+    - Do NOT write citations inside the explanation.
+    - Use simple language (8th–10th grade level).
+    - Do NOT diagnose or give treatment advice.
+    - NEVER invent facts not present in the context.
+
+    FORMAT EXACTLY LIKE THIS:
+
+    <Answer in short bullet points>
+
+    Do you have any more questions? Or Would you like me to help you schedule an appointment with a doctor or clinic?
+    -------------------------------------
+""").strip()
+
+CONTEXT_HEADER = "CONTEXT (USE ONLY THIS INFORMATION):"
+EXTRA_CONTEXT_HEADER = "ADDITIONAL CONTEXT (USE ONLY THIS AND THE CONTEXT ABOVE):"
+
+# Returned without calling Gemini when no chunk clears settings.relevance_floor
+NOT_IN_SOURCES_ANSWER = (
+    "* I couldn't find information about this in my medical sources, so I can't answer it reliably.\n"
+    "* I can answer educational questions about Type 2 Diabetes, such as symptoms, risk factors, diagnosis and daily management.\n\n"
+    + CLOSING_LINES
+)
+
+DISCLAIMER = "⚠️ The information provided is for general educational purposes only. It is NOT a medical diagnosis, , and it is NOT a substitute for professional medical advice. For concerns about your specific health situation, please consult a licensed healthcare professional."
+
+GENERATION_KWARGS = dict(
+    temperature=0.6,
+    top_p=0.95,
+    max_output_tokens=1500,
+)
 
 
 # ------------------------------------------------------------
 # Helper: Format retrieved RAG chunks
 # ------------------------------------------------------------
-def format_context(chunks: List[Dict]) -> str:
+def format_context(chunks: List[Hit]) -> str:
     lines = []
     for c in chunks:
-        src = c["source"]
+        src = c.source
 
         # Human readable
         if src.startswith("mayo"):
@@ -38,86 +110,313 @@ def format_context(chunks: List[Dict]) -> str:
         else:
             src_name = src
 
-        lines.append(f"[Source: {src_name} | {c['section']} | {c['subsection']}]")
-        lines.append(c["text"])
+        lines.append(f"[Source: {src_name} | {c.section} | {c.subsection}]")
+        lines.append(c.text)
         lines.append("")
     return "\n".join(lines).strip()
 
 
+# ------------------------------------------------------------
+# Helper: Build the per-turn prompt
+# ------------------------------------------------------------
+def build_prompt(question: str, context: str, history: str = "", context_header: str = CONTEXT_HEADER) -> str:
+    parts = []
+    if history:
+        parts += ["CONVERSATION SO FAR:", history, ""]
+
+    parts += ["USER QUESTION:", question, ""]
+
+    if context:
+        parts += [context_header, context]
+
+    return "\n".join(parts).strip()
+
+
+# ------------------------------------------------------------
+# Gemini calls + shared context cache
+# ------------------------------------------------------------
+context_cache = ContextCacheRegistry(
+    client=gemini_client,
+    model=settings.llm_model,
+    system_instruction=SYSTEM_INSTRUCTION,
+    format_context=format_context,
+    context_header=CONTEXT_HEADER,
+    ttl_seconds=settings.gemini_cache_ttl_seconds,
+    max_handles=settings.context_cache_max_handles,
+    min_uses=settings.context_cache_min_uses,
+    min_tokens=settings.context_cache_min_tokens,
+)
+
+
+def call_gemini(prompt: str, handle: Optional[CacheHandle] = None, on_text: Optional[Callable] = None) -> tuple:
+    """
+    With a cache handle, the system instruction (and any cached context)
+    come from the cached content and only the prompt is sent.
+
+    With on_text, the answer is streamed and on_text(delta) is called
+    for every chunk as it arrives.
+
+    Returns: (answer text, usage dict)
+    """
+    if handle is not None:
+        config = GenerateContentConfig(cached_content=handle.name, **GENERATION_KWARGS)
+    else:
+        config = GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, **GENERATION_KWARGS)
+
+    if on_text is None:
+        response = gemini_client.models.generate_content(
+            model=settings.llm_model,
+            contents=prompt,
+            config=config,
+        )
+        text, usage_metadata = response.text, getattr(response, "usage_metadata", None)
+    else:
+        parts, usage_metadata = [], None
+        for chunk in gemini_client.models.generate_content_stream(
+            model=settings.llm_model,
+            contents=prompt,
+            config=config,
+        ):
+            if chunk.text:
+                parts.append(chunk.text)
+                on_text(chunk.text)
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+        text = "".join(parts)
+
+    usage = context_cache.record_usage(usage_metadata)
+    print(f"[INFO] Gemini input tokens: {usage['input_tokens']} ({usage['cached_input_tokens']} from cache)")
+
+    return text.strip(), usage
+
+
+def answer_with_cache(
+    question: str,
+    chunks: List[Hit],
+    history: str,
+    handle: Optional[CacheHandle],
+    on_text: Optional[Callable] = None,
+) -> tuple:
+    """
+    Try the cached context handle first, then the cached system
+    instruction, then a fully inline prompt. A handle Gemini refuses
+    (expired / deleted) is invalidated and the next option is used.
+    Once streamed text has reached on_text, failures are not retried.
+
+    Returns: (answer text, usage dict)
+    """
+    streamed = []
+
+    def relay(delta: str):
+        streamed.append(delta)
+        on_text(delta)
+
+    stream = relay if on_text is not None else None
+
+    if handle is not None:
+        new_chunks = [c for c in chunks if c.chunk_id not in handle.chunk_ids]
+        prompt = build_prompt(question, format_context(new_chunks), history, EXTRA_CONTEXT_HEADER)
+        try:
+            return call_gemini(prompt, handle, stream)
+        except Exception as e:
+            if streamed:
+                raise
+            print("[WARN] Cached Gemini call failed, retrying without context cache:", e)
+            context_cache.invalidate(handle)
+
+    prompt = build_prompt(question, format_context(chunks), history)
+
+    system_handle = context_cache.acquire_system()
+    try:
+        if system_handle is not None:
+            try:
+                return call_gemini(prompt, system_handle, stream)
+            except Exception as e:
+                if streamed:
+                    raise
+                print("[WARN] Cached Gemini call failed, retrying inline:", e)
+                context_cache.invalidate(system_handle)
+    finally:
+        context_cache.release(system_handle)
+
+    return call_gemini(prompt, on_text=stream)
+
+
+def is_relevant(chunks: List[Hit]) -> bool:
+    """True if any chunk clears the calibrated relevance floor."""
+    floor = settings.relevance_floor
+    if floor is None or not chunks:
+        return floor is None
+    return any(c.score is None or c.score >= floor for c in chunks)
+
+
+def ask_gemini(question: str, chunks: List[Hit], session: Session, on_text: Optional[Callable] = None) -> tuple:
+    """
+    Pick the context to serve from cache: the conversation's first
+    context on follow-ups, else this exact chunk set once it has been
+    retrieved often enough. Then call Gemini.
+
+    Returns: (answer text, usage dict)
+    """
+    if session.turns:
+        if not session.stable_chunk_ids:
+            session.stable_chunk_ids = tuple(session.chunk_ids)
+        handle = context_cache.acquire_context(retrieval.hits_for_chunk_ids(session.stable_chunk_ids), force=True)
+    else:
+        handle = context_cache.acquire_context(chunks)
+
+    try:
+        return answer_with_cache(question, chunks, session.history_text(), handle, on_text)
+    finally:
+        context_cache.release(handle)
+
+
+answer_stats = {
+    "llm_answers": 0,
+    "out_of_scope_answers": 0,
+    "coalesced_answers": 0,
+    "extractive_answers": 0,
+    "extractive_errors": 0,
+}
+NO_LLM_USAGE = {"input_tokens": 0, "cached_input_tokens": 0, "uncached_input_tokens": 0}
+
+# Identical first-turn questions in flight at the same time share one
+# retrieval + Gemini call (see generate_answer)
+answer_flights = SingleFlight("Chat answer", max_wait=settings.coalesce_max_wait_seconds)
+
+
+def coalesce_key(question: str, disease: str, k: int, mmr_lambda) -> tuple:
+    """Case / whitespace / trailing punctuation do not change the answer."""
+    normalized = " ".join(question.lower().split()).rstrip("?!. ")
+    return (normalized, disease, k, mmr_lambda, retrieval.index_version())
+
+
+def answer_turn(question: str, k: int, mmr_lambda, session: Session, on_text: Optional[Callable] = None) -> tuple:
+    """
+    Retrieve and answer one turn (without recording it in the session).
+
+    Returns: (answer text, usage dict, chunks, query vector)
+    """
+    # 1. Retrieve relevant context (follow-ups: blended query vector)
+    print(f"[INFO] Retrieving for query: {question}")
+    query_vec = retrieval.embed_query(question)
+    if session.query_vec is not None:
+        query_vec = blend_followup(query_vec, session.query_vec, settings.followup_weight)
+
+    chunks = retrieval.search_chunks(query_vec, k, mmr_lambda=mmr_lambda)
+
+    # 2. Nothing relevant in the sources: skip the LLM call
+    if not is_relevant(chunks):
+        best = max((c.score for c in chunks if c.score is not None), default=None)
+        print(f"[INFO] No chunk above relevance floor {settings.relevance_floor} (best {best}); not calling Gemini")
+        answer_stats["out_of_scope_answers"] += 1
+        if on_text is not None:
+            on_text(NOT_IN_SOURCES_ANSWER)
+        return NOT_IN_SOURCES_ANSWER, dict(NO_LLM_USAGE), [], query_vec
+
+    # 3. One structured chunk clearly answers it: extract, no LLM call.
+    #    Only an optimization: if it fails, Gemini answers as usual.
+    try:
+        answer, detail = extractive_answer(query_vec, chunks, retrieval.embed_texts)
+    except Exception as e:
+        print("[WARN] Extractive answer failed, calling Gemini instead:", e)
+        answer_stats["extractive_errors"] += 1
+        answer = None
+    if answer is not None:
+        print(f"[INFO] Extractive answer from {detail['chunk_id']} (sentence cosine {detail['best_cosine']}); not calling Gemini")
+        answer_stats["extractive_answers"] += 1
+        if on_text is not None:
+            on_text(answer)
+        return answer, dict(NO_LLM_USAGE), chunks[:1], query_vec
+
+    # 4. Call Google Gemini Flash Model
+    llm_answer, usage = ask_gemini(question, chunks, session, on_text)
+    answer_stats["llm_answers"] += 1
+    return llm_answer, usage, chunks, query_vec
+
+
+sessions = SessionStore(
+    ttl_seconds=settings.session_ttl_seconds,
+    max_bytes=settings.session_max_bytes,
+    max_turns=settings.session_max_turns,
+)
+
+
 # ------------------------------------------------------------
 # Main RAG Answer Generator (Gemini Flash)
 # ------------------------------------------------------------
-def generate_answer(question: str, disease="Type 2 Diabetes", k: int = 5) -> Dict:
+def generate_answer(
+    question: str,
+    disease="Type 2 Diabetes",
+    k: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    session: Optional[Session] = None,
+    on_text: Optional[Callable] = None,
+) -> Dict:
     """
     Uses FAISS retrieval + Gemini Flash model for grounded answers.
-    """
 
-    # 1. Retrieve relevant context
-    chunks = retrieve_chunks(question, k)
-    context = format_context(chunks)
+    k, mmr_lambda default to settings.retrieval_k / settings.mmr_lambda.
+    mmr_lambda is the MMR trade-off (1.0 = pure relevance) so the k
+    context chunks are not near-duplicates of each other.
 
-    # --------------------------------------------------------
-    # 2. Build RAG Prompt
-    # --------------------------------------------------------
-    prompt = dedent(f"""
-    You are TrustMedAI, a safe and helpful medical education assistant.
+    The static instructions always come from a cached system
+    instruction when Gemini accepts one. Frequently retrieved chunk
+    sets get their own cached context. With a session, follow-ups are
+    retrieved with the previous query vector blended in, prior turns
+    are added to the prompt, and the conversation's first context stays
+    cached so only new chunks are sent.
 
-    USER QUESTION:
-    {question}
+    When no retrieved chunk clears settings.relevance_floor (calibrated
+    score), the canned NOT_IN_SOURCES_ANSWER is returned without
+    calling Gemini. When the top chunk is a high-confidence structured
+    chunk, its most relevant sentences are returned instead (see
+    extractive.py).
 
-    CONTEXT (USE ONLY THIS INFORMATION):
-    {context}
+    on_text(delta) receives the answer as Gemini streams it (used by
+    the speech pipeline).
 
-    GUIDELINES:
-    - Base your answer ONLY on the provided context.
-    - DO NOT invent facts or add medical advice.
-    - DO NOT diagnose or suggest treatments/medications.
-    - Write clearly and cite sources (“According to Mayo Clinic…”).
-    - Keep tone factual and calm.
+    Concurrent identical first-turn questions (same normalized text,
+    disease and index version) share one retrieval + Gemini call.
 
-    RESPONSE STYLE:
-    - Keep the answer **short, clear, and easy to read**.
-    - Use **2–5 bullet points**, not long paragraphs.
-    - Do NOT write citations inside the explanation.
-    - Use simple language (8th–10th grade level).
-    - Do NOT diagnose or give treatment advice.
-    - NEVER invent facts not present in the context.
+    The result names the index_version the context was retrieved from.
+    """
 
-    FORMAT EXACTLY LIKE THIS:
+    k = k or settings.retrieval_k
+    if mmr_lambda is None:
+        mmr_lambda = settings.mmr_lambda
 
-    <Answer in short bullet points>
+    if session is None:
+        session = Session("", max_turns=0)  # throwaway, nothing is kept
 
-    Do you have any more questions? Or Would you like me to help you schedule an appointment with a doctor or clinic?
-    -------------------------------------
-    """).strip()
+    with session.lock:
+        # First turns without streaming do not depend on the session, so
+        # identical concurrent questions are answered once; followers
+        # report no token usage of their own
+        if settings.coalesce_requests and on_text is None and not session.turns:
+            key = coalesce_key(question, disease, k, mmr_lambda)
+            (llm_answer, usage, chunks, query_vec), shared = answer_flights.do(
+                key, lambda: answer_turn(question, k, mmr_lambda, session)
+            )
+            if shared:
+                usage = dict(NO_LLM_USAGE)
+                answer_stats["coalesced_answers"] += 1
+        else:
+            llm_answer, usage, chunks, query_vec = answer_turn(question, k, mmr_lambda, session, on_text)
 
-    # --------------------------------------------------------
-    # 3. Call Google Gemini Flash Model
-    # --------------------------------------------------------
-    response = gemini_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config=GenerateContentConfig(
-            temperature=0.6,
-            top_p=0.95,
-            max_output_tokens=1500,
-        ),
-    )
+        index_version = chunks[0].index_version if chunks else None
+        session.add_turn(question, llm_answer, query_vec, [c.chunk_id for c in chunks])
 
-    llm_answer = response.text.strip()
+    if session.id:
+        sessions.update(session)
 
     # --------------------------------------------------------
-    # 4. Return answer + retrieval metadata
+    # Return answer + retrieval metadata
     # --------------------------------------------------------
     return {
         "answer": llm_answer,
-        "sources": [
-            {
-                "source": c["source"],
-                "section": c["section"],
-                "subsection": c["subsection"],
-            }
-            for c in chunks
-        ],
-        "disclaimer": "⚠️ The information provided is for general educational purposes only. It is NOT a medical diagnosis, , and it is NOT a substitute for professional medical advice. For concerns about your specific health situation, please consult a licensed healthcare professional."
+        "sources": [c.source_dict() for c in chunks],
+        "disclaimer": DISCLAIMER,
+        "session_id": session.id or None,
+        "usage": usage,
+        "index_version": index_version,
     }
@@ -0,0 +1,104 @@
+"""
+Relevance calibration: raw cosine similarity -> P(relevant).
+
+Raw MiniLM cosine values depend on the query (short questions score
+lower across the board), so a fixed cutoff on them is unreliable. At
+index build time we fit a one-dimensional logistic model on labelled
+pairs taken from the corpus itself:
+
+  positives   a chunk's own section / subsection title (forum chunks:
+              the question) against that chunk
+  negatives   the same titles against chunks of other sections
+
+and store its two parameters next to the index. The retriever reports
+calibrated scores in [0, 1], which is what settings.relevance_floor is
+compared against.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Used when no calibration file exists (e.g. an index built before
+# calibration): centred on a typical MiniLM "related" cosine
+DEFAULT_CALIBRATION = {"a": 12.0, "b": -4.2}
+
+
+def calibration_queries(chunks: list) -> list:
+    """One title-style query per chunk."""
+    queries = []
+    for c in chunks:
+        if c.get("subsection"):
+            queries.append(f"{c['section']}: {c['subsection']}")
+        else:
+            queries.append(c["section"])
+    return queries
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, iters: int = 50, l2: float = 1e-3) -> dict:
+    """Newton's method for p = sigmoid(a * x + b) (slightly regularized)."""
+    X = np.stack([x, np.ones_like(x)], axis=1).astype(np.float64)
+    w = np.zeros(2)
+
+    for _ in range(iters):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        grad = X.T @ (p - y) + l2 * w
+        hess = (X * (p * (1 - p))[:, None]).T @ X + l2 * np.eye(2)
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.abs(step).max() < 1e-8:
+            break
+
+    return {"a": float(w[0]), "b": float(w[1])}
+
+
+def fit_calibration(query_vecs: np.ndarray, chunk_vecs: np.ndarray, section_keys: list, negatives: int = 5, seed: int = 0) -> dict:
+    """
+    query_vecs[i] is the title query of chunk i; all vectors are
+    unit-normalized. Returns the calibration dict stored with the index.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(chunk_vecs)
+    keys = np.asarray(section_keys)
+
+    pos = np.einsum("ij,ij->i", query_vecs, chunk_vecs)
+
+    neg = []
+    for i in range(n):
+        others = np.flatnonzero(keys != keys[i])
+        if others.size:
+            picks = rng.choice(others, size=min(negatives, others.size), replace=False)
+            neg.append(chunk_vecs[picks] @ query_vecs[i])
+    neg = np.concatenate(neg) if neg else np.empty(0)
+
+    x = np.concatenate([pos, neg])
+    y = np.concatenate([np.ones(len(pos)), np.zeros(len(neg))])
+
+    params = fit_logistic(x, y)
+    params.update({
+        "positives": int(len(pos)),
+        "negatives": int(len(neg)),
+        "positive_cosine_median": float(np.median(pos)) if len(pos) else None,
+        "negative_cosine_median": float(np.median(neg)) if len(neg) else None,
+    })
+    return params
+
+
+def calibrate(cosine, params: dict) -> np.ndarray:
+    cosine = np.asarray(cosine, dtype=np.float64)
+    return 1.0 / (1.0 + np.exp(-(params["a"] * cosine + params["b"])))
+
+
+def save_calibration(params: dict, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+
+def load_calibration(path: Path) -> dict:
+    path = Path(path)
+    if not path.exists():
+        print(f"[WARN] No relevance calibration at {path}; using defaults (rebuild the index to fit one)")
+        return dict(DEFAULT_CALIBRATION)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
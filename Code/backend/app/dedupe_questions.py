@@ -1,13 +1,10 @@
+import argparse
 import json
 from pathlib import Path
 import re
 from difflib import SequenceMatcher
 
-RAW_FILE = Path("/Users/kaushikrajesh/Desktop/SEM3/SWM/TrustMedAI/Data/raw/forum_raw.json")
-OUT_DIR = Path("/Users/kaushikrajesh/Desktop/SEM3/SWM/TrustMedAI/Data/processed")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-
-OUT_FILE = OUT_DIR / "forums_t2dm.json"
+from .settings import settings
 
 # ------------------------------------------------------------
 # Helper functions
@@ -21,84 +18,111 @@ def clean_text(text: str) -> str:
     return text
 
 
-def are_similar(q1: str, q2: str, threshold=0.80) -> bool:
+def are_similar(q1: str, q2: str, threshold=settings.dedupe_threshold) -> bool:
     """Simple question duplicate detection using fuzzy matching."""
     ratio = SequenceMatcher(None, q1.lower(), q2.lower()).ratio()
     return ratio >= threshold
 
 
 # ------------------------------------------------------------
-# Load data
+# Pipeline steps
 # ------------------------------------------------------------
 
-with open(RAW_FILE, "r", encoding="utf-8") as f:
-    raw = json.load(f)
+def load_raw_threads(raw_file: Path) -> list:
+    with open(raw_file, "r", encoding="utf-8") as f:
+        raw = json.load(f)
 
-print(f"[INFO] Loaded {len(raw)} raw forum threads.")
+    print(f"[INFO] Loaded {len(raw)} raw forum threads.")
+    return raw
 
-questions = [clean_text(item["question"]) for item in raw]
-answers = [[clean_text(a) for a in item["answers"]] for item in raw]
-urls = [item["url"] for item in raw]
 
-# ------------------------------------------------------------
-# Deduplicate questions
-# ------------------------------------------------------------
+def cluster_questions(questions: list, threshold: float = settings.dedupe_threshold) -> list:
+    """Greedy clustering: each question joins the first earlier cluster it matches."""
+    clusters = []
+    visited = set()
 
-clusters = []
-visited = set()
+    for i, q in enumerate(questions):
+        if i in visited:
+            continue
 
-for i, q in enumerate(questions):
-    if i in visited:
-        continue
+        cluster = [i]
+        visited.add(i)
 
-    cluster = [i]
-    visited.add(i)
+        for j in range(i + 1, len(questions)):
+            if j in visited:
+                continue
 
-    for j in range(i + 1, len(questions)):
-        if j in visited:
-            continue
+            if are_similar(q, questions[j], threshold):
+                cluster.append(j)
+                visited.add(j)
 
-        if are_similar(q, questions[j]):
-            cluster.append(j)
-            visited.add(j)
+        clusters.append(cluster)
 
-    clusters.append(cluster)
+    print(f"[INFO] Found {len(clusters)} unique question groups after dedupe.")
+    return clusters
 
-print(f"[INFO] Found {len(clusters)} unique question groups after dedupe.")
 
-# ------------------------------------------------------------
-# Build output dataset
-# ------------------------------------------------------------
+def dedupe_threads(raw: list, threshold: float = settings.dedupe_threshold) -> list:
+    """Merge near-duplicate forum threads into one entry per question."""
+    questions = [clean_text(item["question"]) for item in raw]
+    answers = [[clean_text(a) for a in item["answers"]] for item in raw]
+    urls = [item["url"] for item in raw]
 
-output = []
+    output = []
 
-for cluster in clusters:
-    base_idx = cluster[0]
-    section_heading = questions[base_idx]
+    for cluster in cluster_questions(questions, threshold):
+        base_idx = cluster[0]
+        section_heading = questions[base_idx]
 
-    merged_answers = []
-    merged_urls = []
+        merged_answers = []
+        merged_urls = []
 
-    for idx in cluster:
-        merged_answers.extend(answers[idx])
-        merged_urls.append(urls[idx])
+        for idx in cluster:
+            merged_answers.extend(answers[idx])
+            merged_urls.append(urls[idx])
 
-    cleaned_merged_answers = [clean_text(a) for a in merged_answers if a]
+        cleaned_merged_answers = [clean_text(a) for a in merged_answers if a]
 
-    entry = {
-        "section": section_heading,
-        "answer": cleaned_merged_answers,
-        "source_urls": list(set(merged_urls)),
-        "num_threads_clustered": len(cluster)
-    }
+        entry = {
+            "section": section_heading,
+            "answer": cleaned_merged_answers,
+            "source_urls": list(set(merged_urls)),
+            "num_threads_clustered": len(cluster)
+        }
 
-    output.append(entry)
+        output.append(entry)
 
-# ------------------------------------------------------------
-# Save
-# ------------------------------------------------------------
+    return output
+
+
+def save_dataset(output: list, out_file: Path):
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+
+    print("[SUCCESS] Processed dataset saved at:", out_file)
+
+
+def dedupe_forum(raw_file: Path = None, out_file: Path = None, threshold: float = None):
+    """Load raw forum threads, dedupe them and save the processed dataset."""
+    raw_file = Path(raw_file or settings.forum_raw_path)
+    out_file = Path(out_file or settings.forum_processed_path)
+    threshold = settings.dedupe_threshold if threshold is None else threshold
+
+    output = dedupe_threads(load_raw_threads(raw_file), threshold)
+    save_dataset(output, out_file)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedupe scraped forum questions")
+    parser.add_argument("--raw-file", type=Path, default=settings.forum_raw_path)
+    parser.add_argument("--out-file", type=Path, default=settings.forum_processed_path)
+    parser.add_argument("--threshold", type=float, default=settings.dedupe_threshold)
+    args = parser.parse_args()
+
+    dedupe_forum(args.raw_file, args.out_file, args.threshold)
 
-with open(OUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(output, f, indent=2, ensure_ascii=False)
 
-print("[SUCCESS] Processed dataset saved at:", OUT_FILE)
+if __name__ == "__main__":
+    main()
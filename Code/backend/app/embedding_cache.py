@@ -0,0 +1,232 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+
+# ============================================================
+# Query normalization
+# ============================================================
+
+def normalize_query(text: str, lowercase: bool = False) -> str:
+    """
+    Cache key for a query. Collapsing whitespace does not change any
+    model's output; lower-casing only keeps it for uncased models
+    (all-MiniLM-L6-v2 is one), so callers pass lowercase from the model.
+    """
+    key = re.sub(r"\s+", " ", text).strip()
+    return key.lower() if lowercase else key
+
+
+def cache_namespace(model_name: str, dim: int) -> str:
+    """Disk tier subdirectory: vectors of another model or size are never served."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", f"{model_name}-{dim}d")
+
+
+# ============================================================
+# Bounded LRU cache: normalized query -> float32 vector
+# ============================================================
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings, capped in bytes.
+
+    If disk_dir is set, vectors are also written there as .npy files so
+    that other uvicorn workers on the same box can reuse them. The disk
+    tier is only consulted on a memory miss. Files live in a namespace
+    subdirectory (see cache_namespace), vectors of the wrong dimension
+    are ignored, and the directory is kept under disk_max_bytes by
+    deleting the least recently used files (reads refresh the mtime).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        namespace: str = "",
+        dim: Optional[int] = None,
+        lowercase: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.dim = dim
+        self.lowercase = lowercase
+        self.disk_dir = Path(disk_dir) / namespace if disk_dir else None
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._disk_bytes = 0  # this worker's estimate; re-measured when pruning
+        self.disk_evictions = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # --------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------
+    @staticmethod
+    def _entry_size(key: str, vec: np.ndarray) -> int:
+        return vec.nbytes + len(key)
+
+    def _disk_path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.disk_dir / f"{digest}.npy"
+
+    def _store(self, key: str, vec: np.ndarray):
+        # caller holds the lock
+        size = self._entry_size(key, vec)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._bytes -= self._entry_size(key, self._entries.pop(key))
+
+        self._entries[key] = vec
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            old_key, old_vec = self._entries.popitem(last=False)
+            self._bytes -= self._entry_size(old_key, old_vec)
+
+    def _read_disk(self, key: str) -> Optional[np.ndarray]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            vec = np.load(path)
+            os.utime(path)  # recently used: pruned last
+        except (OSError, ValueError):
+            return None
+        if self.dim is not None and vec.shape != (self.dim,):
+            return None
+        return vec
+
+    def _write_disk(self, key: str, vec: np.ndarray):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, vec)
+            size = tmp.stat().st_size
+            try:
+                replaced = path.stat().st_size  # e.g. written by another worker meanwhile
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)  # atomic for concurrent workers
+        except OSError as e:
+            print("[WARN] Could not write embedding cache file:", e)
+            return
+
+        with self._lock:
+            self._disk_bytes += size - replaced
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._prune_disk()
+
+    def _disk_files(self) -> list:
+        """(path, size, mtime) of the cache files (other workers may delete them meanwhile)."""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".npy"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.path, st.st_size, st.st_mtime))
+        return files
+
+    def _prune_disk(self):
+        """Delete least recently used files until the tier is at 90% of its budget."""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        evicted = 0
+
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass  # pruned by another worker
+            except OSError as e:
+                print("[WARN] Could not prune embedding cache file:", e)
+                continue
+            total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += evicted
+
+    # --------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = normalize_query(text, self.lowercase)
+
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vec
+
+        vec = self._read_disk(key)
+
+        with self._lock:
+            if vec is None:
+                self.misses += 1
+                return None
+
+            vec = np.asarray(vec, dtype=np.float32)
+            vec.setflags(write=False)
+            self._store(key, vec)
+            self.disk_hits += 1
+            return vec
+
+    def put(self, text: str, vec: np.ndarray) -> np.ndarray:
+        key = normalize_query(text, self.lowercase)
+        vec = np.array(vec, dtype=np.float32, copy=True)
+        vec.setflags(write=False)
+
+        with self._lock:
+            self._store(key, vec)
+
+        self._write_disk(key, vec)
+        return vec
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        vec = self.get(text)
+        if vec is None:
+            vec = self.put(text, compute(text))
+        return vec
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
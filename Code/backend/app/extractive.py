@@ -0,0 +1,158 @@
+"""
+LLM-free extractive answers for high-confidence lookups.
+
+Questions like "what is a normal A1C" are answered almost verbatim by a
+single structured chunk. When the top retrieved chunk
+
+  * comes from one of settings.extractive_sources,
+  * is structured (not a forum answer),
+  * has a calibrated score >= settings.extractive_min_score,
+
+its sentences are embedded (one uncached batch), scored
+against the query vector with one matrix product, and the best
+settings.extractive_max_sentences non-redundant ones are returned in
+document order as the usual bullet list. If no sentence reaches
+settings.extractive_min_sentence_cosine the gate fails and Gemini is
+called as before.
+
+Try the gate on a question without starting the API:
+
+  python -m app.extractive "what is a normal A1C?"
+"""
+
+import re
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .hits import Hit
+from .settings import settings
+
+# Same closing lines as Gemini answers (see SYSTEM_INSTRUCTION)
+CLOSING_LINES = (
+    "Do you have any more questions? Or Would you like me to help you schedule an appointment with a doctor or clinic?\n"
+    "-------------------------------------"
+)
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_BULLET = re.compile(r"^\s*[-*•]\s*")
+
+# Near-duplicate sentences (cosine above this) are not both used
+REDUNDANCY_COSINE = 0.9
+
+
+def split_sentences(text: str, min_words: int = 4) -> List[str]:
+    """
+    Sentences of a chunk. List items ("- Blurry vision") are kept whole
+    (navigation crumbs like "- Home" and question headings are dropped);
+    lead-ins ending in ":" are skipped since they make no sense without
+    their list.
+    """
+    sentences = []
+    for line in text.splitlines():
+        if _BULLET.match(line):
+            item = _BULLET.sub("", line).strip()
+            if len(item.split()) >= 2 and not item.endswith("?"):
+                sentences.append(item)
+            continue
+
+        for sentence in _SENTENCE.split(line.strip()):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= min_words and not sentence.endswith(":"):
+                sentences.append(sentence)
+    return sentences
+
+
+def eligible(chunks: List[Hit]) -> Optional[str]:
+    """None if the top chunk passes the gate, else why not."""
+    if settings.extractive_min_score is None:
+        return "disabled"
+    if not chunks:
+        return "no chunks"
+
+    top = chunks[0]
+    sources = {s.strip() for s in settings.extractive_sources.split(",") if s.strip()}
+    if top.source not in sources:
+        return f"source {top.source} not extractive"
+    if top.source_type != "structured":
+        return "top chunk not structured"
+    if top.score is None or top.score < settings.extractive_min_score:
+        return f"score {top.score} below {settings.extractive_min_score}"
+    return None
+
+
+def select_sentences(query_vec, sentence_vecs, max_sentences: int) -> tuple:
+    """
+    Best sentences by cosine to the query, skipping near-duplicates of
+    already chosen ones.
+
+    Returns: (positions in document order, cosine of each sentence)
+    """
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    q = q / (np.linalg.norm(q) + 1e-12)
+    s = np.asarray(sentence_vecs, dtype=np.float32)
+    s = s / (np.linalg.norm(s, axis=1, keepdims=True) + 1e-12)
+
+    cosine = s @ q
+    pairwise = s @ s.T
+
+    chosen = []
+    for i in np.argsort(-cosine, kind="stable"):
+        if len(chosen) == max_sentences:
+            break
+        if chosen and pairwise[i, chosen].max() > REDUNDANCY_COSINE:
+            continue
+        chosen.append(int(i))
+
+    return sorted(chosen), cosine
+
+
+def format_answer(sentences: List[str]) -> str:
+    bullets = "\n".join(f"* {s}" for s in sentences)
+    return f"{bullets}\n\n{CLOSING_LINES}"
+
+
+def extractive_answer(query_vec, chunks: List[Hit], embed: Callable) -> tuple:
+    """
+    embed(list of str) -> (n, dim) array, e.g. retrieval.embed_texts.
+
+    Returns: (answer text or None, detail dict for logging)
+    """
+    reason = eligible(chunks)
+    if reason is not None:
+        return None, {"reason": reason}
+
+    sentences = split_sentences(chunks[0].text)
+    if not sentences:
+        return None, {"reason": "no sentences"}
+
+    chosen, cosine = select_sentences(query_vec, embed(sentences), settings.extractive_max_sentences)
+    best = float(cosine.max())
+    if best < settings.extractive_min_sentence_cosine:
+        return None, {"reason": f"best sentence cosine {best:.2f} below {settings.extractive_min_sentence_cosine}"}
+
+    answer = format_answer([sentences[i] for i in chosen])
+    return answer, {"reason": "extracted", "chunk_id": chunks[0].chunk_id, "best_cosine": round(best, 3)}
+
+
+def main():
+    import argparse
+
+    from . import retriever
+
+    parser = argparse.ArgumentParser(description="Try the extractive answer gate")
+    parser.add_argument("questions", nargs="+")
+    args = parser.parse_args()
+
+    for question in args.questions:
+        query_vec = retriever.embed_query(question)
+        chunks = retriever.search_chunks(query_vec, settings.retrieval_k, mmr_lambda=settings.mmr_lambda)
+        answer, detail = extractive_answer(query_vec, chunks, retriever.embed_texts)
+        top = f"{chunks[0].chunk_id} (score {chunks[0].score:.2f})" if chunks else "-"
+        print(f"\n{question}\n  top: {top}\n  {detail}")
+        if answer:
+            print(answer)
+
+
+if __name__ == "__main__":
+    main()
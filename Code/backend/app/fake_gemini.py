@@ -0,0 +1,170 @@
+"""
+Offline stand-in for the google-genai client.
+
+Implements the small part of the API the backend uses
+(models.generate_content / generate_content_stream,
+caches.create/get/delete) with Gemini-like
+behaviour: caches below a minimum token count are rejected, caches
+expire after their TTL, and responses carry usage_metadata with prompt
+and cached-content token counts. Select it with TRUSTMED_LLM_BACKEND=fake.
+
+For load tests, latency (a sampler from fake_upstreams.parse_latency)
+and error_rate make it behave like a slow / flaky upstream.
+"""
+
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+
+class FakeGeminiError(Exception):
+    pass
+
+
+FAKE_ANSWER = (
+    "* This is an offline answer generated without calling Gemini.\n"
+    "* It only exists so the rest of the pipeline can be exercised.\n\n"
+    "Do you have any more questions? Or Would you like me to help you schedule an appointment with a doctor or clinic?\n"
+    "-------------------------------------"
+)
+
+
+def count_tokens(value) -> int:
+    """Rough token count (~4 characters per token) of str / Content / list."""
+    return len(text_of(value)) // 4
+
+
+def text_of(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return "\n".join(text_of(v) for v in value)
+    parts = getattr(value, "parts", None)
+    if parts is not None:
+        return "\n".join(p.text or "" for p in parts)
+    return str(getattr(value, "text", "") or "")
+
+
+def _ttl_seconds(ttl) -> float:
+    if not ttl:
+        return 3600.0
+    return float(str(ttl).rstrip("s"))
+
+
+class _FakeCaches:
+    def __init__(self, client):
+        self._client = client
+        self._items = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.deleted = 0
+
+    def create(self, model: str, config):
+        self._client.wait()
+        tokens = count_tokens(config.system_instruction) + count_tokens(config.contents)
+        if tokens < self._client.min_cache_tokens:
+            raise FakeGeminiError(
+                f"400 INVALID_ARGUMENT: cached content has {tokens} tokens, "
+                f"minimum is {self._client.min_cache_tokens}"
+            )
+
+        with self._lock:
+            name = f"cachedContents/fake-{next(self._ids)}"
+            item = SimpleNamespace(
+                name=name,
+                model=model,
+                display_name=config.display_name,
+                expire_at=time.time() + _ttl_seconds(config.ttl),
+                usage_metadata=SimpleNamespace(total_token_count=tokens),
+            )
+            self._items[name] = item
+            self.created += 1
+            return item
+
+    def get(self, name: str):
+        with self._lock:
+            item = self._items.get(name)
+            if item is None or item.expire_at < time.time():
+                self._items.pop(name, None)
+                raise FakeGeminiError(f"404 NOT_FOUND: {name}")
+            return item
+
+    def delete(self, name: str):
+        with self._lock:
+            if self._items.pop(name, None) is None:
+                raise FakeGeminiError(f"404 NOT_FOUND: {name}")
+            self.deleted += 1
+
+    def live(self) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for item in self._items.values() if item.expire_at >= now)
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+        self.calls = 0
+
+    def _check(self):
+        if random.random() < self._client.error_rate:
+            raise FakeGeminiError("503 UNAVAILABLE: fake upstream overloaded")
+
+    def _usage(self, contents, config):
+        cached_tokens = 0
+        system_tokens = 0
+
+        if config is not None and config.cached_content:
+            cached_tokens = self._client.caches.get(config.cached_content).usage_metadata.total_token_count
+        elif config is not None:
+            system_tokens = count_tokens(config.system_instruction)
+
+        self.calls += 1
+        return SimpleNamespace(
+            prompt_token_count=count_tokens(contents) + system_tokens + cached_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=count_tokens(FAKE_ANSWER),
+        )
+
+    def generate_content(self, model: str, contents, config=None):
+        self._client.wait()
+        self._check()
+        return SimpleNamespace(text=FAKE_ANSWER, usage_metadata=self._usage(contents, config))
+
+    def generate_content_stream(self, model: str, contents, config=None):
+        """Yields FAKE_ANSWER line by line; the latency is spread over the chunks."""
+        self._check()
+        usage = self._usage(contents, config)
+
+        pieces = FAKE_ANSWER.splitlines(keepends=True)
+        total = self._client.latency() if self._client.latency is not None else 0.0
+        time.sleep(total * 0.3)  # time to first token
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            yield SimpleNamespace(text=piece, usage_metadata=usage if last else None)
+            time.sleep(total * 0.7 / len(pieces))
+
+
+class FakeGeminiClient:
+    def __init__(
+        self,
+        min_cache_tokens: int = 1024,
+        latency: Optional[Callable[[], float]] = None,
+        error_rate: float = 0.0,
+    ):
+        self.min_cache_tokens = min_cache_tokens
+        self.latency = latency
+        self.error_rate = error_rate
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+
+    def wait(self):
+        if self.latency is not None:
+            time.sleep(self.latency())
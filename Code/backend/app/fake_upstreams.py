@@ -0,0 +1,126 @@
+"""
+Local stand-ins for the paid upstreams, used by the load-test harness.
+
+- parse_latency turns a spec string into a latency sampler, e.g.
+    "fixed:200"          always 200 ms
+    "uniform:100-400"    uniform between 100 and 400 ms
+    "normal:800,200"     mean 800 ms, std 200 ms (clipped at 0)
+    "lognormal:800,0.5"  median 800 ms, sigma 0.5 (long right tail)
+- the offline Gemini client (fake_gemini.FakeGeminiClient) takes such a
+  sampler via TRUSTMED_FAKE_LLM_LATENCY
+- serve_fake_elevenlabs runs an HTTP server that answers the
+  ElevenLabs text-to-speech route with fake MP3 bytes; point the
+  backend at it with TRUSTMED_ELEVENLABS_BASE_URL
+
+  python -m app.fake_upstreams elevenlabs --port 8765 --latency lognormal:600,0.4
+"""
+
+import argparse
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Returns a function that samples one latency in seconds."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    kind = kind.strip().lower()
+
+    if kind == "fixed":
+        value = float(args or 0) / 1000.0
+        return lambda: value
+
+    if kind == "uniform":
+        low, high = (float(x) / 1000.0 for x in args.split("-"))
+        return lambda: random.uniform(low, high)
+
+    if kind == "normal":
+        mean, std = (float(x) / 1000.0 for x in args.split(","))
+        return lambda: max(0.0, random.gauss(mean, std))
+
+    if kind == "lognormal":
+        median, sigma = (float(x) for x in args.split(","))
+        mu = math.log(median / 1000.0)
+        return lambda: random.lognormvariate(mu, sigma)
+
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+# ============================================================
+# Fake ElevenLabs
+# ============================================================
+
+# One silent MPEG-1 Layer III frame header + padding; the bytes only
+# need to look like audio to the backend and frontend.
+FAKE_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+def _make_handler(latency: Callable[[], float], error_rate: float):
+    class FakeElevenLabsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+
+            time.sleep(latency())
+
+            if not self.path.startswith("/v1/text-to-speech/"):
+                self.send_error(404)
+                return
+
+            if random.random() < error_rate:
+                self.send_response(503)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b'{"detail": "fake upstream overloaded"}')
+                return
+
+            # ~1 frame per 10 characters, like real speech length scaling
+            audio = FAKE_MP3_FRAME * max(1, len(body) // 10)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+
+        def log_message(self, *args):
+            pass  # keep load-test output readable
+
+    return FakeElevenLabsHandler
+
+
+def serve_fake_elevenlabs(port: int = 0, latency: str = "fixed:0", error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start the fake in a background thread. port=0 picks a free port;
+    the base URL is http://127.0.0.1:<server.server_port>.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(parse_latency(latency), error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-ins for paid upstream APIs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_tts = sub.add_parser("elevenlabs", help="run a fake ElevenLabs TTS server")
+    p_tts.add_argument("--port", type=int, default=8765)
+    p_tts.add_argument("--latency", default="lognormal:600,0.4")
+    p_tts.add_argument("--error-rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    server = serve_fake_elevenlabs(args.port, args.latency, args.error_rate)
+    print(f"[INFO] Fake ElevenLabs on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import json
 import time
 from pathlib import Path
@@ -12,14 +13,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
+from .settings import settings
+
 # ----------------------
 # Paths & constants
 # ----------------------
 
-RAW_DIR = Path("/Users/kaushikrajesh/Desktop/SEM3/SWM/TrustMedAI/Data/raw")
-RAW_DIR.mkdir(parents=True, exist_ok=True)
-
-OUTPUT_FILE = RAW_DIR / "forum_raw.json"
+OUTPUT_FILE = settings.forum_raw_path
 
 BASE_URL = "https://www.diabetesdaily.com"
 FORUM_BASE = "https://www.diabetesdaily.com/forum/forums/diabetes-news-studies.74/?order=view_count&direction=desc"
@@ -124,7 +124,10 @@ def scrape_thread(driver, thread_url: str):
 # Forum listing scraping
 # ----------------------
 
-def scrape_forum(max_threads=500):
+def scrape_forum(max_threads=None, output_file: Path = None):
+    max_threads = max_threads or settings.forum_max_threads
+    output_file = Path(output_file or OUTPUT_FILE)
+
     print("[INFO] Starting DiabetesDaily Selenium scrape...")
 
     driver = create_driver()
@@ -191,11 +194,22 @@ def scrape_forum(max_threads=500):
 
     print(f"[SUCCESS] Scraped {len(results)} threads.")
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
 
-    print("[SAVED] Raw forum data →", OUTPUT_FILE)
+    print("[SAVED] Raw forum data →", output_file)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape DiabetesDaily forum threads")
+    parser.add_argument("--max-threads", type=int, default=settings.forum_max_threads)
+    parser.add_argument("--output-file", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    scrape_forum(args.max_threads, args.output_file)
 
 
 if __name__ == "__main__":
-    scrape_forum(max_threads=200)  # adjust as you like
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+
+
+# ============================================================
+# Hit objects
+# ============================================================
+# Kept free of model / index state so processes that do not load the
+# retriever (API workers talking to the retrieval sidecar) can use them.
+
+HIT_FIELDS = ("text", "source", "source_type", "section", "subsection", "chunk_id")
+
+
+class Hit:
+    """
+    Lightweight retrieval result. Only turned into a dict at the API
+    boundary (see to_dict / source_dict).
+
+    distance is the cosine distance (1 - cosine similarity) to the
+    query; score is the calibrated relevance in [0, 1], comparable
+    across queries (None for hits not produced by a search).
+    index_version names the index version the hit was read from.
+    """
+
+    __slots__ = ("rank", "distance", "score", "index_version") + HIT_FIELDS
+
+    def __init__(self, rank, distance, text, source, source_type, section, subsection, chunk_id, score=None, index_version=None):
+        self.rank = rank
+        self.distance = distance
+        self.score = score
+        self.index_version = index_version
+        self.text = text
+        self.source = source
+        self.source_type = source_type
+        self.section = section
+        self.subsection = subsection
+        self.chunk_id = chunk_id
+
+    # Old callers index hits like dicts (h["source"])
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {
+            "rank": self.rank,
+            "text": self.text,
+            "source": self.source,
+            "section": self.section,
+            "subsection": self.subsection,
+            "chunk_id": self.chunk_id,
+            "distance": self.distance,
+            "score": self.score,
+            "index_version": self.index_version,
+        }
+
+    def source_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "section": self.section,
+            "subsection": self.subsection,
+        }
+
+
+# ============================================================
+# Follow-up query blending
+# ============================================================
+
+def blend_followup(query_vec, previous_vec, weight: float):
+    """
+    Rewrite a follow-up query ("what about the A1C part?") in embedding
+    space by mixing in the previous turn's query vector. Both vectors
+    are unit-normalized first so weight is a true mixing ratio.
+
+    Returns: float32 array of shape (1, dim)
+    """
+
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    p = np.asarray(previous_vec, dtype=np.float32).reshape(-1)
+
+    q_norm = np.linalg.norm(q) + 1e-12
+    p_norm = np.linalg.norm(p) + 1e-12
+
+    # Keep the magnitude of the current query (L2 indexes depend on it)
+    mixed = (1.0 - weight) * q / q_norm + weight * p / p_norm
+    mixed *= q_norm / (np.linalg.norm(mixed) + 1e-12)
+
+    return mixed.reshape(1, -1)
+
+
+# ============================================================
+# Maximal marginal relevance (diversity re-ranking)
+# ============================================================
+# Also here rather than in retriever so the sharded client can re-rank
+# candidates merged from several shards.
+
+def mmr_order(query_vec, cand_vecs, k: int, lambda_: float = 0.5):
+    """
+    Greedy MMR over candidate vectors. lambda_=1.0 is pure relevance,
+    lower values trade relevance for diversity.
+
+    All similarities are computed up front as one matrix product, so
+    each greedy step is a couple of vector ops (well under 1 ms for
+    100 candidates).
+
+    Returns: positions into cand_vecs, in selection order
+    """
+
+    n = len(cand_vecs)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    cand = np.array(cand_vecs, dtype=np.float32)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True) + 1e-12
+
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    q = q / (np.linalg.norm(q) + 1e-12)
+
+    relevance = cand @ q          # (n,)
+    pairwise = cand @ cand.T      # (n, n)
+
+    selected = [int(np.argmax(relevance))]
+    max_sim = pairwise[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    for _ in range(min(k, n) - 1):
+        scores = lambda_ * relevance - (1.0 - lambda_) * max_sim
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim, pairwise[best], out=max_sim)
+
+    return np.array(selected, dtype=np.int64)
+
+
+def default_fetch_k(k: int, max_distance=None, dedupe_sections: bool = False, mmr_lambda=None) -> int:
+    """FAISS candidates per query: over-fetch when hits may be filtered out or re-ranked."""
+    over_fetch = dedupe_sections or max_distance is not None or mmr_lambda is not None
+    return k * 4 if over_fetch else k
@@ -0,0 +1,140 @@
+"""
+Versioned vector store layout for blue/green index swaps.
+
+  <embed_dir>/versions/<version>/   index, vectors.npy, metadata.json, calibration.json
+  <embed_dir>/CURRENT               name of the live version
+
+Builds write a complete new version directory and only then replace
+CURRENT (atomic rename), so a reader never sees a half-written index.
+Running retrievers poll CURRENT and swap to the new version without a
+restart (see retriever.IndexWatcher). An embed_dir without CURRENT is
+the old flat layout and is served as version "legacy".
+
+  python -m app.index_versions list
+  python -m app.index_versions activate <version>     roll back / forward
+  python -m app.index_versions prune --keep 3
+"""
+
+import argparse
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+from .settings import settings
+
+LEGACY_VERSION = "legacy"
+
+
+def _embed_dir(embed_dir: Path = None) -> Path:
+    return Path(embed_dir or settings.embed_dir)
+
+
+def versions_root(embed_dir: Path = None) -> Path:
+    return _embed_dir(embed_dir) / "versions"
+
+
+def current_version(embed_dir: Path = None) -> str:
+    pointer = _embed_dir(embed_dir) / settings.index_pointer_file
+    if not pointer.exists():
+        return LEGACY_VERSION
+    return pointer.read_text(encoding="utf-8").strip()
+
+
+def version_dir(version: str, embed_dir: Path = None) -> Path:
+    if version == LEGACY_VERSION:
+        return _embed_dir(embed_dir)
+    return versions_root(embed_dir) / version
+
+
+def version_sort_key(version: str) -> tuple:
+    """
+    Build order of a version name: "<timestamp>-<n>" sorts by (timestamp, n),
+    so 20250101-120000-10 comes after 20250101-120000-2.
+    """
+    match = re.fullmatch(r"(.*?)-(\d+)", version)
+    if match and re.fullmatch(r"\d{8}-\d{6}", match.group(1)):
+        return match.group(1), int(match.group(2))
+    return version, 1
+
+
+def list_versions(embed_dir: Path = None) -> list:
+    """Complete version directories, oldest first (see version_sort_key)."""
+    root = versions_root(embed_dir)
+    if not root.exists():
+        return []
+    names = [p.name for p in root.iterdir() if (p / settings.index_file).exists()]
+    return sorted(names, key=version_sort_key)
+
+
+def new_version_dir(embed_dir: Path = None) -> tuple:
+    """-> (version, empty directory to build it in)"""
+    root = versions_root(embed_dir)
+    root.mkdir(parents=True, exist_ok=True)
+
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version, n = base, 1
+    while (root / version).exists():
+        n += 1
+        version = f"{base}-{n}"
+
+    path = root / version
+    path.mkdir()
+    return version, path
+
+
+def activate(version: str, embed_dir: Path = None):
+    """Point CURRENT at a built version (atomic for concurrent readers)."""
+    if version != LEGACY_VERSION and not (version_dir(version, embed_dir) / settings.index_file).exists():
+        raise FileNotFoundError(f"No index for version {version!r} in {versions_root(embed_dir)}")
+
+    pointer = _embed_dir(embed_dir) / settings.index_pointer_file
+    tmp = pointer.with_suffix(".tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, pointer)
+    print(f"[INFO] Active index version: {version}")
+
+
+def prune(keep: int = None, embed_dir: Path = None) -> list:
+    """
+    Delete all but the newest `keep` versions (never the current one).
+    Workers still draining an old version keep its files open, so
+    deleting them is safe on POSIX.
+    """
+    keep = settings.index_keep_versions if keep is None else keep
+    current = current_version(embed_dir)
+    old = [v for v in list_versions(embed_dir)[:-keep or None] if v != current] if keep else []
+
+    for version in old:
+        shutil.rmtree(version_dir(version, embed_dir), ignore_errors=True)
+        print(f"[INFO] Removed index version {version}")
+    return old
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned FAISS indexes")
+    parser.add_argument("--embed-dir", type=Path, default=settings.embed_dir)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list")
+    p_activate = sub.add_parser("activate")
+    p_activate.add_argument("version")
+    p_prune = sub.add_parser("prune")
+    p_prune.add_argument("--keep", type=int, default=settings.index_keep_versions)
+
+    args = parser.parse_args()
+    if args.command == "list":
+        current = current_version(args.embed_dir)
+        for version in list_versions(args.embed_dir):
+            print(f"{'*' if version == current else ' '} {version}")
+        if current == LEGACY_VERSION:
+            print(f"* {LEGACY_VERSION} (unversioned files in {args.embed_dir})")
+    elif args.command == "activate":
+        activate(args.version, args.embed_dir)
+    else:
+        prune(args.keep, args.embed_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+Load-testing harness for the /chat, /tts and /health API.
+
+By default it launches `uvicorn app.main:app` itself with the offline
+Gemini fake and a local fake ElevenLabs server (see fake_upstreams), so
+it needs no network access and no API keys:
+
+  python -m app.loadtest loadtest/faq_replay.json --workers 2
+  python -m app.loadtest loadtest/bursty.json --json out.json --max-p95-ms 3000
+
+Use --url to drive an already running instance instead (add
+--server-pid to also sample its RSS).
+
+Scenario files (JSON):
+  name, duration_s, max_in_flight, timeout_s
+  arrival:    {"type": "poisson", "rate": 5}
+              {"type": "bursty", "base_rate": 2, "burst_rate": 40,
+               "period_s": 20, "burst_s": 3}
+  mix:        {"/chat": 0.7, "/tts": 0.25, "/health": 0.05}
+  questions:  {"source": "faq", "zipf_s": 1.1} | {"source": "long_tail"}
+  followup_rate: share of /chat requests continuing an earlier session
+  upstreams:  {"llm_latency": "lognormal:1500,0.4", "llm_error_rate": 0.0,
+               "tts_latency": "lognormal:700,0.4", "tts_error_rate": 0.0}
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from .fake_upstreams import serve_fake_elevenlabs
+from .retrieval_sidecar import rss_bytes
+from .settings import settings
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+# ============================================================
+# Workload generation
+# ============================================================
+
+LONG_TAIL_TEMPLATES = [
+    "What should I know about {}?",
+    "Can you explain {} in simple terms?",
+    "How does {} relate to type 2 diabetes?",
+    "Is there anything important about {} for older adults?",
+    "What do the sources say about {}?",
+]
+
+
+def load_faq_questions() -> list:
+    """Forum questions (FAQ replay) plus section headings of the medical sources."""
+    questions = []
+
+    forum_path = settings.forum_processed_path
+    if forum_path.exists():
+        with open(forum_path, "r", encoding="utf-8") as f:
+            questions += [entry["section"] for entry in json.load(f)]
+
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    questions += sorted({m["section"] for m in metadata if m["source_type"] == "structured"})
+
+    return questions
+
+
+def load_tts_texts(rng: random.Random) -> list:
+    """Answer-sized snippets of the indexed chunks (lengths drawn from rng)."""
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    texts = []
+    for m in metadata:
+        text = " ".join(m["text"].split())
+        if len(text) > 80:
+            texts.append(text[: rng.randint(150, 600)])
+    return texts
+
+
+class Workload:
+    """Produces (endpoint, json payload) pairs for a scenario."""
+
+    def __init__(self, scenario: dict, seed: int):
+        self.rng = random.Random(seed)
+        self.mix = list(scenario.get("mix", {"/chat": 1.0}).items())
+        self.followup_rate = scenario.get("followup_rate", 0.0)
+        self.sessions = []
+        self._lock = threading.Lock()
+
+        q = scenario.get("questions", {"source": "faq"})
+        self.source = q.get("source", "faq")
+        self.faq = load_faq_questions()
+        self.zipf_weights = [1.0 / (rank + 1) ** q.get("zipf_s", 1.1) for rank in range(len(self.faq))]
+        self.long_tail_count = 0
+
+        self.tts_texts = load_tts_texts(self.rng)
+
+    def question(self) -> str:
+        if self.source == "long_tail":
+            self.long_tail_count += 1
+            topic = self.rng.choice(self.faq).rstrip("?")
+            template = self.rng.choice(LONG_TAIL_TEMPLATES)
+            return f"{template.format(topic)} (#{self.long_tail_count})"
+        return self.rng.choices(self.faq, weights=self.zipf_weights)[0]
+
+    def remember_session(self, session_id: str):
+        with self._lock:
+            self.sessions.append(session_id)
+            del self.sessions[:-200]
+
+    def next_request(self) -> tuple:
+        with self._lock:
+            endpoint = self.rng.choices([e for e, _ in self.mix], weights=[w for _, w in self.mix])[0]
+
+            if endpoint == "/chat":
+                payload = {"message": self.question()}
+                if self.sessions and self.rng.random() < self.followup_rate:
+                    payload["session_id"] = self.rng.choice(self.sessions)
+                    payload["message"] = self.rng.choice(["And what about that?", "Can you tell me more?", "Why is that?"])
+                return endpoint, payload
+
+            if endpoint == "/tts":
+                return endpoint, {"text": self.rng.choice(self.tts_texts)}
+
+            return endpoint, None
+
+
+def arrival_rate(arrival: dict, t: float) -> float:
+    if arrival.get("type") == "bursty":
+        in_burst = (t % arrival["period_s"]) < arrival["burst_s"]
+        return arrival["burst_rate"] if in_burst else arrival["base_rate"]
+    return arrival["rate"]
+
+
+# ============================================================
+# Measurement
+# ============================================================
+
+def process_tree(pid: int) -> list:
+    """pid plus all descendants (uvicorn --workers spawns children)."""
+    pids = [pid]
+    for p in pids:
+        for task in Path(f"/proc/{p}/task").glob("*"):
+            try:
+                pids += [int(c) for c in (task / "children").read_text().split()]
+            except OSError:
+                pass
+    return pids
+
+
+class RSSSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.per_process = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            per_process = {p: rss_bytes(p) for p in process_tree(self.pid)}
+            self.per_process = per_process
+            self.samples.append(sum(per_process.values()))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(records: list, wall: float, client_saturated: int, rss: RSSSampler = None) -> dict:
+    by_endpoint = defaultdict(list)
+    for rec in records:
+        by_endpoint[rec["endpoint"]].append(rec)
+
+    report = {"wall_s": wall, "client_saturated": client_saturated, "endpoints": {}}
+
+    for endpoint, recs in sorted(by_endpoint.items()):
+        ok = sorted(r["latency"] for r in recs if r["ok"])
+        shed = sorted(r["latency"] for r in recs if r["status"] in (429, 503))
+        statuses = defaultdict(int)
+        for r in recs:
+            statuses[str(r["status"])] += 1
+
+        report["endpoints"][endpoint] = {
+            "requests": len(recs),
+            "throughput_rps": len(ok) / wall if wall else 0.0,
+            "error_rate": 1 - len(ok) / len(recs),
+            "shed_rate": len(shed) / len(recs),  # 503 / 429 from admission control (part of error_rate)
+            "shed_p95_ms": percentile(shed, 0.95) * 1000,
+            "p50_ms": percentile(ok, 0.50) * 1000,
+            "p90_ms": percentile(ok, 0.90) * 1000,
+            "p95_ms": percentile(ok, 0.95) * 1000,
+            "p99_ms": percentile(ok, 0.99) * 1000,
+            "statuses": dict(statuses),
+        }
+
+    if rss is not None and rss.samples:
+        report["rss"] = {
+            "peak_mb": max(rss.samples) / 2**20,
+            "mean_mb": sum(rss.samples) / len(rss.samples) / 2**20,
+            "processes_mb": {str(p): r / 2**20 for p, r in rss.per_process.items()},
+        }
+
+    return report
+
+
+def print_report(name: str, report: dict):
+    print(f"\n=== {name}  ({report['wall_s']:.1f}s, client-saturated: {report['client_saturated']}) ===")
+    print(f"{'endpoint':10s} {'reqs':>6s} {'ok rps':>8s} {'err%':>6s} {'shed%':>6s} {'p50':>8s} {'p90':>8s} {'p95':>8s} {'p99':>8s}")
+    for endpoint, s in report["endpoints"].items():
+        print(
+            f"{endpoint:10s} {s['requests']:6d} {s['throughput_rps']:8.2f} {s['error_rate'] * 100:6.2f} "
+            f"{s['shed_rate'] * 100:6.2f} "
+            f"{s['p50_ms']:8.0f} {s['p90_ms']:8.0f} {s['p95_ms']:8.0f} {s['p99_ms']:8.0f}"
+        )
+    if "rss" in report:
+        rss = report["rss"]
+        print(f"server RSS: peak {rss['peak_mb']:.1f} MB, mean {rss['mean_mb']:.1f} MB, "
+              f"{len(rss['processes_mb'])} process(es)")
+
+
+# ============================================================
+# Driver
+# ============================================================
+
+def run_scenario(base_url: str, scenario: dict, seed: int = 0, rss: RSSSampler = None) -> dict:
+    """Open-loop load: requests are sent on schedule, not when the previous one returns."""
+    workload = Workload(scenario, seed)
+    arrival = scenario.get("arrival", {"type": "poisson", "rate": 5})
+    duration = scenario.get("duration_s", 30)
+    timeout = scenario.get("timeout_s", 60)
+    max_in_flight = scenario.get("max_in_flight", 64)
+
+    local = threading.local()
+    records = []
+    records_lock = threading.Lock()
+    in_flight = threading.Semaphore(max_in_flight)
+    client_saturated = 0
+
+    def send(endpoint: str, payload):
+        http = getattr(local, "http", None)
+        if http is None:
+            http = local.http = requests.Session()
+
+        t0 = time.perf_counter()
+        status, ok = "error", False
+        try:
+            if payload is None:
+                resp = http.get(base_url + endpoint, timeout=timeout)
+            else:
+                resp = http.post(base_url + endpoint, json=payload, timeout=timeout)
+            status = resp.status_code
+            ok = status == 200
+            if ok and endpoint != "/health":
+                body = resp.json()
+                ok = "error" not in body  # /tts reports upstream failures in the body
+                if endpoint == "/chat" and body.get("session_id"):
+                    workload.remember_session(body["session_id"])
+        except requests.RequestException as e:
+            status = type(e).__name__
+        finally:
+            in_flight.release()
+
+        with records_lock:
+            records.append({"endpoint": endpoint, "latency": time.perf_counter() - t0, "status": status, "ok": ok})
+
+    rng = random.Random(seed + 1)
+    pool = ThreadPoolExecutor(max_workers=max_in_flight)
+    start = time.perf_counter()
+    next_at = 0.0
+
+    while next_at < duration:
+        now = time.perf_counter() - start
+        if next_at > now:
+            time.sleep(next_at - now)
+
+        if in_flight.acquire(blocking=False):
+            pool.submit(send, *workload.next_request())
+        else:
+            client_saturated += 1
+
+        next_at += rng.expovariate(arrival_rate(arrival, next_at))
+
+    pool.shutdown(wait=True)
+    return summarize(records, time.perf_counter() - start, client_saturated, rss)
+
+
+def launch_server(port: int, workers: int, upstreams: dict, log_path: Path = None) -> tuple:
+    """Start the fake ElevenLabs server and uvicorn wired to the fakes."""
+    tts_server = serve_fake_elevenlabs(
+        latency=upstreams.get("tts_latency", "lognormal:700,0.4"),
+        error_rate=upstreams.get("tts_error_rate", 0.0),
+    )
+
+    env = dict(os.environ)
+    env.update({
+        "TRUSTMED_LLM_BACKEND": "fake",
+        "TRUSTMED_FAKE_LLM_LATENCY": upstreams.get("llm_latency", "lognormal:1500,0.4"),
+        "TRUSTMED_FAKE_LLM_ERROR_RATE": str(upstreams.get("llm_error_rate", 0.0)),
+        "TRUSTMED_ELEVENLABS_BASE_URL": f"http://127.0.0.1:{tts_server.server_port}",
+        "ELEVENLABS_API_KEY": "fake-key",
+    })
+    # Every simulated user comes from 127.0.0.1: per-client limits would
+    # throttle the whole test as one client (queues and shedding stay on)
+    env.setdefault("TRUSTMED_CHAT_RATE_PER_MINUTE", "0")
+    env.setdefault("TRUSTMED_TTS_RATE_PER_MINUTE", "0")
+
+    log = open(log_path, "a") if log_path else subprocess.DEVNULL
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited during start-up")
+        try:
+            if requests.get(base_url + "/health", timeout=2).status_code == 200:
+                return base_url, server, tts_server
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+
+    server.terminate()
+    raise TimeoutError("API did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /chat, /tts and /health")
+    parser.add_argument("scenarios", nargs="+", type=Path, help="scenario JSON files")
+    parser.add_argument("--url", help="test a running instance instead of launching one")
+    parser.add_argument("--server-pid", type=int, help="with --url: sample this process tree's RSS")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when launching")
+    parser.add_argument("--server-log", type=Path, help="append the launched server's output here")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="write the reports as JSON")
+    parser.add_argument("--max-error-rate", type=float, help="fail if any endpoint's error rate is above this")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if /chat p95 latency is above this")
+    args = parser.parse_args()
+
+    reports = {}
+    failed = False
+
+    for path in args.scenarios:
+        with open(path, "r", encoding="utf-8") as f:
+            scenario = json.load(f)
+        name = scenario.get("name", path.stem)
+
+        server = tts_server = None
+        if args.url:
+            base_url, pid = args.url.rstrip("/"), args.server_pid
+        else:
+            base_url, server, tts_server = launch_server(
+                args.port, args.workers, scenario.get("upstreams", {}), args.server_log
+            )
+            pid = server.pid
+
+        rss = RSSSampler(pid) if pid else None
+        if rss:
+            rss.start()
+
+        try:
+            report = run_scenario(base_url, scenario, args.seed, rss)
+        finally:
+            if rss:
+                rss.stop()
+            if server:
+                server.terminate()
+                server.wait()
+            if tts_server:
+                tts_server.shutdown()
+
+        reports[name] = report
+        print_report(name, report)
+
+        for endpoint, s in report["endpoints"].items():
+            if args.max_error_rate is not None and s["error_rate"] > args.max_error_rate:
+                print(f"[FAIL] {name} {endpoint}: error rate {s['error_rate']:.3f} > {args.max_error_rate}")
+                failed = True
+            if endpoint == "/chat" and args.max_p95_ms is not None and s["p95_ms"] > args.max_p95_ms:
+                print(f"[FAIL] {name} /chat: p95 {s['p95_ms']:.0f}ms > {args.max_p95_ms}ms")
+                failed = True
+
+    if args.json:
+        args.json.write_text(json.dumps(reports, indent=2))
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
+import base64
+import json
+import queue
+import threading
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
-from .answer_generator import generate_answer
-from .tts import router as tts_router
+from .admission import AdmissionMiddleware, controller as admission
+from .answer_generator import answer_flights, answer_stats, context_cache, generate_answer, retrieval, sessions
+from . import static_audio
+from .settings import settings
+from .speech import ProviderName, SpeechPipeline, get_provider
+from .tts import router as tts_router, tts_flights
 
 
 load_dotenv()
 app = FastAPI()
 app.include_router(tts_router)
 
+# Added before CORS so rejections still carry CORS headers
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
 origins = [
     "http://localhost:5173",
     "http://127.0.0.1:5173"
@@ -29,23 +44,138 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     message: str
     disease: str = "Type 2 Diabetes"
+    session_id: Optional[str] = None  # omit to start a new conversation
 
 class ChatResponse(BaseModel):
     answer: str
     sources: list
+    session_id: Optional[str] = None
+    usage: Optional[dict] = None  # Gemini input tokens, incl. cached
+    index_version: Optional[str] = None  # vector index the sources came from
 
+# Sync handler: runs on the threadpool, so the blocking retrieval and
+# Gemini calls do not stall the event loop (and /health) for everyone
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
+def chat_endpoint(req: ChatRequest):
     print(f"[BACKEND] User asked: {req.message}")
 
-    result = generate_answer(req.message, req.disease)
+    session = sessions.get_or_create(req.session_id)
+    result = generate_answer(req.message, req.disease, session=session)
 
     return ChatResponse(
         answer=result["answer"],
-        sources=result["sources"]
+        sources=result["sources"],
+        session_id=result["session_id"],
+        usage=result["usage"],
+        index_version=result["index_version"],
     )
 
 
+class SpeechChatRequest(ChatRequest):
+    tts_provider: Optional[ProviderName] = None  # default: settings.tts_provider
+
+
+class ClientGone(Exception):
+    """The /chat/speech client disconnected; stops the answer stream."""
+
+
+@app.post("/chat/speech")
+def chat_speech_endpoint(req: SpeechChatRequest, request: Request):
+    """
+    Answer + speech in one streamed response (newline-delimited JSON):
+
+      {"type": "text", "delta": "..."}                      as Gemini streams
+      {"type": "audio", "index": 0, "text": "...", "audio": "<base64 mp3>"}
+      {"type": "audio_error", "index": 1, "text": "...", "error": "..."}
+      {"type": "done", "answer", "sources", "disclaimer", "session_id", "usage", "index_version", "speech"}
+      {"type": "error", "error": "..."}
+
+    Audio events arrive in sentence order, starting as soon as the first
+    sentence is generated and synthesized. If the client disconnects,
+    Gemini streaming and speech synthesis stop early.
+    """
+    print(f"[BACKEND] User asked (speech): {req.message}")
+
+    provider = get_provider(req.tts_provider)
+    session = sessions.get_or_create(req.session_id)
+    # Bounded: a slow client holds the producer back instead of buffering audio
+    events = queue.Queue(maxsize=settings.speech_max_queued_events)
+    gone = threading.Event()
+
+    def put(event) -> bool:
+        while not gone.is_set():
+            try:
+                events.put(event, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def on_segment(index, text, audio, error):
+        if error is None:
+            put({"type": "audio", "index": index, "text": text, "audio": base64.b64encode(audio).decode("utf-8")})
+        else:
+            put({"type": "audio_error", "index": index, "text": text, "error": error})
+
+    pipeline = SpeechPipeline(on_segment, provider)
+
+    def run():
+        def on_text(delta):
+            if not put({"type": "text", "delta": delta}):
+                raise ClientGone()
+            pipeline.feed(delta)
+
+        try:
+            result = generate_answer(req.message, req.disease, session=session, on_text=on_text)
+        except Exception as e:
+            result = None
+            if gone.is_set():
+                print("[INFO] Speech chat client disconnected, stopped early")
+            else:
+                print("[ERROR] Speech chat failed:", e)
+                put({"type": "error", "error": str(e)})
+        finally:
+            pipeline.close()
+            pipeline.join()
+
+        if result is not None:
+            put({"type": "done", **result, "speech": pipeline.stats()})
+        put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await run_in_threadpool(events.get, timeout=1.0)
+                except queue.Empty:
+                    continue
+                if event is None:
+                    return
+                yield json.dumps(event) + "\n"
+        finally:
+            # Disconnected, or the response was torn down: stop the producer
+            gone.set()
+            pipeline.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# Sync like /chat: in sidecar and sharded mode the retrieval stats are
+# socket round-trips (up to shard_timeout), which must not block the event loop
 @app.get("/health")
-async def health():
-    return {"status": "OK", "model": "NVIDIA Nemotron 49B + TrustMedAI RAG"}
+def health():
+    retrieval_stats = retrieval.stats()
+    return {
+        "status": "OK",
+        "model": "NVIDIA Nemotron 49B + TrustMedAI RAG",
+        "index_version": retrieval_stats["index_version"],
+        "retrieval": retrieval_stats,
+        "sessions": sessions.stats(),
+        "context_cache": context_cache.stats(),
+        "answers": answer_stats,
+        "admission": admission.stats(),
+        "coalescing": {"chat": answer_flights.stats(), "tts": tts_flights.stats()},
+        "tts_static": static_audio.stats(),
+    }
@@ -0,0 +1,520 @@
+"""
+Local runner for the offline ingestion pipeline.
+
+  python -m app.pipeline plan                   what would run, and why
+  python -m app.pipeline run                    fetch, parse, dedupe, embed, index
+  python -m app.pipeline run --from-raw         re-parse saved Data/raw instead of fetching
+  python -m app.pipeline run --scrape-forum     also re-scrape the forum (Selenium)
+  python -m app.pipeline run --force index      re-run a stage even if up to date
+
+Stage graph (one branch per source; branches run in parallel):
+
+  fetch:<id> ---> parse:<id> --\\
+                                chunk:<src> ~~> embed:<src> --\\
+  forum_scrape -> dedupe ------/                               index
+                                      (other processed/*.json) /
+
+Every stage declares its input and output files. Its key is a hash of
+its parameters, the content of its input files (including the module
+that implements it) and, for streamed inputs, the key of the producing
+stage. A stage whose key matches the last successful run and whose
+outputs still exist is skipped, so a nightly refresh only re-parses and
+re-embeds the sources whose content actually changed.
+
+chunk:<src> is a stream: it runs lazily inside embed:<src>, which
+embeds chunks batch by batch as they are produced. If parse:<id> or
+dedupe ran in the same run, their parsed entries are handed over in
+memory instead of re-reading the JSON they just wrote. Per-source
+vectors are kept in <embed_dir>/sources, so the index stage can be
+rebuilt without re-embedding unchanged sources.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from .settings import settings
+
+APP_DIR = Path(__file__).resolve().parent
+
+
+# ============================================================
+# Stages
+# ============================================================
+
+class Stage:
+    """
+    fn(ctx) does the work and returns a value (kept in memory for the
+    rest of the run). Stream stages return an iterator instead and only
+    run when a stage that streams from them runs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        inputs=(),
+        outputs=(),
+        params: Optional[dict] = None,
+        streams_from: Optional[str] = None,
+        stream: bool = False,
+        volatile: bool = False,
+    ):
+        self.name = name
+        self.fn = fn
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.params = params or {}
+        self.streams_from = streams_from
+        self.stream = stream
+        self.volatile = volatile  # always runs (network fetches)
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PipelineState:
+    """
+    Last successful key per stage, plus a (size, mtime) -> sha256 cache
+    so unchanged large files are not re-hashed on every run.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.data = {"stages": {}, "files": {}}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def file_hash(self, path: Path) -> Optional[str]:
+        if not path.exists():
+            return None
+        st = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            cached = self.data["files"].get(key)
+            if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+                return cached["sha256"]
+
+        sha = file_sha256(path)
+        with self._lock:
+            self.data["files"][key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+        return sha
+
+    def stage_key(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self.data["stages"].get(name, {}).get("key")
+
+    def record(self, name: str, key: str, seconds: float):
+        with self._lock:
+            self.data["stages"][name] = {"key": key, "seconds": round(seconds, 3), "finished_at": time.time()}
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+# ============================================================
+# Runner
+# ============================================================
+
+class Context:
+    """What stage functions get: in-memory results, streams, shared resources."""
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.cpu_pool = runner.cpu_pool
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def result(self, stage_name: str):
+        """Value returned by a stage that ran in this run, else None."""
+        return self.runner.results.get(stage_name)
+
+    def stream(self, stage_name: str):
+        return self.runner.open_stream(stage_name)
+
+    def model(self):
+        """Embedding model, loaded once and shared by all embed stages."""
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(settings.embed_model)
+            return self._model
+
+
+class PipelineRunner:
+    def __init__(self, stages: list, state_path: Path, workers: int = 4, force=()):
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        self.state = PipelineState(state_path)
+        self.workers = workers
+        self.force = set(force)
+
+        self.producers = {out: s.name for s in stages for out in s.outputs}
+        self.results = {}
+        self.keys = {}
+        self.report = {}  # name -> {"status", "seconds", "items", "detail"}
+        self._report_lock = threading.Lock()
+        self.cpu_pool = None
+        self._ctx = None
+
+        unknown = self.force - set(self.stages) - {"all"}
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    def deps(self, name: str) -> list:
+        stage = self.stages[name]
+        deps = [self.producers[p] for p in stage.inputs if p in self.producers]
+        if stage.streams_from:
+            deps += self.deps(stage.streams_from)
+        return sorted(set(deps) - {name})
+
+    def key(self, name: str) -> str:
+        stage = self.stages[name]
+        payload = {
+            "params": stage.params,
+            "inputs": {str(p): self.state.file_hash(p) for p in stage.inputs},
+            "stream": self.key(stage.streams_from) if stage.streams_from else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def up_to_date(self, name: str) -> tuple:
+        """-> (skip?, reason)"""
+        stage = self.stages[name]
+        if name in self.force or "all" in self.force:
+            return False, "forced"
+        if stage.volatile:
+            return False, "always runs"
+        missing = [p for p in stage.inputs if not p.exists()]
+        if missing:
+            return False, f"missing input {missing[0].name}"
+        if any(not p.exists() for p in stage.outputs):
+            return False, "outputs missing"
+        self.keys[name] = self.key(name)
+        if self.state.stage_key(name) != self.keys[name]:
+            return False, "inputs changed" if self.state.stage_key(name) else "never ran"
+        return True, "up to date"
+
+    def _record(self, name: str, status: str, seconds: float = 0.0, items=None, detail: str = ""):
+        with self._report_lock:
+            self.report[name] = {"status": status, "seconds": seconds, "items": items, "detail": detail}
+
+    # ---------------- Streams ----------------
+
+    def open_stream(self, name: str):
+        """Run a stream stage; its time is the time spent producing items."""
+        stage = self.stages[name]
+        spent = 0.0
+        count = 0
+
+        t0 = time.perf_counter()
+        iterator = iter(stage.fn(self._ctx))
+        spent += time.perf_counter() - t0
+
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - t0
+                break
+            spent += time.perf_counter() - t0
+            count += 1
+            yield item
+
+        self.state.record(name, self.key(name), spent)
+        self._record(name, "ran", spent, count, "streamed")
+
+    # ---------------- Execution ----------------
+
+    def _execute(self, name: str):
+        stage = self.stages[name]
+        skip, reason = self.up_to_date(name)
+        if skip:
+            self._record(name, "skipped", detail=reason)
+            if stage.streams_from:
+                self._record(stage.streams_from, "skipped", detail=reason)
+            return
+
+        print(f"[INFO] Running {name} ({reason})")
+        t0 = time.perf_counter()
+        value = stage.fn(self._ctx)
+        seconds = time.perf_counter() - t0
+
+        self.results[name] = value
+        self.state.record(name, self.key(name), seconds)
+        self.state.save()
+
+        items = len(value) if hasattr(value, "__len__") else None
+        self._record(name, "ran", seconds, items, reason)
+
+    def run(self) -> dict:
+        self._ctx = Context(self)
+        t_start = time.perf_counter()
+
+        pending = [n for n in self.order if not self.stages[n].stream]
+        done, failed = set(), set()
+        running = {}
+
+        with ProcessPoolExecutor(max_workers=settings.parse_workers or None) as cpu_pool, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            self.cpu_pool = cpu_pool
+            self._ctx.cpu_pool = cpu_pool
+
+            while pending or running:
+                for name in list(pending):
+                    deps = self.deps(name)
+                    if any(d in failed for d in deps):
+                        pending.remove(name)
+                        failed.add(name)
+                        self._record(name, "blocked", detail="upstream failed")
+                    elif all(d in done for d in deps):
+                        pending.remove(name)
+                        running[pool.submit(self._execute, name)] = name
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as e:
+                        print(f"[ERROR] Stage {name} failed: {type(e).__name__}: {e}")
+                        failed.add(name)
+                        self._record(name, "failed", detail=f"{type(e).__name__}: {e}")
+
+        for name in self.order:
+            if name not in self.report:
+                self._record(name, "skipped", detail="not needed")
+
+        self.state.save()
+        return {
+            "wall_s": time.perf_counter() - t_start,
+            "ok": not failed,
+            "stages": {name: self.report[name] for name in self.order},
+        }
+
+    def plan(self) -> list:
+        """-> [(stage, action, reason)] without running anything."""
+        rows, will_run = [], set()
+        for name in self.order:
+            stage = self.stages[name]
+            if stage.stream:
+                continue
+            upstream = [d for d in self.deps(name) if d in will_run]
+            skip, reason = self.up_to_date(name)
+            if not skip:
+                will_run.add(name)
+                rows.append((name, "run", reason))
+            elif upstream:
+                will_run.add(name)
+                rows.append((name, "run?", f"if {upstream[0]} changes its outputs"))
+            else:
+                rows.append((name, "skip", reason))
+        return rows
+
+
+def print_report(report: dict):
+    print(f"\n{'stage':42s} {'status':8s} {'seconds':>8s} {'items':>7s}  detail")
+    for name, r in report["stages"].items():
+        items = "" if r["items"] is None else str(r["items"])
+        print(f"{name:42s} {r['status']:8s} {r['seconds']:8.2f} {items:>7s}  {r['detail']}")
+    print(f"wall time {report['wall_s']:.2f}s, {'ok' if report['ok'] else 'FAILED'}")
+
+
+# ============================================================
+# The TrustMedAI ingestion DAG
+# ============================================================
+
+def _fetch(src):
+    def run(ctx):
+        from .scraper_t2dm import fetch_html, save_raw_html
+        html = fetch_html(src["url"])
+        save_raw_html(src["id"], html)
+        return html
+    return run
+
+
+def _parse(src):
+    def run(ctx):
+        from .scraper_t2dm import load_raw_html, parse_source, save_json
+        html = ctx.result(f"fetch:{src['id']}") or load_raw_html(src["id"])
+        data = ctx.cpu_pool.submit(parse_source, src["site"], html).result()
+        if not data:
+            raise ValueError(f"No processed data extracted for {src['id']}")
+        save_json(src["id"], data)
+        return data
+    return run
+
+
+def _scrape_forum(ctx):
+    from .forum_scraper import scrape_forum
+    return scrape_forum()
+
+
+def _dedupe(ctx):
+    from .dedupe_questions import dedupe_forum
+    return dedupe_forum()
+
+
+def _chunk(source_id: str, producer: Optional[str], path: Path):
+    def run(ctx):
+        from .vector_store import iter_chunks, iter_source_file
+        data = ctx.result(producer) if producer else None
+        return iter_chunks(source_id, data) if data is not None else iter_source_file(path)
+    return run
+
+
+def _embed(source_id: str, out_dir: Path):
+    def run(ctx):
+        from .vector_store import embed_chunk_stream
+        chunks, vectors = embed_chunk_stream(ctx.model(), ctx.stream(f"chunk:{source_id}"))
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        np.save(out_dir / f"{source_id}.npy", vectors)
+        with open(out_dir / f"{source_id}.json", "w", encoding="utf-8") as f:
+            json.dump(chunks, f, indent=2)
+        return chunks
+    return run
+
+
+def _index(source_ids: list, src_dir: Path):
+    def run(ctx):
+        from .vector_store import write_vector_db
+
+        chunks, parts = [], []
+        for sid in source_ids:
+            with open(src_dir / f"{sid}.json", "r", encoding="utf-8") as f:
+                chunks.extend(json.load(f))
+            parts.append(np.load(src_dir / f"{sid}.npy"))
+
+        write_vector_db(chunks, np.vstack(parts), ctx.model())
+        return chunks
+    return run
+
+
+def build_stages(from_raw: bool = False, scrape_forum: bool = False) -> list:
+    from .scraper_t2dm import T2DM_SOURCES
+
+    raw_dir, processed_dir, embed_dir = settings.raw_dir, settings.processed_dir, settings.embed_dir
+    src_dir = embed_dir / "sources"
+    stages = []
+    processed = {}  # source_id -> (path, producing stage)
+
+    # 1. Medical sources: fetch -> parse
+    for src in T2DM_SOURCES:
+        sid = src["id"]
+        raw, out = raw_dir / f"{sid}.html", processed_dir / f"{sid}.json"
+        if not from_raw:
+            stages.append(Stage(f"fetch:{sid}", _fetch(src), outputs=[raw], volatile=True))
+        stages.append(Stage(
+            f"parse:{sid}", _parse(src),
+            inputs=[raw, APP_DIR / "scraper_t2dm.py"],
+            outputs=[out],
+            params={"site": src["site"]},
+        ))
+        processed[sid] = (out, f"parse:{sid}")
+
+    # 2. Forum: scrape -> dedupe (only if there is a raw scrape to dedupe)
+    if scrape_forum:
+        stages.append(Stage("forum_scrape", _scrape_forum, outputs=[settings.forum_raw_path], volatile=True))
+    if scrape_forum or settings.forum_raw_path.exists():
+        stages.append(Stage(
+            "dedupe", _dedupe,
+            inputs=[settings.forum_raw_path, APP_DIR / "dedupe_questions.py"],
+            outputs=[settings.forum_processed_path],
+            params={"threshold": settings.dedupe_threshold},
+        ))
+        processed[settings.forum_processed_path.stem] = (settings.forum_processed_path, "dedupe")
+
+    # Hand-maintained processed sources are indexed too (as vector_store does)
+    for fp in sorted(processed_dir.glob("*.json")):
+        processed.setdefault(fp.stem, (fp, None))
+
+    # 3. Per source: chunk ~> embed
+    source_ids = sorted(processed)
+    for sid in source_ids:
+        path, producer = processed[sid]
+        stages.append(Stage(
+            f"chunk:{sid}", _chunk(sid, producer, path),
+            inputs=[path, APP_DIR / "vector_store.py"],
+            stream=True,
+        ))
+        stages.append(Stage(
+            f"embed:{sid}", _embed(sid, src_dir),
+            outputs=[src_dir / f"{sid}.npy", src_dir / f"{sid}.json"],
+            params={"model": settings.embed_model},
+            streams_from=f"chunk:{sid}",
+        ))
+
+    # 4. Index over all sources, in the same order as vector_store
+    stages.append(Stage(
+        "index", _index(source_ids, src_dir),
+        inputs=[src_dir / f"{sid}{ext}" for sid in source_ids for ext in (".npy", ".json")]
+        + [APP_DIR / "vector_compression.py", APP_DIR / "calibration.py", APP_DIR / "reduction.py"],
+        outputs=[settings.index_path, settings.vectors_path, settings.meta_path, settings.calibration_path],
+        params={
+            "model": settings.embed_model,
+            "storage": settings.vector_storage,
+            "pq": [settings.pq_m, settings.pq_nbits],
+            "reduce": [settings.reduce_method, settings.reduce_dims],
+        },
+    ))
+
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental ingestion pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for cmd in ("plan", "run"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--from-raw", action="store_true", help="use saved Data/raw/*.html instead of fetching")
+        p.add_argument("--scrape-forum", action="store_true", help="re-scrape the forum with Selenium")
+        p.add_argument("--force", nargs="*", default=[], help="stages to re-run regardless of hashes ('all' for every stage)")
+        p.add_argument("--workers", type=int, default=settings.pipeline_workers)
+        p.add_argument("--state", type=Path, default=settings.pipeline_state_path)
+        if cmd == "run":
+            p.add_argument("--json", type=Path, help="write the timing report here")
+
+    args = parser.parse_args()
+    runner = PipelineRunner(build_stages(args.from_raw, args.scrape_forum), args.state, args.workers, args.force)
+
+    if args.command == "plan":
+        for name, action, reason in runner.plan():
+            print(f"{action:5s} {name:42s} {reason}")
+        return
+
+    report = runner.run()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    raise SystemExit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
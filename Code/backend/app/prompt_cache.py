@@ -0,0 +1,297 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from google.genai.types import Content, CreateCachedContentConfig, Part
+
+
+# ============================================================
+# Cached-content handles
+# ============================================================
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), enough to skip doomed creates."""
+    return len(text) // 4
+
+
+class CacheHandle:
+    """One Gemini cached content plus the chunk_ids it contains."""
+
+    __slots__ = ("key", "name", "chunk_ids", "tokens", "expires_at", "refs", "evicted")
+
+    def __init__(self, key: tuple, name: str, chunk_ids: frozenset, tokens: int, expires_at: float):
+        self.key = key
+        self.name = name
+        self.chunk_ids = chunk_ids
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.refs = 0
+        self.evicted = False
+
+
+class ContextCacheRegistry:
+    """
+    Owns the Gemini cached contents used by generate_answer:
+
+    - one shared handle holding only the static system instruction
+    - handles holding system instruction + a chunk set, keyed by the
+      sorted chunk_ids (+ model). A chunk set is only uploaded once it
+      has been requested min_uses times (or when force=True), so
+      one-off retrievals never pay for a cache create.
+
+    Handles are leased per request (acquire / release). Evicted or
+    expired handles are deleted once no request is using them.
+    Gemini rejects caches below a minimum token count (min_tokens), so
+    content estimated below it is never uploaded; this includes the
+    system instruction on its own at its current size. Other failed
+    creates are remembered for retry_after seconds instead of retried
+    on every request.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        system_instruction: str,
+        format_context: Callable[[list], str],
+        context_header: str,
+        ttl_seconds: int = 1800,
+        max_handles: int = 64,
+        min_uses: int = 2,
+        retry_after: float = 300.0,
+        min_tokens: int = 1024,
+    ):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.format_context = format_context
+        self.context_header = context_header
+        self.ttl_seconds = ttl_seconds
+        self.max_handles = max_handles
+        self.min_uses = min_uses
+        self.retry_after = retry_after
+        self.min_tokens = min_tokens
+
+        self._handles = OrderedDict()   # key -> CacheHandle (LRU)
+        self._uses = OrderedDict()      # key -> request count (bounded)
+        self._failed = OrderedDict()    # key -> time of last failed create (bounded)
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+        self.deleted = 0
+        self.create_failures = 0
+        self.skipped_small = 0
+        self.requests = 0
+        self.input_tokens = 0
+        self.tokens_saved = 0
+
+    # --------------------------------------------------------
+    # Keys
+    # --------------------------------------------------------
+    def context_key(self, chunk_ids: Iterable[str], index_version: Optional[str] = None) -> tuple:
+        # Same chunk ids can carry different text in another index version
+        return (self.model, "context", index_version) + tuple(sorted(chunk_ids))
+
+    def system_key(self) -> tuple:
+        return (self.model, "system")
+
+    # --------------------------------------------------------
+    # Internals (caller holds the lock unless noted)
+    # --------------------------------------------------------
+    def _count_use(self, key: tuple) -> int:
+        count = self._uses.pop(key, 0) + 1
+        self._uses[key] = count
+        while len(self._uses) > self.max_handles * 16:
+            self._uses.popitem(last=False)
+        return count
+
+    def _note_failure(self, key: tuple):
+        # Oldest failures first: expired ones are dropped from the front
+        now = time.time()
+        self._failed.pop(key, None)
+        self._failed[key] = now
+        while self._failed:
+            oldest_key, failed_at = next(iter(self._failed.items()))
+            if now - failed_at < self.retry_after and len(self._failed) <= self.max_handles * 16:
+                break
+            del self._failed[oldest_key]
+
+    def _retire(self, handle: CacheHandle) -> list:
+        """Mark a handle evicted; returns names safe to delete now."""
+        if self._handles.get(handle.key) is handle:
+            del self._handles[handle.key]
+        handle.evicted = True
+        return [handle.name] if handle.refs == 0 else []
+
+    def _lookup(self, key: tuple) -> tuple:
+        handle = self._handles.get(key)
+        if handle is None:
+            return None, []
+
+        # Stop using a handle a bit before Gemini expires it
+        if handle.expires_at - 30 < time.time():
+            return None, self._retire(handle)
+
+        self._handles.move_to_end(key)
+        handle.refs += 1
+        self.reused += 1
+        return handle, []
+
+    def _delete(self, names: list):
+        # called without the lock (network)
+        for name in names:
+            try:
+                self.client.caches.delete(name=name)
+                with self._lock:
+                    self.deleted += 1
+            except Exception as e:
+                print("[WARN] Could not delete Gemini cache:", e)
+
+    def _create(self, key: tuple, chunks: list) -> Optional[CacheHandle]:
+        # called without the lock (network)
+        contents, text = None, ""
+        if chunks:
+            text = f"{self.context_header}\n{self.format_context(chunks)}"
+            contents = [Content(role="user", parts=[Part(text=text)])]
+
+        if estimate_tokens(self.system_instruction) + estimate_tokens(text) < self.min_tokens:
+            with self._lock:
+                self.skipped_small += 1
+            return None
+
+        try:
+            cache = self.client.caches.create(
+                model=self.model,
+                config=CreateCachedContentConfig(
+                    system_instruction=self.system_instruction,
+                    contents=contents,
+                    ttl=f"{self.ttl_seconds}s",
+                    display_name="trustmedai-" + ("context" if chunks else "system"),
+                ),
+            )
+        except Exception as e:
+            print("[WARN] Gemini context cache not created:", e)
+            with self._lock:
+                self._note_failure(key)
+                self.create_failures += 1
+            return None
+
+        usage = getattr(cache, "usage_metadata", None)
+        handle = CacheHandle(
+            key=key,
+            name=cache.name,
+            chunk_ids=frozenset(c.chunk_id for c in chunks),
+            tokens=getattr(usage, "total_token_count", 0) or 0,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+        handle.refs = 1
+
+        with self._lock:
+            self.created += 1
+            to_delete = []
+
+            # Another request may have created the same key meanwhile
+            old = self._handles.get(key)
+            if old is not None:
+                to_delete += self._retire(old)
+            self._handles[key] = handle
+
+            while len(self._handles) > self.max_handles:
+                _, lru = next(iter(self._handles.items()))
+                to_delete += self._retire(lru)
+
+        self._delete(to_delete)
+        return handle
+
+    def _acquire(self, key: tuple, chunks: list, create: bool) -> Optional[CacheHandle]:
+        with self._lock:
+            handle, to_delete = self._lookup(key)
+            failed_at = self._failed.get(key)
+            blocked = failed_at is not None and time.time() - failed_at < self.retry_after
+            if failed_at is not None and not blocked:
+                del self._failed[key]
+
+        self._delete(to_delete)
+
+        if handle is not None or not create or blocked:
+            return handle
+        return self._create(key, chunks)
+
+    # --------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------
+    def acquire_context(self, chunks: list, force: bool = False) -> Optional[CacheHandle]:
+        """
+        Lease a handle for system instruction + these chunks.
+        Returns None if the set is not hot yet or caching failed.
+        """
+        if not chunks:
+            return None
+
+        key = self.context_key((c.chunk_id for c in chunks), getattr(chunks[0], "index_version", None))
+        with self._lock:
+            uses = self._count_use(key)
+
+        return self._acquire(key, chunks, create=force or uses >= self.min_uses)
+
+    def acquire_system(self) -> Optional[CacheHandle]:
+        """Lease the shared system-instruction handle (created on first use)."""
+        return self._acquire(self.system_key(), [], create=True)
+
+    def release(self, handle: Optional[CacheHandle]):
+        if handle is None:
+            return
+
+        with self._lock:
+            handle.refs -= 1
+            to_delete = [handle.name] if handle.evicted and handle.refs == 0 else []
+
+        self._delete(to_delete)
+
+    def invalidate(self, handle: Optional[CacheHandle]):
+        """Drop a handle Gemini no longer accepts (expired / deleted)."""
+        if handle is None:
+            return
+
+        with self._lock:
+            if self._handles.get(handle.key) is handle:
+                del self._handles[handle.key]
+            handle.evicted = True
+
+    def record_usage(self, usage) -> dict:
+        """
+        Account the usage_metadata of one generate_content response.
+
+        Returns: {"input_tokens", "cached_input_tokens", "uncached_input_tokens"}
+        """
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += prompt_tokens
+            self.tokens_saved += cached_tokens
+
+        return {
+            "input_tokens": prompt_tokens,
+            "cached_input_tokens": cached_tokens,
+            "uncached_input_tokens": prompt_tokens - cached_tokens,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "handles": len(self._handles),
+                "created": self.created,
+                "reused": self.reused,
+                "deleted": self.deleted,
+                "create_failures": self.create_failures,
+                "failed_keys": len(self._failed),
+                "skipped_small": self.skipped_small,
+                "requests": self.requests,
+                "input_tokens": self.input_tokens,
+                "cached_input_tokens": self.tokens_saved,
+                "avg_tokens_saved_per_request": self.tokens_saved / self.requests if self.requests else 0.0,
+            }
@@ -0,0 +1,211 @@
+"""
+Optional dimensionality reduction of the embeddings.
+
+MiniLM gives 384-d vectors, more than a narrow medical corpus needs;
+search cost and index memory both grow linearly with the dimension.
+With settings.reduce_dims set, vector_store fits a projection at index
+build time, stores the reduced unit vectors in the index and
+vectors.npy, and saves the projection as reduction.npz in the index
+version. The retriever projects query vectors with the projection of
+the version it searches, so a hot-swap never mixes spaces.
+
+  pca       top principal directions of the (uncentered) chunk vectors.
+            Uncentered, because search compares inner products with
+            queries, not distances to the corpus mean: the projection is
+            the best rank-d approximation of those inner products, and
+            at the full dimension it reproduces exact search.
+  truncate  the first d coordinates. Only meaningful for models trained
+            with Matryoshka losses; MiniLM is not, so use pca.
+
+Projected vectors are re-normalized, so scores stay cosines and the
+relevance calibration (fitted on the reduced vectors) keeps its meaning.
+Query embeddings themselves (query cache, follow-up blending, extractive
+answers) stay in the model's full dimension.
+
+Pick the smallest dimension that keeps recall on the real corpus:
+
+  python -m app.reduction eval --dims 64 96 128 192 256 --k 5
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .settings import settings
+
+METHODS = ("pca", "truncate")
+
+
+def fit_reduction(vectors, dims: int, method: str = "pca") -> dict:
+    """
+    Fit a projection of (n, D) vectors down to dims dimensions.
+
+    Returns: {"method", "components" (dims, D) float32, "retained"}; retained
+    is the share of the vectors' energy kept by the projection.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    full = vectors.shape[1]
+    if not 0 < dims <= full:
+        raise ValueError(f"Cannot reduce {full}d vectors to {dims} dimensions")
+
+    # D x D second-moment matrix: cheap for any corpus size
+    moment = vectors.T.astype(np.float64) @ vectors
+    total = float(np.trace(moment)) or 1.0
+
+    if method == "pca":
+        eigvals, eigvecs = np.linalg.eigh(moment)
+        top = np.argsort(-eigvals, kind="stable")[:dims]
+        components = eigvecs[:, top].T
+        retained = float(eigvals[top].sum()) / total
+    elif method == "truncate":
+        components = np.eye(full)[:dims]
+        retained = float(np.trace(moment[:dims, :dims])) / total
+    else:
+        raise ValueError(f"Unknown reduction method: {method!r} (choose from {', '.join(METHODS)})")
+
+    return {"method": method, "components": components.astype(np.float32), "retained": retained}
+
+
+def project(vectors, reduction: dict):
+    """(n, D) vectors -> (n, dims) float32 unit vectors."""
+    reduced = np.asarray(vectors, dtype=np.float32) @ reduction["components"].T
+    return reduced / (np.linalg.norm(reduced, axis=1, keepdims=True) + 1e-12)
+
+
+def save_reduction(reduction: dict, path: Path):
+    np.savez(
+        path,
+        method=np.array(reduction["method"]),
+        components=reduction["components"],
+        retained=np.array(reduction["retained"]),
+    )
+
+
+def load_reduction(path: Path):
+    """The saved projection, or None for an index in the full dimension."""
+    if not Path(path).exists():
+        return None
+    with np.load(path) as f:
+        return {"method": str(f["method"]), "components": f["components"], "retained": float(f["retained"])}
+
+
+# ============================================================
+# Recall vs. dimension report
+# ============================================================
+
+def load_full_vectors(model) -> tuple:
+    """Chunk metadata and full-dimension vectors of the live index (re-embedded if it is reduced)."""
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    if load_reduction(settings.reduction_path) is None:
+        return metadata, np.load(settings.vectors_path).astype(np.float32, copy=False)
+
+    print(f"[INFO] Live index is reduced; re-embedding {len(metadata)} chunks at full dimension...")
+    vectors = model.encode(
+        [m["text"] for m in metadata],
+        batch_size=settings.embed_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+    return metadata, vectors
+
+
+def evaluate(dims_list: list, methods: list, k: int, n_queries: int, storage: str, scale: int = 1) -> tuple:
+    """
+    Recall@k of each method / dimension against exact full-dimension
+    search, with index size and per-query latency (projection included).
+    The projection is fitted on the corpus, as at build time.
+
+    Returns: (rows, number of vectors, full dimension)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    from .sharding import replicate
+    from .vector_compression import index_bytes, load_eval_queries, make_index, search
+
+    model = SentenceTransformer(settings.embed_model)
+    metadata, full = load_full_vectors(model)
+    if scale > 1:
+        metadata, full = replicate(metadata, full, scale)
+
+    queries = load_eval_queries(n_queries)
+    query_vecs = model.encode(
+        queries,
+        batch_size=settings.embed_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+
+    _, truth = make_index(full, "flat").search(query_vecs, k)
+    n_truth = max(1, int((truth >= 0).sum()))
+
+    def measure(method, dims, vectors, reduction):
+        index = make_index(vectors, storage, settings.pq_m, settings.pq_nbits)
+        t0 = time.perf_counter()
+        qv = project(query_vecs, reduction) if reduction else query_vecs
+        _, found = search(index, vectors, qv, k, settings.rescore_factor)
+        latency = (time.perf_counter() - t0) / len(queries)
+
+        hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+        return {
+            "method": method,
+            "dims": dims,
+            "retained": reduction["retained"] if reduction else 1.0,
+            "index_bytes": index_bytes(index),
+            "recall": hits / n_truth,
+            "latency_ms": latency * 1000,
+        }
+
+    rows = [measure("full", full.shape[1], full, None)]
+    for method in methods:
+        for dims in sorted(set(dims_list)):
+            if dims >= full.shape[1]:
+                continue
+            if storage == "pq" and dims % settings.pq_m:
+                print(f"[WARN] Skipping {dims}d: pq_m={settings.pq_m} does not divide it")
+                continue
+            reduction = fit_reduction(full, dims, method)
+            rows.append(measure(method, dims, project(full, reduction), reduction))
+
+    return rows, len(full), full.shape[1]
+
+
+def print_report(rows: list, n_vectors: int, dim: int, k: int, storage: str):
+    print(f"{n_vectors} vectors x {dim}d, {storage} index, recall against exact {dim}d search")
+    print(f"{'method':9s} {'dims':>5s} {'energy':>7s} {'index MB':>9s} {'recall@' + str(k):>9s} {'ms/query':>9s}")
+    for r in rows:
+        print(
+            f"{r['method']:9s} {r['dims']:5d} {r['retained']:7.3f} {r['index_bytes'] / 2**20:9.2f} "
+            f"{r['recall']:9.3f} {r['latency_ms']:9.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding dimensionality reduction tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_eval = sub.add_parser("eval", help="report recall and latency for each target dimension")
+    p_eval.add_argument("--dims", nargs="+", type=int, default=[32, 64, 96, 128, 192, 256])
+    p_eval.add_argument("--method", nargs="+", default=["pca"], choices=METHODS)
+    p_eval.add_argument("--k", type=int, default=settings.retrieval_k)
+    p_eval.add_argument("--queries", type=int, default=500)
+    p_eval.add_argument("--storage", default=settings.vector_storage, help="index encoding of every row")
+    p_eval.add_argument("--scale", type=int, default=1, help="replicate the corpus (jittered) for latency at larger sizes")
+    p_eval.add_argument("--json", type=str, help="also write the rows to this file")
+
+    args = parser.parse_args()
+
+    rows, n_vectors, dim = evaluate(args.dims, args.method, args.k, args.queries, args.storage, args.scale)
+    print_report(rows, n_vectors, dim, args.k, args.storage)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""
+Retrieval sidecar: one process holds the embedding model, FAISS index
+and metadata and serves batched embed / search requests over a local
+socket, so API workers only do HTTP and LLM I/O and stay small.
+
+  Start the sidecar:     TRUSTMED_SIDECAR_AUTHKEY=<secret> python -m app.retrieval_sidecar serve
+  Point workers at it:   TRUSTMED_SIDECAR_AUTHKEY=<secret> TRUSTMED_RETRIEVAL_BACKEND=sidecar \\
+                         uvicorn app.main:app --workers 4
+  Compare both layouts:  python -m app.retrieval_sidecar bench --procs 4
+
+Requests that arrive within sidecar_batch_window_ms of each other are
+embedded in one model forward pass and searched with one index.search
+call per distinct set of search options.
+
+Security: multiprocessing.connection unpickles every message, so any
+peer that knows the authkey can run code in the sidecar. serve refuses
+to start without a private settings.sidecar_authkey, and the default
+Unix socket lives in a per-user 0700 directory with 0600 permissions.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import secrets
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .settings import settings
+
+
+def parse_address(address: str):
+    """"host:port" -> TCP address, anything else -> Unix socket path."""
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return (host, int(port))
+    return address
+
+
+# Keys anyone can know: empty, and the default shipped by earlier versions
+PUBLIC_AUTHKEYS = ("", "trustmedai")
+
+
+def check_authkey(authkey: str):
+    """Refuse to serve with a key that is not a private secret."""
+    if authkey in PUBLIC_AUTHKEYS:
+        raise ValueError(
+            "Set TRUSTMED_SIDECAR_AUTHKEY to a private secret (e.g. python -c "
+            "'import secrets; print(secrets.token_hex(32))'): the sidecar unpickles every "
+            "request, so anyone holding the key can run code in it"
+        )
+
+
+def prepare_socket_dir(path: str):
+    """Create the socket's directory 0700, and refuse one other users can reach."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"Socket directory {directory} must be owned by this user with mode 0700")
+
+
+def rss_bytes(pid="self") -> int:
+    """Resident set size of a process (Linux /proc), 0 if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# ============================================================
+# Server
+# ============================================================
+
+class BatchingServer:
+    """
+    Collects requests from all connections into micro-batches.
+
+    ops:
+      embed    {query}                 -> float32 (1, dim)
+      embed_many {queries}             -> float32 (n, dim), one forward pass
+      embed_texts {texts}              -> float32 (n, dim), not cached
+      search   {vec, k, kwargs}        -> list of Hit
+      retrieve {query, k, kwargs}      -> list of Hit
+      candidates {vec, fetch_k, kwargs} -> (hits, vectors, query), see LoadedIndex.candidates
+      hits     {chunk_ids}             -> list of Hit
+      version  {}                      -> active index version
+      stats    {}                      -> dict
+    """
+
+    def __init__(self, retriever, window_ms: float, max_batch: int):
+        self.retriever = retriever
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+
+        self.requests = 0
+        self.batches = 0
+
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, op: str, args: dict) -> Future:
+        future = Future()
+        self.queue.put((op, args, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.requests += len(batch)
+            self.batches += 1
+            self._run(batch)
+
+    def _run(self, batch: list):
+        # 1. One forward pass for every query text in the batch
+        to_embed = [item for item in batch if item[0] in ("embed", "retrieve")]
+        if to_embed:
+            try:
+                vecs = self.retriever.embed_queries([args["query"] for _, args, _ in to_embed])
+            except Exception as e:
+                for _, _, future in to_embed:
+                    future.set_exception(e)
+                vecs = None
+
+            if vecs is not None:
+                for (op, args, future), vec in zip(to_embed, vecs):
+                    if op == "embed":
+                        future.set_result(vec.reshape(1, -1))
+                    else:
+                        args["vec"] = vec
+
+        # 2. One index.search per group of identical search options
+        groups = defaultdict(list)
+        for op, args, future in batch:
+            if op in ("search", "retrieve") and not future.done():
+                key = (args["k"], tuple(sorted(args.get("kwargs", {}).items())))
+                groups[key].append((args["vec"], future))
+
+        for (k, kwargs), items in groups.items():
+            try:
+                vecs = np.vstack([np.asarray(vec, dtype=np.float32).reshape(1, -1) for vec, _ in items])
+                results = self.retriever.search_many(vecs, k, **dict(kwargs))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), hits in zip(items, results):
+                future.set_result(hits)
+
+        # 3. Cheap ops run directly
+        for op, args, future in batch:
+            if future.done():
+                continue
+            try:
+                if op == "embed_many":
+                    future.set_result(self.retriever.embed_queries(args["queries"]))
+                elif op == "embed_texts":
+                    future.set_result(self.retriever.embed_texts(args["texts"]))
+                elif op == "candidates":
+                    future.set_result(self.retriever.candidates(args["vec"], args["fetch_k"], **args.get("kwargs", {})))
+                elif op == "hits":
+                    future.set_result(self.retriever.hits_for_chunk_ids(args["chunk_ids"]))
+                elif op == "version":
+                    future.set_result(self.retriever.index_version())
+                elif op == "stats":
+                    future.set_result(self.stats())
+                else:
+                    raise ValueError(f"Unknown sidecar op: {op}")
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            **self.retriever.stats(),
+            "sidecar_requests": self.requests,
+            "sidecar_batches": self.batches,
+            "sidecar_rss_bytes": rss_bytes(),
+        }
+
+
+def _serve_connection(conn, server: BatchingServer):
+    try:
+        while True:
+            op, args = conn.recv()
+            future = server.submit(op, args)
+            try:
+                conn.send(("ok", future.result()))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def serve(address: str = None, authkey: str = None):
+    authkey = settings.sidecar_authkey if authkey is None else authkey
+    check_authkey(authkey)
+    address = parse_address(address or settings.sidecar_address)
+    unix_socket = isinstance(address, str)
+    if unix_socket:
+        prepare_socket_dir(address)
+
+    # Heavy imports only happen in the sidecar process
+    from . import retriever
+
+    server = BatchingServer(retriever, settings.sidecar_batch_window_ms, settings.sidecar_max_batch)
+
+    if unix_socket and os.path.exists(address):
+        os.unlink(address)  # stale socket from a previous run
+
+    # Owner-only from the moment the socket file exists
+    old_umask = os.umask(0o177) if unix_socket else None
+    try:
+        listener = Listener(address, authkey=authkey.encode())
+    finally:
+        if old_umask is not None:
+            os.umask(old_umask)
+    if unix_socket:
+        os.chmod(address, 0o600)
+
+    with listener:
+        print(f"[INFO] Retrieval sidecar listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print("[WARN] Sidecar connection rejected:", e)
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, server), daemon=True).start()
+
+
+# ============================================================
+# Client (used by API workers)
+# ============================================================
+
+class SidecarClient:
+    """
+    Same interface as the retriever module functions used by
+    answer_generator. One connection per thread, reconnected on failure.
+    """
+
+    def __init__(self, address: str, authkey: str, timeout: float = None):
+        self.address = parse_address(address)
+        self.authkey = authkey.encode()
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def call(self, op: str, **args):
+        if not self.authkey:
+            raise ConnectionError("TRUSTMED_SIDECAR_AUTHKEY is not set; it must match the sidecar's")
+
+        for attempt in range(2):
+            try:
+                conn = self._conn()
+                conn.send((op, args))
+                if self.timeout is not None and not conn.poll(self.timeout):
+                    self._reset()  # late reply would desync the connection
+                    raise TimeoutError(f"Retrieval sidecar timed out after {self.timeout}s")
+                status, value = conn.recv()
+                break
+            except TimeoutError:
+                raise
+            except (EOFError, OSError) as e:  # incl. a missing socket file
+                self._reset()
+                if attempt:
+                    raise ConnectionError(f"Retrieval sidecar unavailable at {self.address}") from e
+
+        if status != "ok":
+            raise RuntimeError(f"Retrieval sidecar error: {value}")
+        return value
+
+    def embed_query(self, query: str):
+        return self.call("embed", query=query)
+
+    def embed_queries(self, queries: list):
+        return self.call("embed_many", queries=list(queries))
+
+    def embed_texts(self, texts: list):
+        return self.call("embed_texts", texts=list(texts))
+
+    def search_chunks(self, query_vec, k: int = 5, **search_kwargs):
+        return self.call("search", vec=np.asarray(query_vec, dtype=np.float32), k=k, kwargs=search_kwargs)
+
+    def retrieve_chunks(self, query: str, k: int = 5, **search_kwargs):
+        return self.call("retrieve", query=query, k=k, kwargs=search_kwargs)
+
+    def candidates(self, query_vec, fetch_k: int, **search_kwargs) -> tuple:
+        return self.call("candidates", vec=np.asarray(query_vec, dtype=np.float32), fetch_k=fetch_k, kwargs=search_kwargs)
+
+    def hits_for_chunk_ids(self, chunk_ids) -> list:
+        return self.call("hits", chunk_ids=list(chunk_ids))
+
+    def index_version(self) -> str:
+        return self.call("version")
+
+    def stats(self) -> dict:
+        return self.call("stats")
+
+
+client = SidecarClient(settings.sidecar_address, settings.sidecar_authkey, settings.sidecar_timeout_seconds)
+
+
+# ============================================================
+# Benchmark: N self-contained workers vs. N thin workers + sidecar
+# ============================================================
+
+def load_bench_queries(n: int) -> list:
+    """Distinct query strings built from the indexed section titles."""
+    import json
+
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    titles = sorted({m["section"] for m in metadata} | {m["subsection"] for m in metadata if m["subsection"]})
+    return [f"{titles[i % len(titles)]} ({i // len(titles)})" for i in range(n)]
+
+
+def _local_worker(queries, k, results):
+    from . import retriever
+
+    retriever.retrieve_chunks("warm up", k)
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        retriever.retrieve_chunks(q, k)
+        latencies.append(time.perf_counter() - t0)
+    results.put((latencies, rss_bytes()))
+
+
+def _sidecar_worker(address, authkey, queries, k, results):
+    remote = SidecarClient(address, authkey)
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        remote.retrieve_chunks(q, k)
+        latencies.append(time.perf_counter() - t0)
+    results.put((latencies, rss_bytes()))
+
+
+def _run_workers(target, args_for, procs: int) -> tuple:
+    ctx = mp.get_context("spawn")  # like uvicorn workers: nothing shared via fork
+    results = ctx.Queue()
+    workers = [ctx.Process(target=target, args=args_for(i) + (results,)) for i in range(procs)]
+
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    outputs = [results.get() for _ in workers]
+    wall = time.perf_counter() - t0
+
+    for w in workers:
+        w.join()
+
+    latencies = [lat for lats, _ in outputs for lat in lats]
+    rss = sum(r for _, r in outputs)
+    return latencies, rss, wall
+
+
+def _wait_for_sidecar(address: str, authkey: str, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            SidecarClient(address, authkey).stats()
+            return
+        except (OSError, EOFError):
+            time.sleep(0.5)
+    raise TimeoutError("Sidecar did not come up")
+
+
+def _report(layout: str, procs: int, latencies: list, rss: int, wall: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{layout:10s} procs={procs:<3d} q/s={len(latencies) / wall:8.1f} "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms p95={p95 * 1000:7.2f}ms "
+        f"total_rss={rss / 2**20:8.1f}MB"
+    )
+
+
+def bench(procs: int, n_queries: int, k: int):
+    """
+    Throughput includes process start-up; RSS is summed over all
+    processes of a layout (sidecar included).
+    """
+    queries = load_bench_queries(n_queries)
+    per_worker = [queries[i::procs] for i in range(procs)]
+
+    # Layout 1: every worker loads model + index (today's multi-worker uvicorn)
+    latencies, rss, wall = _run_workers(_local_worker, lambda i: (per_worker[i], k), procs)
+    _report("local", procs, latencies, rss, wall)
+
+    # Layout 2: thin workers + one shared sidecar (private socket, one-off key)
+    socket_dir = tempfile.mkdtemp(prefix="trustmedai-bench-")
+    address = os.path.join(socket_dir, "sidecar.sock")
+    authkey = secrets.token_hex(32)
+    ctx = mp.get_context("spawn")
+    sidecar = ctx.Process(target=serve, args=(address, authkey), daemon=True)
+    sidecar.start()
+    try:
+        _wait_for_sidecar(address, authkey)
+        latencies, rss, wall = _run_workers(_sidecar_worker, lambda i: (address, authkey, per_worker[i], k), procs)
+        sidecar_rss = SidecarClient(address, authkey).stats()["sidecar_rss_bytes"]
+        _report("sidecar", procs, latencies, rss + sidecar_rss, wall)
+    finally:
+        sidecar.terminate()
+        sidecar.join()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared retrieval sidecar")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="run the sidecar")
+    p_serve.add_argument("--address", default=settings.sidecar_address)
+
+    p_bench = sub.add_parser("bench", help="compare per-worker retrieval vs. sidecar")
+    p_bench.add_argument("--procs", type=int, default=4)
+    p_bench.add_argument("--queries", type=int, default=400)
+    p_bench.add_argument("--k", type=int, default=settings.retrieval_k)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        try:
+            serve(args.address)
+        except (ValueError, PermissionError) as e:
+            parser.error(str(e))
+    else:
+        bench(args.procs, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,502 @@
 import json
+import threading
+import time
+from contextlib import contextmanager
+
 import numpy as np
-from pathlib import Path
 from sentence_transformers import SentenceTransformer
 import faiss
 
+from .calibration import calibrate, load_calibration
+from .embedding_cache import EmbeddingCache, cache_namespace
+from .hits import HIT_FIELDS, Hit, default_fetch_k, mmr_order
+from .index_versions import current_version, version_dir
+from .reduction import load_reduction, project
+from .settings import settings
+from .vector_compression import is_exact, rescore
+
 # ============================================================
-# Paths
+# Model (load once, reuse for all calls and index versions)
 # ============================================================
 
-BASE_DIR = Path(__file__).resolve().parents[3]  # TrustMedAI root directory
-EMBED_DIR = BASE_DIR / "Data/embeddings"
+print("[INFO] Loading embedding model...")
+embedder = SentenceTransformer(settings.embed_model)
+
+# Query embedding cache (shared by all threads of this worker; the
+# optional disk tier is shared by all workers on the box that use the
+# same model). Cached vectors are in the model's space, before any index
+# reduction, so the cache survives index swaps.
+if settings.embed_cache_lowercase is None:
+    _uncased = bool(getattr(getattr(embedder, "tokenizer", None), "do_lower_case", False))
+else:
+    _uncased = settings.embed_cache_lowercase
+
+query_cache = EmbeddingCache(
+    max_bytes=settings.embed_cache_max_bytes,
+    disk_dir=settings.embed_cache_dir,
+    disk_max_bytes=settings.embed_cache_disk_max_bytes,
+    namespace=cache_namespace(settings.embed_model, embedder.get_sentence_embedding_dimension()),
+    dim=embedder.get_sentence_embedding_dimension(),
+    lowercase=_uncased,
+)
 
-INDEX_PATH = EMBED_DIR / "t2dm_index.faiss"
-VECTORS_PATH = EMBED_DIR / "vectors.npy"
-META_PATH = EMBED_DIR / "metadata.json"
 
 # ============================================================
-# Model + Index Loading (load once, reuse for all calls)
+# One loaded index version
 # ============================================================
 
-print("[INFO] Loading embedding model...")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+class LoadedIndex:
+    """
+    FAISS index, metadata and derived lookup tables of one index
+    version (see index_versions). A search runs entirely against one
+    LoadedIndex, so a swap never mixes two versions in one result.
+    """
+
+    def __init__(self, version: str):
+        self.version = version
+        self.inflight = 0  # leased requests (guarded by _swap)
+        directory = version_dir(version)
+
+        print(f"[INFO] Loading FAISS index (version {version})...")
+        self.index = faiss.read_index(str(directory / settings.index_file))
+
+        print("[INFO] Loading vector metadata...")
+        with open(directory / settings.metadata_file, "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+
+        # Full-precision vectors, memory-mapped: only rows used for MMR or for
+        # re-scoring a compressed index are paged in
+        self.embeddings = np.load(directory / settings.vectors_file, mmap_mode="r")
+        self.exact_index = is_exact(self.index)
+
+        # Inner product over unit vectors = cosine similarity. Indexes built
+        # before normalization (L2 over raw vectors) still load; their hits are
+        # scored with cosine computed from the stored vectors.
+        self.cosine_index = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        if not self.cosine_index:
+            print("[WARN] L2 index over raw embeddings; rebuild it with vector_store for cosine search")
+
+        # cosine -> calibrated relevance in [0, 1]
+        self.calibration = load_calibration(directory / settings.calibration_file)
+
+        # Reduced versions: queries are projected like the indexed vectors
+        # (see reduction); query_dim is what the embedding model must give
+        self.reduction = load_reduction(directory / settings.reduction_file)
+        self.query_dim = self.reduction["components"].shape[1] if self.reduction else self.index.d
+
+        # Columnar copy of the metadata: one object array per field, so the
+        # fields of all hits can be gathered with a single fancy-index each
+        # instead of copying dicts hit by hit.
+        self.columns = {
+            field: np.array([item.get(field) for item in self.metadata], dtype=object)
+            for field in HIT_FIELDS
+        }
+
+        # chunk_id -> row, to rebuild hits for chunks retrieved on earlier turns
+        self.chunk_rows = {item["chunk_id"]: row for row, item in enumerate(self.metadata)}
+
+        # Integer id per (source, section) pair, used to dedupe hits by section
+        _, self.section_ids = np.unique(
+            np.array([f"{item['source']}|{item['section']}" for item in self.metadata]),
+            return_inverse=True,
+        )
+
+    def close(self):
+        """Drop the index and tables (only once no request leases this version)."""
+        self.index = self.embeddings = self.metadata = self.reduction = None
+        self.columns = self.chunk_rows = self.section_ids = None
+
+    def select_hits(self, distances, indices, k: int, max_distance=None, dedupe_sections=False):
+        """
+        Vectorized post-processing of one row of FAISS output:
+        drops -1 padding, applies the distance threshold, optionally keeps
+        only the best hit per (source, section), and truncates to k.
+
+        Returns: (rows, distances) numpy arrays
+        """
+
+        rows = indices[0]
+        dists = distances[0]
+
+        # FAISS pads with -1 when k exceeds the number of vectors
+        keep = rows >= 0
+        if max_distance is not None:
+            keep &= dists <= max_distance
+
+        rows = rows[keep]
+        dists = dists[keep]
+
+        if dedupe_sections and rows.size:
+            # Hits are sorted by distance, so the first occurrence of each
+            # section is its best hit
+            _, first = np.unique(self.section_ids[rows], return_index=True)
+            first.sort()
+            rows = rows[first]
+            dists = dists[first]
+
+        return rows[:k], dists[:k]
+
+    def build_hits(self, rows, dists, scores=None) -> list:
+        """
+        Gather all fields for the selected rows column by column and wrap
+        them into Hit objects.
+        """
+
+        gathered = [self.columns[field][rows] for field in HIT_FIELDS]
+        scores = scores.tolist() if scores is not None else [None] * len(rows)
+
+        return [
+            Hit(rank + 1, float(dist), *fields, score=score, index_version=self.version)
+            for rank, (dist, score, *fields) in enumerate(zip(dists.tolist(), scores, *gathered))
+        ]
 
-print("[INFO] Loading FAISS index...")
-index = faiss.read_index(str(INDEX_PATH))
+    def relevance_scores(self, query_vec, rows, dists):
+        """Calibrated relevance (see calibration.py) of the selected rows."""
 
-print("[INFO] Loading vector metadata...")
-with open(META_PATH, "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+        if self.cosine_index:
+            cosine = 1.0 - dists
+        else:
+            cand = np.asarray(self.embeddings[rows], dtype=np.float32)
+            q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+            cosine = (cand @ q) / (np.linalg.norm(cand, axis=1) * np.linalg.norm(q) + 1e-12)
 
-# Convert to numpy for consistency
-embeddings = np.load(VECTORS_PATH)
+        return calibrate(cosine, self.calibration)
+
+    def mmr_select(self, query_vec, rows, k: int, lambda_: float = 0.5):
+        """MMR (see mmr_order) over candidate rows, using the stored chunk embeddings."""
+        return mmr_order(query_vec, self.embeddings[rows], k, lambda_)
+
+    # --------------------------------------------------------
+    # Search
+    # --------------------------------------------------------
+    def prepare_queries(self, query_vecs):
+        """Model-space query vectors -> this version's search space."""
+        query_vecs = np.asarray(query_vecs, dtype=np.float32).reshape(-1, self.query_dim)
+        if self.reduction is not None:
+            return project(query_vecs, self.reduction)  # also unit-normalizes
+        if self.cosine_index:
+            return query_vecs / (np.linalg.norm(query_vecs, axis=1, keepdims=True) + 1e-12)
+        return query_vecs
+
+    def search_rows(self, query_vecs, fetch_k: int) -> tuple:
+        """
+        FAISS search for prepared query vectors (exactly re-scored for a
+        compressed index).
+
+        Returns: (distances, indices); distances are cosine distances for
+        a cosine index, lower is better
+        """
+        index = self.index
+        if self.exact_index:
+            distances, indices = index.search(query_vecs, fetch_k)
+        else:
+            # Compressed index: over-fetch, then re-score exactly
+            distances, indices = index.search(query_vecs, fetch_k * settings.rescore_factor)
+            distances, indices = rescore(self.embeddings, query_vecs, distances, indices, fetch_k, index.metric_type)
+
+        if self.cosine_index:
+            distances = 1.0 - distances  # similarity -> distance, lower is better
+        return distances, indices
+
+    def candidates(self, query_vec, fetch_k: int, max_distance=None, dedupe_sections: bool = False) -> tuple:
+        """
+        The filtered top fetch_k hits of one query, with their stored
+        vectors and the query in search space, so MMR can run over
+        candidates gathered from several shards (see sharding).
+
+        Returns: (list of Hit, float32 (n, d) vectors, float32 (d,) query)
+        """
+        query_vecs = self.prepare_queries(query_vec)[:1]
+        distances, indices = self.search_rows(query_vecs, fetch_k)
+        rows, dists = self.select_hits(distances, indices, fetch_k, max_distance, dedupe_sections)
+        hits = self.build_hits(rows, dists, self.relevance_scores(query_vecs[0], rows, dists))
+        return hits, np.asarray(self.embeddings[rows], dtype=np.float32), query_vecs[0]
+
+    def search_many(self, query_vecs, k: int = 5, max_distance=None, dedupe_sections: bool = False, mmr_lambda=None, fetch_k=None):
+        """See the module-level search_many."""
+
+        query_vecs = self.prepare_queries(query_vecs)
+
+        # 1. Search FAISS index (over-fetch when hits may be filtered out)
+        if fetch_k is None:
+            fetch_k = default_fetch_k(k, max_distance, dedupe_sections, mmr_lambda)
+        distances, indices = self.search_rows(query_vecs, fetch_k)
+
+        results = []
+        for i in range(len(query_vecs)):
+            # 2. Vectorized filtering
+            keep_k = fetch_k if mmr_lambda is not None else k
+            rows, dists = self.select_hits(distances[i:i + 1], indices[i:i + 1], keep_k, max_distance, dedupe_sections)
+
+            # 3. Optional diversity re-ranking
+            if mmr_lambda is not None:
+                order = self.mmr_select(query_vecs[i], rows, k, mmr_lambda)
+                rows, dists = rows[order], dists[order]
+
+            results.append(self.build_hits(rows, dists, self.relevance_scores(query_vecs[i], rows, dists)))
+
+        return results
+
+    def hits_for_chunk_ids(self, chunk_ids) -> list:
+        rows = np.array([self.chunk_rows[cid] for cid in chunk_ids if cid in self.chunk_rows], dtype=np.int64)
+        return self.build_hits(rows, np.zeros(len(rows), dtype=np.float32))
+
+
+# ============================================================
+# Active version + blue/green swaps
+# ============================================================
+# Requests lease the active LoadedIndex for the duration of a call. A
+# swap only replaces the `active` reference; the old version is closed
+# once its leases drain (its memory is freed by refcounting either way).
+
+_swap = threading.Condition()
+active = LoadedIndex(current_version())
+swap_stats = {"swaps": 0, "failed_loads": 0, "draining": 0, "last_swap_at": None}
+
+
+@contextmanager
+def lease():
+    with _swap:
+        idx = active
+        idx.inflight += 1
+    try:
+        yield idx
+    finally:
+        with _swap:
+            idx.inflight -= 1
+            _swap.notify_all()
+
+
+def index_version() -> str:
+    with _swap:
+        return active.version
+
+
+def load_version(version: str) -> LoadedIndex:
+    """Load a version next to the active one and warm it with a real search."""
+    idx = LoadedIndex(version)
+
+    dim = embedder.get_sentence_embedding_dimension()
+    if idx.query_dim != dim:
+        raise ValueError(f"Index version {version} expects {idx.query_dim}d queries, embedding model gives {dim}d")
+
+    idx.search_many(embed_queries(["warm up"]), settings.retrieval_k, mmr_lambda=settings.mmr_lambda)
+    return idx
+
+
+def swap_to(idx: LoadedIndex, drain_seconds: float = None):
+    """Make idx the active version, then wait for the old one to drain and close it."""
+    global active
+    drain_seconds = settings.index_drain_seconds if drain_seconds is None else drain_seconds
+
+    with _swap:
+        old, active = active, idx
+        swap_stats["swaps"] += 1
+        swap_stats["last_swap_at"] = time.time()
+        swap_stats["draining"] += 1
+    print(f"[INFO] Serving index version {idx.version} (was {old.version})")
+
+    with _swap:
+        drained = _swap.wait_for(lambda: old.inflight == 0, timeout=drain_seconds)
+        swap_stats["draining"] -= 1
+    if drained:
+        old.close()
+        print(f"[INFO] Released index version {old.version}")
+    else:
+        # Still leased: the last request holding it frees it
+        print(f"[WARN] Index version {old.version} still has {old.inflight} request(s) after {drain_seconds}s")
+
+
+class IndexWatcher:
+    """
+    Polls the CURRENT pointer and hot-swaps to a newly activated
+    version. A version that fails to load is not retried until the
+    pointer changes again.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._failed = None
+        self._stop = threading.Event()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        version = current_version()
+        if version in (active.version, self._failed):
+            return
+
+        try:
+            idx = load_version(version)
+        except Exception as e:
+            print(f"[WARN] Could not load index version {version}, still serving {active.version}: {e}")
+            swap_stats["failed_loads"] += 1
+            self._failed = version
+            return
+
+        self._failed = None
+        swap_to(idx)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print("[WARN] Index watcher error:", e)
+
+
+watcher = IndexWatcher(settings.index_watch_seconds) if settings.index_watch_seconds > 0 else None
+
+
+# ============================================================
+# Query embedding
+# ============================================================
+
+def embed_queries(queries: list):
+    """
+    Embed several queries, going through the query cache. All misses
+    are encoded in a single model forward pass. Vectors are
+    unit-normalized for a cosine index.
+
+    Returns: float32 array of shape (len(queries), dim)
+    """
+
+    vecs = [query_cache.get(q) for q in queries]
+    missing = [i for i, v in enumerate(vecs) if v is None]
+
+    if missing:
+        encoded = embedder.encode([queries[i] for i in missing], convert_to_numpy=True)
+        for i, vec in zip(missing, encoded):
+            vecs[i] = query_cache.put(queries[i], vec)
+
+    vecs = np.stack(vecs).astype(np.float32, copy=False)
+    with lease() as idx:
+        cosine_index = idx.cosine_index
+    if cosine_index:
+        vecs = vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
+    return vecs
+
+
+def embed_query(query: str):
+    """
+    Embed a single query, going through the query cache.
+
+    Returns: float32 array of shape (1, dim)
+    """
+
+    return embed_queries([query])
+
+
+def embed_texts(texts: list):
+    """
+    Embed passages (e.g. chunk sentences for extractive answers) in one
+    batch, bypassing the query cache so they do not evict real queries.
+
+    Returns: float32 unit-normalized array of shape (len(texts), dim)
+    """
+
+    return embedder.encode(
+        list(texts),
+        batch_size=settings.embed_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32, copy=False)
 
 
 # ============================================================
 # Retrieve top-k chunks
 # ============================================================
 
-def retrieve_chunks(query: str, k: int = 5):
+def search_many(
+    query_vecs,
+    k: int = 5,
+    max_distance=None,
+    dedupe_sections: bool = False,
+    mmr_lambda=None,
+    fetch_k=None,
+):
+    """
+    Search FAISS for a batch of query embeddings of shape (n, dim) in a
+    single index.search call and return the top-k chunks per query.
+    dim is the embedding model's; reduced index versions project the
+    queries themselves.
+
+    max_distance:    drop hits whose cosine distance (raw L2 distance for
+                     old L2 indexes) is above this value
+    dedupe_sections: keep only the best hit per (source, section)
+    mmr_lambda:      if set, re-rank the candidates with MMR for diversity
+    fetch_k:         number of FAISS candidates (default: 4 * k when
+                     filtering or re-ranking, else k)
+
+    Hits carry the index_version they were retrieved from.
+
+    Returns: list (one per query) of lists of Hit
+    """
+
+    with lease() as idx:
+        return idx.search_many(query_vecs, k, max_distance, dedupe_sections, mmr_lambda, fetch_k)
+
+
+def search_chunks(query_vec, k: int = 5, **search_kwargs):
+    """
+    Search FAISS with an already computed query embedding of shape
+    (1, dim) and return the top-k chunks.
+    Keyword arguments are passed on to search_many.
+
+    Returns: list of Hit
+    """
+
+    return search_many(query_vec, k, **search_kwargs)[0]
+
+
+def retrieve_chunks(query: str, k: int = 5, **search_kwargs):
     """
     Given a user query, embed it, search FAISS, and return the
     top-k most relevant chunks with metadata.
+    Keyword arguments are passed on to search_many.
 
-    Returns: list of dicts
+    Returns: list of Hit
     """
 
     print(f"[INFO] Retrieving for query: {query}")
 
-    # 1. Embed user query
-    query_vec = embedder.encode([query], convert_to_numpy=True)
+    query_vec = embed_query(query)
+    return search_chunks(query_vec, k, **search_kwargs)
+
+
+def candidates(query_vec, fetch_k: int, max_distance=None, dedupe_sections: bool = False) -> tuple:
+    """See LoadedIndex.candidates (active version)."""
 
-    # 2. Search FAISS index
-    distances, indices = index.search(query_vec, k)
+    with lease() as idx:
+        return idx.candidates(query_vec, fetch_k, max_distance, dedupe_sections)
 
-    results = []
 
-    for rank, idx in enumerate(indices[0]):
-        item = metadata[idx]
+def hits_for_chunk_ids(chunk_ids) -> list:
+    """
+    Rebuild Hit objects for known chunk_ids (unknown ids are skipped)
+    from the active index version. Distances are not meaningful here
+    and are set to 0.
+    """
+
+    with lease() as idx:
+        return idx.hits_for_chunk_ids(chunk_ids)
 
-        results.append({
-            "rank": rank + 1,
-            "text": item["text"],
-            "source": item["source"],
-            "section": item["section"],
-            "subsection": item["subsection"],
-            "chunk_id": item["chunk_id"],
-            "distance": float(distances[0][rank])
-        })
 
-    return results
+def stats() -> dict:
+    # Leased: a concurrent swap must not close the version being described
+    with lease() as idx:
+        return {
+            "embedding_cache": query_cache.stats(),
+            "index_version": idx.version,
+            "chunks": idx.index.ntotal,
+            "index_type": type(idx.index).__name__,
+            "dims": idx.index.d,
+            "reduction": idx.reduction["method"] if idx.reduction else None,
+            "metric": "cosine" if idx.cosine_index else "l2",
+            "index_swaps": dict(swap_stats),
+        }
 
 
 # ============================================================
@@ -80,5 +508,5 @@ if __name__ == "__main__":
     hits = retrieve_chunks(q, k=3)
     for h in hits:
         print("\n---")
-        print(f"[{h['rank']}] {h['source']} → {h['section']} / {h['subsection']}")
-        print(h["text"])
\ No newline at end of file
+        print(f"[{h.rank}] {h.source} → {h.section} / {h.subsection} (score {h.score:.2f})")
+        print(h.text)
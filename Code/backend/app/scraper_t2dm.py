@@ -1,18 +1,17 @@
+import argparse
 import os
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import json
 
+from .settings import settings
+
 # -------------------------------------------------------
 # Paths
 # -------------------------------------------------------
-BASE_DIR = Path(__file__).resolve().parents[3]  # TrustMedAI/
-RAW_DIR = BASE_DIR / "Data" / "raw"
-PROCESSED_DIR = BASE_DIR / "Data" / "processed"
-
-RAW_DIR.mkdir(parents=True, exist_ok=True)
-PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+RAW_DIR = settings.raw_dir
+PROCESSED_DIR = settings.processed_dir
 
 # -------------------------------------------------------
 # Sources to scrape
@@ -63,16 +62,61 @@ def save_raw_html(source_id: str, html: str):
     """
     Save raw HTML to Data/raw/<id>.html
     """
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
     out_file = RAW_DIR / f"{source_id}.html"
     out_file.write_text(html, encoding="utf-8")
     print(f"[INFO] Saved raw HTML → {out_file}")
 
 
+# -------------------------------------------------------
+# Parsing helpers
+# -------------------------------------------------------
+
+# Only these tags are ever read by the parsers below. Restricting the
+# lxml tree build to them (and their children) skips scripts, nav,
+# footers, etc. and is where most of the parse time goes.
+MAYO_STRAINER = SoupStrainer("article")
+GENERIC_STRAINER = SoupStrainer(["h1", "h2", "h3", "p", "ul"])
+
+
+def make_soup(html: str, strainer: SoupStrainer, fast: bool = True) -> BeautifulSoup:
+    """
+    Build the soup for a parser. fast=False parses the full document,
+    which is what the strainer-restricted output is verified against.
+    """
+    if fast:
+        return BeautifulSoup(html, "lxml", parse_only=strainer)
+    return BeautifulSoup(html, "lxml")
+
+
+# <li> tags come in the same find_all pass as the headings and
+# paragraphs, after the <ul> they belong to. Each collected <ul> leaves
+# a list in the section content that its items are added to as the
+# pass reaches them: the same bullets, in the same place, as a
+# ul.find_all("li") per list gave (a nested item counts once for every
+# list containing it).
+def add_list_item(li, open_lists: dict, bullet: str):
+    for parent in li.parents:
+        bullets = open_lists.get(id(parent))
+        if bullets is not None:
+            bullets.append(bullet)
+
+
+def flatten_content(content: list) -> list:
+    flat = []
+    for item in content:
+        if isinstance(item, list):
+            flat.extend(item)
+        else:
+            flat.append(item)
+    return flat
+
+
 # -------------------------------------------------------
 # Site-specific parsers
 # -------------------------------------------------------
-def parse_mayo_to_json(html: str) -> list:
-    soup = BeautifulSoup(html, "lxml")
+def parse_mayo_to_json(html: str, fast: bool = True) -> list:
+    soup = make_soup(html, MAYO_STRAINER, fast)
     article = soup.find("article")
 
     if not article:
@@ -95,8 +139,11 @@ def parse_mayo_to_json(html: str) -> list:
     current_subsection = None
 
     structured = {}  # { section_name: { subsection_name: [content] } }
+    open_lists = {}  # id(<ul>) -> its bullets, see add_list_item
 
-    for tag in article.descendants:
+    # Same document order as walking article.descendants, but without
+    # visiting every text node and inline tag in Python
+    for tag in article.find_all(["h2", "h3", "p", "ul", "li"]):
 
         # MAIN SECTIONS = <h2>
         if tag.name == "h2":
@@ -144,12 +191,11 @@ def parse_mayo_to_json(html: str) -> list:
             if current_section is None:
                 continue
 
-            bullets = [
-                "- " + li.get_text(strip=True)
-                for li in tag.find_all("li")
-            ]
+            bullets = open_lists[id(tag)] = []
+            structured[current_section][current_subsection].append(bullets)
 
-            structured[current_section][current_subsection].extend(bullets)
+        elif tag.name == "li":
+            add_list_item(tag, open_lists, "- " + tag.get_text(strip=True))
 
     # Convert nested dict → list format
     final = []
@@ -162,7 +208,7 @@ def parse_mayo_to_json(html: str) -> list:
         for sub, content in subsecs.items():
             section_entry["subsections"].append({
                 "title": sub,
-                "content": content
+                "content": flatten_content(content)
             })
 
         final.append(section_entry)
@@ -170,14 +216,14 @@ def parse_mayo_to_json(html: str) -> list:
     return final
 
 
-def parse_generic_site_to_json(html: str) -> list:
+def parse_generic_site_to_json(html: str, fast: bool = True) -> list:
     """
     Structured parser for NIH, MedlinePlus, etc.
     Extracts <h2>, <h3>, <p>, and <ul><li> into a clean hierarchical JSON format.
 
     """
 
-    soup = BeautifulSoup(html, "lxml")
+    soup = make_soup(html, GENERIC_STRAINER, fast)
 
     # Sections to ignore across all sites
     IGNORE_SECTIONS = [
@@ -204,11 +250,12 @@ def parse_generic_site_to_json(html: str) -> list:
     ]
 
     structured = {}
+    open_lists = {}  # id(<ul>) -> its bullets, see add_list_item
     current_section = None
     current_subsection = None
 
-    # Get all meaningful content tags in order
-    content_tags = soup.find_all(["h1", "h2", "h3", "p", "ul"])
+    # Get all meaningful content tags in order, list items included
+    content_tags = soup.find_all(["h1", "h2", "h3", "p", "ul", "li"])
 
     for tag in content_tags:
 
@@ -270,10 +317,17 @@ def parse_generic_site_to_json(html: str) -> list:
             if not current_section:
                 continue
 
-            for li in tag.find_all("li"):
-                bullet = li.get_text(strip=True)
-                if bullet:
-                    structured[current_section][current_subsection].append(f"- {bullet}")
+            bullets = open_lists[id(tag)] = []
+            structured[current_section][current_subsection].append(bullets)
+            continue
+
+        # ========================
+        # LIST ITEM (of a <ul> above)
+        # ========================
+        if tag.name == "li":
+            bullet = tag.get_text(strip=True)
+            if bullet:
+                add_list_item(tag, open_lists, f"- {bullet}")
 
             continue
 
@@ -290,7 +344,7 @@ def parse_generic_site_to_json(html: str) -> list:
         for sub, content in subsecs.items():
             section_entry["subsections"].append({
                 "title": sub,
-                "content": content
+                "content": flatten_content(content)
             })
 
         final.append(section_entry)
@@ -299,47 +353,136 @@ def parse_generic_site_to_json(html: str) -> list:
 
 
 
+def parse_source(site: str, html: str, fast: bool = True) -> list:
+    """
+    Dispatch to the parser for a site. Module-level so it can run in a
+    process pool.
+    """
+    if site == "mayo":
+        return parse_mayo_to_json(html, fast)
+    return parse_generic_site_to_json(html, fast)
+
+
+def parse_sources(pages: list, workers: int = None, fast: bool = True) -> list:
+    """
+    Parse [(site, html), ...] in a process pool (parsing is CPU bound).
+    workers=0 uses one process per CPU; workers=1 parses serially.
+    Defaults to settings.parse_workers.
+
+    Returns: list of parsed results, in input order
+    """
+    if workers is None:
+        workers = settings.parse_workers
+
+    if workers == 1 or len(pages) <= 1:
+        return [parse_source(site, html, fast) for site, html in pages]
+
+    max_workers = min(workers or os.cpu_count() or 1, len(pages))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(
+            parse_source,
+            [site for site, _ in pages],
+            [html for _, html in pages],
+            [fast] * len(pages),
+        ))
+
+
+def load_raw_html(source_id: str) -> str:
+    return (RAW_DIR / f"{source_id}.html").read_text(encoding="utf-8")
+
+
+def dump_json(data: list) -> bytes:
+    """Exact bytes written by save_json."""
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+
 def save_json(source_id: str, data: list):
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
     out_file = PROCESSED_DIR / f"{source_id}.json"
-    with open(out_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    out_file.write_bytes(dump_json(data))
     print(f"[INFO] Saved processed JSON → {out_file}")
 
 
+# -------------------------------------------------------
+# Verification: fast parse path vs. full-tree parse
+# -------------------------------------------------------
+def verify_fast_parsers(workers: int = None) -> bool:
+    """
+    Parse every saved Data/raw/<id>.html fixture both ways and check
+    that the serialized JSON is byte-identical to each other and to the
+    committed Data/processed/<id>.json (the output of the parsers as
+    they were before the fast path, so a regression in both paths is
+    caught too).
+    """
+    sources = [src for src in T2DM_SOURCES if (RAW_DIR / f"{src['id']}.html").exists()]
+    pages = [(src["site"], load_raw_html(src["id"])) for src in sources]
+
+    reference = parse_sources(pages, workers=1, fast=False)
+    fast = parse_sources(pages, workers=workers, fast=True)
+
+    ok = True
+    for src, ref_data, fast_data in zip(sources, reference, fast):
+        same = dump_json(ref_data) == dump_json(fast_data)
+        committed_path = PROCESSED_DIR / f"{src['id']}.json"
+        if committed_path.exists():
+            same = same and committed_path.read_bytes() == dump_json(fast_data)
+        ok = ok and same
+        print(f"[{'OK' if same else 'FAIL'}] {src['id']}")
+
+    return ok
+
+
 # -------------------------------------------------------
 # Main scraper orchestrator
 # -------------------------------------------------------
-def main():
+def scrape(from_raw: bool = False, workers: int = None):
+    """
+    Step 1 (I/O):  fetch + save raw HTML for every source
+                   (skipped with from_raw=True: re-parse Data/raw)
+    Step 2 (CPU):  parse all pages in a process pool
+    """
+    pages = []
     for src in T2DM_SOURCES:
         sid = src["id"]
-        url = src["url"]
-        site = src["site"]
 
         print("\n" + "="*60)
         print(f"[INFO] Processing source: {sid}")
         print("="*60)
 
-        # Step 1: Fetch HTML
-        html = fetch_html(url)
+        if from_raw:
+            html = load_raw_html(sid)
+        else:
+            # Fetch HTML + save raw HTML
+            html = fetch_html(src["url"])
+            save_raw_html(sid, html)
 
-        # Step 2: Save raw HTML
-        save_raw_html(sid, html)
+        pages.append((src["site"], html))
 
-        # Step 3: Site-specific parsing
-        # Process HTML based on site
-        if site == "mayo":
-            processed = parse_mayo_to_json(html)
-        else:
-            processed = parse_generic_site_to_json(html)
+    # Site-specific parsing, all sources in parallel
+    results = parse_sources(pages, workers=workers)
 
-        # Save JSON output
+    # Save JSON output
+    for src, processed in zip(T2DM_SOURCES, results):
         if processed:
-            save_json(sid, processed)
+            save_json(src["id"], processed)
         else:
-            print(f"[WARN] No processed data extracted for {sid}.")
+            print(f"[WARN] No processed data extracted for {src['id']}.")
 
     print("\n[INFO] Scraping complete!")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Scrape + parse T2DM sources")
+    parser.add_argument("--from-raw", action="store_true", help="re-parse saved Data/raw/*.html instead of fetching")
+    parser.add_argument("--workers", type=int, default=settings.parse_workers, help="parse processes (0 = one per CPU)")
+    parser.add_argument("--verify", action="store_true", help="check both parser paths against Data/processed on Data/raw")
+    args = parser.parse_args()
+
+    if args.verify:
+        raise SystemExit(0 if verify_fast_parsers(args.workers) else 1)
+
+    scrape(from_raw=args.from_raw, workers=args.workers)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Optional
+
+import numpy as np
+
+
+# ============================================================
+# One conversation
+# ============================================================
+
+class Session:
+    """
+    Server-side state of one chat conversation: a bounded history of
+    turns plus what retrieval produced last time, so follow-ups can be
+    answered warm.
+    """
+
+    def __init__(self, session_id: str, max_turns: int):
+        self.id = session_id
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+
+        # (question, answer) pairs, oldest dropped first
+        self.turns = deque(maxlen=max_turns)
+
+        # Query embedding of the previous turn (blended into follow-ups)
+        self.query_vec: Optional[np.ndarray] = None
+
+        # chunk_ids retrieved so far, in first-seen order
+        self.chunk_ids = []
+
+        # chunk_ids of the conversation's first context, kept in a
+        # Gemini context cache for the follow-up turns
+        self.stable_chunk_ids = ()
+
+        # Serializes concurrent requests on the same conversation
+        self.lock = threading.Lock()
+
+    def add_turn(self, question: str, answer: str, query_vec: np.ndarray, chunk_ids: list):
+        self.turns.append((question, answer))
+        self.query_vec = query_vec
+
+        seen = set(self.chunk_ids)
+        self.chunk_ids.extend(cid for cid in chunk_ids if cid not in seen)
+
+    def history_text(self) -> str:
+        lines = []
+        for question, answer in self.turns:
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+    def nbytes(self) -> int:
+        """Rough memory footprint used for the store's byte cap."""
+        size = sum(len(q) + len(a) for q, a in self.turns)
+        size += sum(len(cid) for cid in self.chunk_ids)
+        if self.query_vec is not None:
+            size += self.query_vec.nbytes
+        return size + 512  # object overhead
+
+
+# ============================================================
+# Session store with TTL + memory cap
+# ============================================================
+
+class SessionStore:
+    """
+    Thread-safe in-memory session store.
+
+    Sessions idle for longer than ttl_seconds are dropped, and the least
+    recently used sessions are dropped while the total footprint is
+    above max_bytes.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int, max_turns: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+
+        self._sessions = OrderedDict()  # id -> Session, LRU order
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.evicted = 0
+
+    def _sweep(self):
+        # caller holds the lock; LRU order means expired sessions are first
+        cutoff = time.time() - self.ttl_seconds
+
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_seen >= cutoff and self._bytes <= self.max_bytes:
+                break
+            del self._sessions[oldest.id]
+            self._bytes -= self._sizes.pop(oldest.id)
+            self.evicted += 1
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """
+        The live session with this id, else a new one. New sessions always
+        get a fresh random id (never the client's), so an unknown or
+        expired id cannot be chosen, guessed or revived.
+        """
+        with self._lock:
+            self._sweep()
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(uuid.uuid4().hex, self.max_turns)
+                self._sessions[session.id] = session
+                self._sizes[session.id] = session.nbytes()
+                self._bytes += self._sizes[session.id]
+            else:
+                self._sessions.move_to_end(session.id)
+
+            session.last_seen = time.time()
+
+        return session
+
+    def update(self, session: Session):
+        """Re-account a session's size after a turn and enforce the caps."""
+        with self._lock:
+            if session.id in self._sessions:
+                size = session.nbytes()
+                self._bytes += size - self._sizes[session.id]
+                self._sizes[session.id] = size
+                session.last_seen = time.time()
+                self._sessions.move_to_end(session.id)
+            self._sweep()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+            }
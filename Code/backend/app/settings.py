@@ -0,0 +1,239 @@
+"""
+Deployment settings for the TrustMedAI backend and offline pipeline.
+
+Values are resolved in this order (later wins):
+  1. the defaults below
+  2. a JSON file named by TRUSTMED_SETTINGS_FILE
+  3. TRUSTMED_<FIELD> environment variables (also read from .env),
+     e.g. TRUSTMED_EMBED_BATCH_SIZE=128 or TRUSTMED_DATA_DIR=/srv/data
+
+Print the effective settings with:  python -m app.settings
+"""
+
+import json
+import os
+import tempfile
+import typing
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ENV_PREFIX = "TRUSTMED_"
+BASE_DIR = Path(__file__).resolve().parents[3]  # TrustMedAI root directory
+
+
+def private_runtime_dir() -> Path:
+    """Per-user directory for local sockets (created 0700 by whoever serves on it)."""
+    base = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(base) / f"trustmedai-{os.getuid()}"
+
+
+@dataclass(frozen=True)
+class Settings:
+    # ---------------- Data layout ----------------
+    data_dir: Path = BASE_DIR / "Data"
+    raw_dir: Optional[Path] = None          # default: <data_dir>/raw
+    processed_dir: Optional[Path] = None    # default: <data_dir>/processed
+    embed_dir: Optional[Path] = None        # default: <data_dir>/embeddings
+    static_audio_dir: Optional[Path] = None  # default: <data_dir>/audio
+
+    index_file: str = "t2dm_index.faiss"
+    vectors_file: str = "vectors.npy"
+    metadata_file: str = "metadata.json"
+    calibration_file: str = "calibration.json"
+    reduction_file: str = "reduction.npz"   # only in reduced index versions (see reduction)
+    index_pointer_file: str = "CURRENT"     # names the live version (see index_versions)
+    forum_raw_file: str = "forum_raw.json"
+    forum_processed_file: str = "forums_t2dm.json"
+    pipeline_state_file: str = ".pipeline_state.json"
+
+    # ---------------- Models ----------------
+    embed_model: str = "all-MiniLM-L6-v2"
+    llm_model: str = "gemini-2.5-flash"
+    llm_backend: str = "gemini"             # "gemini" | "fake" (offline)
+    fake_llm_latency: str = "fixed:0"       # see fake_upstreams.parse_latency
+    fake_llm_error_rate: float = 0.0
+
+    # ---------------- Text-to-speech ----------------
+    elevenlabs_base_url: str = "https://api.elevenlabs.io"
+    tts_timeout_seconds: float = 30.0
+    tts_provider: str = "elevenlabs"        # "elevenlabs" | "cartesia" (speech pipeline)
+    tts_max_parallel: int = 3               # sentences synthesized at once per answer
+    speech_max_queued_events: int = 32      # /chat/speech events buffered for a slow client
+
+    # ---------------- Throughput knobs ----------------
+    embed_batch_size: int = 64
+    parse_workers: int = 0                  # 0 = one process per CPU
+    embed_cache_max_bytes: int = 32 * 1024 * 1024
+    embed_cache_dir: Optional[Path] = None  # shared on-disk tier (off by default)
+    embed_cache_disk_max_bytes: int = 256 * 1024 * 1024  # per model; least recently used files are deleted
+    embed_cache_lowercase: Optional[bool] = None  # None = from the model's tokenizer (do_lower_case)
+
+    # ---------------- Retrieval ----------------
+    retrieval_k: int = 5
+    mmr_lambda: Optional[float] = None      # None = no MMR re-ranking
+    vector_storage: str = "flat"            # "flat" | "fp16" | "pq" (see vector_compression)
+    pq_m: int = 48                          # PQ sub-vectors (must divide the dimension)
+    pq_nbits: int = 8
+    rescore_factor: int = 4                 # compressed index: candidates re-scored per kept hit
+    reduce_dims: Optional[int] = None       # index dimension after reduction at build time; None = model's
+    reduce_method: str = "pca"              # "pca" | "truncate" (Matryoshka models only, see reduction)
+    relevance_floor: Optional[float] = 0.25  # calibrated score; below it Gemini is not called
+    extractive_min_score: Optional[float] = 0.9  # top-chunk calibrated score to answer without Gemini; None = off
+    extractive_min_sentence_cosine: float = 0.5
+    extractive_max_sentences: int = 3
+    extractive_sources: str = "ada_t2dm,medlineplus_t2dm"  # comma-separated source ids
+    index_watch_seconds: float = 10.0       # poll for a new index version; 0 = no hot-swap
+    index_drain_seconds: float = 60.0       # wait for requests on the old version before freeing it
+    index_keep_versions: int = 3            # built versions kept on disk (for rollback)
+
+    # ---------------- Serving layout ----------------
+    retrieval_backend: str = "local"        # "local" | "sidecar" | "sharded"
+    sidecar_address: Optional[str] = None   # default: <private runtime dir>/retrieval.sock; or "host:port"
+    sidecar_authkey: str = ""               # shared secret, required to serve or reach the sidecar
+    sidecar_timeout_seconds: float = 10.0   # per call; a wedged sidecar fails the request instead of hanging it
+    sidecar_batch_window_ms: float = 2.0
+    sidecar_max_batch: int = 64
+    shard_addresses: str = ""               # comma-separated sidecar addresses, one per shard (see sharding)
+    shard_timeout_seconds: float = 0.5      # slower shards are left out of the merge
+    shard_embed_timeout_seconds: float = 10.0  # query embedding on a shard (not a scatter-gather call)
+
+    # ---------------- Admission control (per API worker) ----------------
+    admission_enabled: bool = True
+    admission_max_concurrency: int = 8      # /chat + /tts requests running at once
+    chat_max_queue: int = 32
+    tts_max_queue: int = 16
+    batch_max_queue: int = 8                # requests sent with "X-Request-Class: batch"
+    chat_queue_deadline_seconds: float = 10.0  # expected wait above this -> 503
+    tts_queue_deadline_seconds: float = 5.0
+    batch_queue_deadline_seconds: float = 2.0
+    chat_rate_per_minute: float = 30.0      # per client; 0 = unlimited
+    tts_rate_per_minute: float = 60.0
+    batch_rate_per_minute: float = 0.0
+    client_burst: int = 10                  # token bucket size
+    coalesce_requests: bool = True          # identical in-flight /chat and TTS calls share one upstream call
+    coalesce_max_wait_seconds: float = 120.0  # a follower waiting longer makes its own upstream call
+
+    # ---------------- Conversation sessions ----------------
+    session_ttl_seconds: int = 30 * 60
+    session_max_bytes: int = 64 * 1024 * 1024
+    session_max_turns: int = 6
+    followup_weight: float = 0.3            # share of the previous query vector
+    gemini_cache_ttl_seconds: int = 30 * 60
+    context_cache_max_handles: int = 64
+    context_cache_min_uses: int = 2         # retrievals before a chunk set is cached
+    context_cache_min_tokens: int = 1024    # Gemini's minimum cached-content size
+
+    # ---------------- Offline pipeline ----------------
+    forum_max_threads: int = 200
+    dedupe_threshold: float = 0.80
+    pipeline_workers: int = 4               # pipeline stages run at once (see app.pipeline)
+
+    def __post_init__(self):
+        defaults = (
+            ("raw_dir", "raw"),
+            ("processed_dir", "processed"),
+            ("embed_dir", "embeddings"),
+            ("static_audio_dir", "audio"),
+        )
+        for name, sub in defaults:
+            if getattr(self, name) is None:
+                object.__setattr__(self, name, self.data_dir / sub)
+        if self.sidecar_address is None:
+            object.__setattr__(self, "sidecar_address", str(private_runtime_dir() / "retrieval.sock"))
+
+    # ---------------- Derived paths ----------------
+    @property
+    def active_embed_dir(self) -> Path:
+        """Directory of the live index version (embed_dir itself before versioned builds)."""
+        pointer = self.embed_dir / self.index_pointer_file
+        if pointer.exists():
+            return self.embed_dir / "versions" / pointer.read_text(encoding="utf-8").strip()
+        return self.embed_dir
+
+    @property
+    def index_path(self) -> Path:
+        return self.active_embed_dir / self.index_file
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.active_embed_dir / self.vectors_file
+
+    @property
+    def meta_path(self) -> Path:
+        return self.active_embed_dir / self.metadata_file
+
+    @property
+    def calibration_path(self) -> Path:
+        return self.active_embed_dir / self.calibration_file
+
+    @property
+    def reduction_path(self) -> Path:
+        return self.active_embed_dir / self.reduction_file
+
+    @property
+    def pipeline_state_path(self) -> Path:
+        return self.data_dir / self.pipeline_state_file
+
+    @property
+    def forum_raw_path(self) -> Path:
+        return self.raw_dir / self.forum_raw_file
+
+    @property
+    def forum_processed_path(self) -> Path:
+        return self.processed_dir / self.forum_processed_file
+
+
+# ============================================================
+# Loading
+# ============================================================
+
+def _coerce(value, annotation):
+    """Convert a raw env/file value to the field's declared type."""
+    if typing.get_origin(annotation) is typing.Union:
+        if value is None or (isinstance(value, str) and value.strip().lower() in ("", "none", "null")):
+            return None
+        annotation = next(a for a in typing.get_args(annotation) if a is not type(None))
+
+    if annotation is Path:
+        return Path(value).expanduser()
+    if annotation is bool:
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    return annotation(value)
+
+
+def load_settings(path: Optional[str] = None) -> Settings:
+    """
+    Build Settings from defaults, an optional JSON file and the
+    environment. Unknown keys in the file are rejected.
+    """
+    overrides = {}
+    types = {f.name: f.type for f in fields(Settings)}
+
+    path = path or os.getenv(ENV_PREFIX + "SETTINGS_FILE")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            file_values = json.load(f)
+        unknown = set(file_values) - set(types)
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {sorted(unknown)}")
+        overrides.update(file_values)
+
+    for name in types:
+        env_value = os.getenv(ENV_PREFIX + name.upper())
+        if env_value is not None:
+            overrides[name] = env_value
+
+    return Settings(**{name: _coerce(value, types[name]) for name, value in overrides.items()})
+
+
+settings = load_settings()
+
+
+if __name__ == "__main__":
+    for key, value in asdict(settings).items():
+        print(f"{key:24s} {value}")
@@ -0,0 +1,483 @@
+"""
+Sharded scatter-gather retrieval.
+
+The index is split into N shards, each served by its own retrieval
+sidecar process (possibly on another node). The API sends every search
+to all shards in parallel and merges the hits globally by distance.
+Every shard carries the calibration of the full index, so calibrated
+scores from different shards are comparable too.
+
+A shard that errors or misses settings.shard_timeout_seconds is left
+out and the answer is built from the shards that did reply (counted as
+a partial result in /health).
+
+  Split the live index:   python -m app.sharding build --shards 4 --by source
+  Serve the shards:       TRUSTMED_SIDECAR_AUTHKEY=<secret> python -m app.sharding serve --shards 4 --base-port 7601
+  Point the API at them:  TRUSTMED_SIDECAR_AUTHKEY=<secret> TRUSTMED_RETRIEVAL_BACKEND=sharded \\
+                          TRUSTMED_SHARD_ADDRESSES=127.0.0.1:7601,127.0.0.1:7602,... uvicorn app.main:app
+  Scaling benchmark:      python -m app.sharding bench --shards 1 2 4 --scale 200
+
+Shards live in <embed_dir>/shards/shard-<i>/ with the usual versioned
+layout (see index_versions), so each shard server hot-swaps when its
+shard is rebuilt. With MMR, every shard returns its filtered candidates
+with their vectors and MMR runs once over the merged pool, so results
+match a single index over the same chunks.
+"""
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from .calibration import load_calibration, save_calibration
+from .hits import default_fetch_k, mmr_order
+from .index_versions import activate, current_version, versions_root
+from .reduction import load_reduction, save_reduction
+from .retrieval_sidecar import SidecarClient, _wait_for_sidecar, check_authkey, load_bench_queries, rss_bytes
+from .settings import settings
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+# ============================================================
+# Building shards
+# ============================================================
+
+def partition(metadata: list, n: int, by: str = "source") -> list:
+    """
+    Row indices per shard.
+
+    source: whole sources per shard, largest first onto the smallest shard
+    hash:   crc32(chunk_id) % n (even split, any number of shards)
+    """
+    if by == "hash":
+        shard_of = np.array([zlib.crc32(m["chunk_id"].encode("utf-8")) % n for m in metadata])
+        return [np.flatnonzero(shard_of == i) for i in range(n)]
+
+    if by != "source":
+        raise ValueError(f"Unknown sharding key: {by!r} (choose source or hash)")
+
+    by_source = {}
+    for row, m in enumerate(metadata):
+        by_source.setdefault(m["source"], []).append(row)
+    if len(by_source) < n:
+        raise ValueError(f"Only {len(by_source)} sources for {n} shards; use --by hash")
+
+    shards = [[] for _ in range(n)]
+    for rows in sorted(by_source.values(), key=len, reverse=True):
+        min(shards, key=len).extend(rows)
+    return [np.array(sorted(rows), dtype=np.int64) for rows in shards]
+
+
+def replicate(metadata: list, vectors: np.ndarray, scale: int, noise: float = 0.05, seed: int = 0) -> tuple:
+    """Synthetic larger corpus for benchmarks: `scale` jittered copies of every chunk."""
+    rng = np.random.default_rng(seed)
+    meta_out, parts = [], []
+    for r in range(scale):
+        copy = vectors + (rng.normal(0.0, noise, vectors.shape).astype(np.float32) if r else 0.0)
+        parts.append(copy / (np.linalg.norm(copy, axis=1, keepdims=True) + 1e-12))
+        meta_out.extend(m if not r else {**m, "chunk_id": f"{m['chunk_id']}#{r}"} for m in metadata)
+    return meta_out, np.vstack(parts).astype(np.float32)
+
+
+def build_shards(n: int, by: str = "source", shard_root: Path = None, scale: int = 1) -> list:
+    """
+    Split the live index version into n shards under shard_root
+    (default <embed_dir>/shards). Each shard gets the same version name
+    and the global calibration (and projection, for a reduced index).
+
+    Returns: shard embed dirs
+    """
+    # Index building only happens offline; API workers never load faiss
+    import faiss
+    from .vector_compression import make_index
+
+    version = current_version()
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    vectors = np.load(settings.vectors_path)
+    calibration = load_calibration(settings.calibration_path)
+    reduction = load_reduction(settings.reduction_path)
+
+    if scale > 1:
+        metadata, vectors = replicate(metadata, vectors, scale)
+        version = f"{version}-x{scale}"
+
+    shard_root = Path(shard_root or settings.embed_dir / "shards")
+    dirs = []
+    for i, rows in enumerate(partition(metadata, n, by)):
+        if not len(rows):
+            raise ValueError(f"Shard {i} of {n} would be empty")
+
+        shard_dir = shard_root / f"shard-{i}"
+        out = versions_root(shard_dir) / version
+        if out.exists():
+            shutil.rmtree(out)
+        out.mkdir(parents=True)
+
+        index = make_index(vectors[rows], settings.vector_storage, settings.pq_m, settings.pq_nbits)
+        faiss.write_index(index, str(out / settings.index_file))
+        np.save(out / settings.vectors_file, vectors[rows])
+        with open(out / settings.metadata_file, "w", encoding="utf-8") as f:
+            json.dump([metadata[r] for r in rows], f)
+        save_calibration(calibration, out / settings.calibration_file)
+        if reduction is not None:
+            save_reduction(reduction, out / settings.reduction_file)
+
+        activate(version, shard_dir)
+        print(f"[INFO] Shard {i}: {len(rows)} chunks -> {shard_dir}")
+        dirs.append(shard_dir)
+
+    return dirs
+
+
+def launch_shard_servers(shard_dirs: list, addresses: list, authkey: str, log_path: Path = None) -> list:
+    """One retrieval sidecar process per shard dir, all with the given authkey."""
+    check_authkey(authkey)
+    log = open(log_path, "a") if log_path else subprocess.DEVNULL
+    procs = []
+    for shard_dir, address in zip(shard_dirs, addresses):
+        env = dict(os.environ, TRUSTMED_EMBED_DIR=str(shard_dir), TRUSTMED_SIDECAR_AUTHKEY=authkey)
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "app.retrieval_sidecar", "serve", "--address", address],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        ))
+    for address in addresses:
+        _wait_for_sidecar(address, authkey)
+    return procs
+
+
+# ============================================================
+# Scatter-gather client (used by API workers)
+# ============================================================
+
+class ShardedClient:
+    """
+    Same interface as the retriever module / SidecarClient. Searches go
+    to every shard and wait at most `timeout`; embeddings come from the
+    first shard that answers within `embed_timeout`.
+    """
+
+    def __init__(self, addresses: list, authkey: str, timeout: float, embed_timeout: float = None):
+        if not addresses:
+            raise ValueError("No shard addresses configured (settings.shard_addresses)")
+        self.addresses = list(addresses)
+        self.timeout = timeout
+        self.shards = [SidecarClient(a, authkey, timeout) for a in self.addresses]
+        # Separate connections: a cold model forward pass must not hit the search deadline
+        self.embedders = [SidecarClient(a, authkey, embed_timeout) for a in self.addresses]
+        self.pool = ThreadPoolExecutor(max_workers=8 * len(self.shards), thread_name_prefix="shard")
+
+        self._lock = threading.Lock()
+        self.counters = {"searches": 0, "partial_results": 0, "shard_timeouts": 0, "shard_errors": 0}
+        self._next_embedder = 0
+        self._versions = [None] * len(self.shards)  # last index version seen per shard
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _scatter(self, method: str, *args, shards: list = None, **kwargs) -> list:
+        """
+        Call method on every shard (or the given shard positions) in
+        parallel; None for shards that failed or timed out.
+        """
+        positions = range(len(self.shards)) if shards is None else shards
+        futures = [self.pool.submit(getattr(self.shards[i], method), *args, **kwargs) for i in positions]
+        wait(futures, timeout=self.timeout)
+
+        results = []
+        for i, future in zip(positions, futures):
+            address = self.addresses[i]
+            if not future.done():
+                self._count("shard_timeouts")
+                print(f"[WARN] Shard {address} timed out after {self.timeout}s ({method})")
+                results.append(None)
+            elif future.exception() is not None:
+                error = future.exception()
+                self._count("shard_timeouts" if isinstance(error, TimeoutError) else "shard_errors")
+                print(f"[WARN] Shard {address} failed ({method}): {error}")
+                results.append(None)
+            else:
+                results.append(future.result())
+        return results
+
+    def _answered(self, per_shard: list) -> list:
+        answered = [result for result in per_shard if result is not None]
+        self._count("searches")
+        if not answered:
+            raise ConnectionError("No index shard answered")
+        if len(answered) < len(per_shard):
+            self._count("partial_results")
+        return answered
+
+    # ---------------- Embedding ----------------
+
+    def _embed(self, method: str, texts: list):
+        """First shard (round-robin) that embeds the texts."""
+        with self._lock:
+            start = self._next_embedder
+            self._next_embedder = (start + 1) % len(self.embedders)
+
+        last_error = None
+        for i in range(len(self.embedders)):
+            embedder = self.embedders[(start + i) % len(self.embedders)]
+            try:
+                return getattr(embedder, method)(texts)
+            except Exception as e:
+                last_error = e
+        raise ConnectionError(f"No shard could embed the query: {last_error}")
+
+    def embed_queries(self, queries: list):
+        return self._embed("embed_queries", queries)
+
+    def embed_query(self, query: str):
+        return self.embed_queries([query])
+
+    def embed_texts(self, texts: list):
+        return self._embed("embed_texts", texts)
+
+    # ---------------- Search ----------------
+
+    def _note_versions(self, per_shard: list, hits_of):
+        """Hits carry the version they were read from, so swaps are seen without asking."""
+        for i, result in enumerate(per_shard):
+            hits = hits_of(result) if result is not None else None
+            if hits:
+                self._versions[i] = hits[0].index_version
+
+    def search_chunks(self, query_vec, k: int = 5, max_distance=None, dedupe_sections: bool = False, mmr_lambda=None, fetch_k=None):
+        """
+        Hits in the same order as one index holding every shard's chunks.
+        Each shard returns its top fetch_k rows (distance-filtered, not
+        deduplicated); the merged global top fetch_k are deduplicated by
+        section and, with MMR, re-ranked once over the whole pool,
+        exactly as LoadedIndex.search_many does.
+        """
+        fetch_k = fetch_k or default_fetch_k(k, max_distance, dedupe_sections, mmr_lambda)
+
+        if mmr_lambda is None:
+            per_shard = self._scatter("search_chunks", query_vec, fetch_k, max_distance=max_distance, fetch_k=fetch_k)
+            self._note_versions(per_shard, lambda hits: hits)
+            pool = merge_hits(self._answered(per_shard), fetch_k, dedupe_sections)
+            merged = [hit for hit, _ in pool[:k]]
+
+        else:
+            per_shard = self._scatter("candidates", query_vec, fetch_k, max_distance=max_distance)
+            self._note_versions(per_shard, lambda result: result[0])
+            answered = self._answered(per_shard)
+
+            pool = merge_hits([hits for hits, _, _ in answered], fetch_k, dedupe_sections)
+            cand = np.array([answered[shard][1][row] for _, (shard, row) in pool], dtype=np.float32)
+            order = mmr_order(answered[0][2], cand, k, mmr_lambda)
+            merged = [pool[i][0] for i in order]
+
+        for rank, hit in enumerate(merged, 1):
+            hit.rank = rank
+        return merged
+
+    def retrieve_chunks(self, query: str, k: int = 5, **search_kwargs):
+        return self.search_chunks(self.embed_query(query), k, **search_kwargs)
+
+    def hits_for_chunk_ids(self, chunk_ids) -> list:
+        chunk_ids = list(chunk_ids)
+        found = {}
+        for hits in self._scatter("hits_for_chunk_ids", chunk_ids):
+            for h in hits or []:
+                found[h.chunk_id] = h
+        return [found[cid] for cid in chunk_ids if cid in found]
+
+    def index_version(self) -> str:
+        """
+        Versions of all shards, from cache: shards are only asked for
+        the ones not seen yet (refreshed by every search and by stats).
+        """
+        unknown = [i for i, v in enumerate(self._versions) if v is None]
+        if unknown:
+            for i, version in zip(unknown, self._scatter("index_version", shards=unknown)):
+                self._versions[i] = version
+        versions = sorted({v for v in self._versions if v is not None})
+        return "+".join(versions) if versions else None
+
+    def stats(self) -> dict:
+        shard_stats = self._scatter("stats")
+        for i, s in enumerate(shard_stats):
+            if s:
+                self._versions[i] = s["index_version"]
+        versions = sorted({s["index_version"] for s in shard_stats if s})
+        return {
+            "index_version": "+".join(versions) if versions else None,
+            "chunks": sum(s["chunks"] for s in shard_stats if s),
+            "shards": [
+                {"address": a, "up": s is not None, **({k: s[k] for k in ("index_version", "chunks")} if s else {})}
+                for a, s in zip(self.addresses, shard_stats)
+            ],
+            **self.counters,
+        }
+
+
+def merge_hits(per_shard: list, keep: int, dedupe_sections: bool = False) -> list:
+    """
+    Merge per-shard hit lists (each sorted by distance) into the global
+    top `keep` by distance, then keep only the best hit per (source,
+    section) if requested (a section may span hash shards).
+
+    Returns: list of (hit, (shard position, row in that shard's list))
+    """
+    pool = sorted(
+        ((hit, (shard, row)) for shard, hits in enumerate(per_shard) for row, hit in enumerate(hits)),
+        key=lambda item: (item[0].distance, item[1]),
+    )[:keep]
+    if dedupe_sections:
+        seen, unique = set(), []
+        for item in pool:
+            key = (item[0].source, item[0].section)
+            if key not in seen:
+                seen.add(key)
+                unique.append(item)
+        pool = unique
+    return pool
+
+
+def _addresses(value: str) -> list:
+    return [a.strip() for a in value.split(",") if a.strip()]
+
+
+client = None
+if settings.retrieval_backend == "sharded":
+    client = ShardedClient(
+        _addresses(settings.shard_addresses),
+        settings.sidecar_authkey,
+        settings.shard_timeout_seconds,
+        settings.shard_embed_timeout_seconds,
+    )
+
+
+# ============================================================
+# Benchmark: latency / throughput vs. shard count
+# ============================================================
+
+def _run_load(remote: ShardedClient, vecs, k: int, concurrency: int) -> tuple:
+    latencies, lock = [], threading.Lock()
+    chunks = [vecs[i::concurrency] for i in range(concurrency)]
+
+    def worker(part):
+        mine = []
+        for vec in part:
+            t0 = time.perf_counter()
+            remote.search_chunks(vec.reshape(1, -1), k)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(part,)) for part in chunks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), time.perf_counter() - t0
+
+
+def bench(shard_counts: list, n_queries: int, concurrency: int, k: int, scale: int, by: str):
+    """
+    Search-only latency (queries are embedded up front) for each shard
+    count, on the live index optionally replicated `scale` times.
+    """
+    queries = load_bench_queries(n_queries)
+    root = Path(tempfile.mkdtemp(prefix="trustmedai-shards-"))  # 0700: holds the shard sockets
+    authkey = secrets.token_hex(32)  # one-off key for this run's shard servers
+    print(f"{'shards':>6s} {'chunks':>9s} {'q/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'partial':>7s} {'shard RSS MB':>12s}")
+
+    try:
+        for n in shard_counts:
+            dirs = build_shards(n, by, root / f"n{n}", scale)
+            addresses = [str(root / f"n{n}-{i}.sock") for i in range(n)]
+            procs = launch_shard_servers(dirs, addresses, authkey)
+            try:
+                remote = ShardedClient(addresses, authkey, settings.shard_timeout_seconds, settings.shard_embed_timeout_seconds)
+                vecs = remote.embed_queries(queries)
+                _run_load(remote, vecs[: min(len(vecs), 4 * concurrency)], k, concurrency)  # warm up
+
+                latencies, wall = _run_load(remote, vecs, k, concurrency)
+                stats = remote.stats()
+                p95 = latencies[int(0.95 * (len(latencies) - 1))]
+                rss = sum(rss_bytes(p.pid) for p in procs)
+                print(
+                    f"{n:6d} {stats['chunks']:9d} {len(latencies) / wall:8.1f} "
+                    f"{statistics.median(latencies) * 1000:8.2f} {p95 * 1000:8.2f} "
+                    f"{stats['partial_results']:7d} {rss / 2**20:12.1f}"
+                )
+            finally:
+                for p in procs:
+                    p.terminate()
+                for p in procs:
+                    p.wait()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded retrieval")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="split the live index into shards")
+    p_build.add_argument("--shards", type=int, required=True)
+    p_build.add_argument("--by", choices=["source", "hash"], default="source")
+
+    p_serve = sub.add_parser("serve", help="run one sidecar per built shard (local testing)")
+    p_serve.add_argument("--shards", type=int, required=True)
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--base-port", type=int, default=7601)
+
+    p_bench = sub.add_parser("bench", help="latency / throughput vs. shard count")
+    p_bench.add_argument("--shards", nargs="+", type=int, default=[1, 2, 4])
+    p_bench.add_argument("--queries", type=int, default=400)
+    p_bench.add_argument("--concurrency", type=int, default=8)
+    p_bench.add_argument("--k", type=int, default=settings.retrieval_k)
+    p_bench.add_argument("--scale", type=int, default=1, help="replicate the corpus this many times")
+    p_bench.add_argument("--by", choices=["source", "hash"], default="hash")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_shards(args.shards, args.by)
+
+    elif args.command == "serve":
+        # Shard servers unpickle requests: a private key is required on any interface
+        try:
+            check_authkey(settings.sidecar_authkey)
+        except ValueError as e:
+            parser.error(f"Refusing to serve shards on {args.host}: {e}")
+
+        shard_dirs = [settings.embed_dir / "shards" / f"shard-{i}" for i in range(args.shards)]
+        addresses = [f"{args.host}:{args.base_port + i}" for i in range(args.shards)]
+        procs = launch_shard_servers(shard_dirs, addresses, settings.sidecar_authkey)
+        print(f"[INFO] Shards up. Use TRUSTMED_RETRIEVAL_BACKEND=sharded TRUSTMED_SHARD_ADDRESSES={','.join(addresses)}")
+        try:
+            for p in procs:
+                p.wait()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.terminate()
+
+    else:
+        bench(args.shards, args.queries, args.concurrency, args.k, args.scale, args.by)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one in-flight computation: the
+first caller (leader) runs it, callers arriving while it runs
+(followers) wait for and receive the same result, or the same exception.
+Nothing is cached: once the call finishes, the next caller with that
+key starts a new one, so failures are retried by later requests.
+
+Handlers are sync and run on the threadpool, so a computation cannot be
+interrupted mid-flight. Giving up is therefore per waiter: a follower
+that has waited max_wait stops waiting and runs the computation itself,
+without affecting the leader or the other followers, and a leader whose
+client has gone away still finishes the computation for its followers.
+
+Each follower raises its own copy of the leader's exception (same type,
+chained to the original), so no exception object is raised in several
+threads at once.
+"""
+
+import copy
+import threading
+from typing import Callable, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+def _fresh(error: BaseException) -> BaseException:
+    """
+    A new exception of the same type and state as error. Built without
+    calling __init__ (copy.copy would, and fails for exceptions whose
+    constructor takes other arguments than their args).
+    """
+    try:
+        fresh = type(error).__new__(type(error), *error.args)
+        fresh.args = error.args
+        fresh.__dict__.update(copy.copy(getattr(error, "__dict__", {})))
+        return fresh
+    except Exception:
+        return RuntimeError(f"Coalesced call failed: {error!r}")
+
+
+class SingleFlight:
+    def __init__(self, name: str, max_wait: Optional[float] = None):
+        self.name = name
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+
+        self.leaders = 0
+        self.followers = 0
+        self.errors = 0
+        self.follower_timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable) -> tuple:
+        """
+        Run fn() once for all concurrent callers with this key.
+
+        Returns: (result, shared); shared is True for followers that got
+        the leader's result.
+        Raises: whatever fn raised, for the leader and (as a copy chained
+        to it) every follower.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.followers += 1
+                self.followers += 1
+
+        if not leader:
+            if not call.done.wait(self.max_wait):
+                with self._lock:
+                    self.follower_timeouts += 1
+                print(f"[WARN] Coalesced {self.name} call still running after {self.max_wait}s; calling separately")
+                return fn(), False
+            if call.error is not None:
+                raise _fresh(call.error) from call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            # Followers must not hang on an interrupted leader either
+            call.error = e if isinstance(e, Exception) else RuntimeError(f"Coalesced {self.name} call aborted")
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        if call.followers:
+            print(f"[INFO] {self.name}: {call.followers} coalesced request(s) shared one call")
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "errors": self.errors,
+                "follower_timeouts": self.follower_timeouts,
+            }
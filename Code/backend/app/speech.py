@@ -0,0 +1,265 @@
+"""
+Sentence-pipelined speech synthesis.
+
+While Gemini streams an answer, SentenceSplitter cuts the text into
+speakable sentences and SpeechPipeline sends each one to the TTS
+provider as soon as it is complete, at most settings.tts_max_parallel
+at a time. Segments are handed to on_segment strictly in sentence
+order, so playback can start with the first sentence while later ones
+are still being generated or synthesized.
+
+Providers (settings.tts_provider):
+  elevenlabs   tts.synthesize (pre-rendered fixed phrases are reused)
+  cartesia     tts_cartesia.synthesize
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Literal, Optional
+
+from . import static_audio
+from .settings import settings
+
+
+# ============================================================
+# Providers
+# ============================================================
+
+class TTSProvider:
+    """text -> audio bytes. Subclasses raise tts.TTSError on failure."""
+
+    name = ""
+    media_type = "audio/mpeg"
+    prerendered = False  # static_audio files were rendered with this voice
+
+    def synthesize(self, text: str) -> bytes:
+        raise NotImplementedError
+
+
+class ElevenLabsProvider(TTSProvider):
+    name = "elevenlabs"
+    prerendered = True
+
+    def synthesize(self, text: str) -> bytes:
+        from .tts import synthesize
+        return synthesize(text)
+
+
+class CartesiaProvider(TTSProvider):
+    name = "cartesia"
+
+    def synthesize(self, text: str) -> bytes:
+        from .tts_cartesia import synthesize
+        return synthesize(text)
+
+
+PROVIDERS = {p.name: p for p in (ElevenLabsProvider, CartesiaProvider)}
+
+# Names of PROVIDERS for request validation (an unknown name is a 422, not a 500)
+ProviderName = Literal["elevenlabs", "cartesia"]
+
+
+def get_provider(name: Optional[str] = None) -> TTSProvider:
+    name = name or settings.tts_provider
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown TTS provider: {name!r} (choose from {', '.join(PROVIDERS)})")
+    return PROVIDERS[name]()
+
+
+# ============================================================
+# Sentence splitting
+# ============================================================
+
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+_RULE = re.compile(r"^\s*-{3,}")  # "-----" line: everything after is not spoken
+
+
+def clean_for_speech(sentence: str) -> str:
+    """Markdown -> plain speech text (same rules as the frontend's cleanForTTS)."""
+    sentence = re.sub(r"\*\*(.*?)\*\*", r"\1", sentence)
+    sentence = re.sub(r"^\s*[*\-•]\s*", "", sentence)
+    sentence = re.sub(r"^>\s*", "", sentence)
+    sentence = re.sub(r"https?://\S+", "", sentence)
+    sentence = re.sub(r"\[(.*?)\]", r"\1", sentence)
+    return " ".join(sentence.split())
+
+
+class SentenceSplitter:
+    """
+    Incremental sentence boundary detection over streamed text.
+
+    feed() returns the sentences completed by the new text; close()
+    returns whatever is left. Fragments shorter than min_chars are
+    joined with the next sentence so tiny segments don't each cost a
+    TTS round-trip.
+    """
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.pending = ""
+        self.stopped = False
+
+    def _emit(self, parts: list) -> list:
+        sentences = []
+        for part in parts:
+            if _RULE.match(part):
+                self.stopped = True
+                break
+            text = clean_for_speech(part)
+            if not text:
+                continue
+            self.pending = f"{self.pending} {text}".strip()
+            if len(self.pending) >= self.min_chars:
+                sentences.append(self.pending)
+                self.pending = ""
+        return sentences
+
+    def feed(self, delta: str) -> list:
+        if self.stopped:
+            return []
+        self.buffer += delta
+        parts = _BOUNDARY.split(self.buffer)
+        self.buffer = parts.pop()  # possibly incomplete
+        return self._emit(parts)
+
+    def close(self) -> list:
+        sentences = [] if self.stopped else self._emit([self.buffer])
+        self.buffer = ""
+        if self.pending:
+            sentences.append(self.pending)
+            self.pending = ""
+        return sentences
+
+
+# ============================================================
+# Pipeline
+# ============================================================
+
+class SpeechPipeline:
+    """
+    feed() streamed answer text, then close() and join(); or cancel()
+    to stop early, e.g. once the client has gone.
+
+    on_segment(index, text, audio_bytes, error) is called once per
+    sentence, in order, from the pipeline's emitter thread. error is
+    None on success; a failed sentence does not stop later ones.
+    """
+
+    def __init__(self, on_segment: Callable, provider: Optional[TTSProvider] = None, max_parallel: Optional[int] = None):
+        self.provider = provider or get_provider()
+        self.on_segment = on_segment
+        self.splitter = SentenceSplitter()
+        self.executor = ThreadPoolExecutor(max_workers=max_parallel or settings.tts_max_parallel)
+
+        self._held = ""  # beginning of a pre-rendered phrase, waiting for the rest
+        self._segments = []  # (text, future) in sentence order
+        self._ready = threading.Condition()
+        self._closed = False
+        self._cancelled = False
+
+        self.started_at = time.perf_counter()
+        self.first_audio_ms = None
+        self.chars_synthesized = 0
+        self.chars_prerendered = 0
+
+        self._emitter = threading.Thread(target=self._emit_in_order, daemon=True)
+        self._emitter.start()
+
+    def feed(self, delta: str):
+        if self._cancelled:
+            return
+        for sentence in self.splitter.feed(delta):
+            self._submit(sentence)
+
+    def close(self):
+        if self._cancelled:
+            return
+        for sentence in self.splitter.close():
+            self._submit(sentence)
+        if self._held:
+            self._dispatch(self._held)
+            self._held = ""
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+
+    def cancel(self):
+        """Synthesize and emit nothing more; sentences already running finish unseen."""
+        with self._ready:
+            self._cancelled = self._closed = True
+            self._ready.notify()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def join(self, timeout: Optional[float] = None):
+        self._emitter.join(timeout)
+        self.executor.shutdown(wait=False)
+
+    def _submit(self, sentence: str):
+        if self._held:
+            sentence = f"{self._held} {sentence}"
+            self._held = ""
+
+        # "Do you have any more questions?" alone is the start of the
+        # pre-rendered closing line: wait for the rest of it
+        if self.provider.prerendered and static_audio.is_phrase_prefix(sentence):
+            self._held = sentence
+            return
+
+        self._dispatch(sentence)
+
+    def _dispatch(self, sentence: str):
+        future = None
+        if self.provider.prerendered:
+            variable, phrase = static_audio.split_fixed_phrase(sentence)
+            if phrase and not variable:
+                static_audio.record_hit(phrase, variable)
+                self.chars_prerendered += len(sentence)
+                future = Future()
+                future.set_result(static_audio.phrase_audio(phrase))
+
+        if future is None:
+            try:
+                future = self.executor.submit(self.provider.synthesize, sentence)
+            except RuntimeError:  # cancelled meanwhile: executor shut down
+                return
+            self.chars_synthesized += len(sentence)
+
+        with self._ready:
+            self._segments.append((sentence, future))
+            self._ready.notify()
+
+    def _emit_in_order(self):
+        index = 0
+        while True:
+            with self._ready:
+                while index >= len(self._segments) and not self._closed:
+                    self._ready.wait()
+                if self._cancelled or index >= len(self._segments):
+                    return
+                text, future = self._segments[index]
+
+            try:
+                audio, error = future.result(), None
+            except Exception as e:
+                audio, error = None, str(e)
+
+            if audio is not None and self.first_audio_ms is None:
+                self.first_audio_ms = (time.perf_counter() - self.started_at) * 1000
+                print(f"[INFO] First speech segment ready after {self.first_audio_ms:.0f} ms")
+
+            if self._cancelled:
+                return
+            self.on_segment(index, text, audio, error)
+            index += 1
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "segments": len(self._segments),
+            "first_audio_ms": self.first_audio_ms,
+            "chars_synthesized": self.chars_synthesized,
+            "chars_prerendered": self.chars_prerendered,
+        }
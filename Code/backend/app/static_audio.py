@@ -0,0 +1,225 @@
+"""
+Pre-rendered audio for the fixed phrases the assistant always says.
+
+The intro message and the closing line every answer ends with are
+synthesized once at build time instead of on every /tts call:
+
+  python -m app.static_audio build          (re-renders only changed phrases)
+  python -m app.static_audio build --force
+  python -m app.static_audio list
+
+Files are written to settings.static_audio_dir as <name>-<hash>.mp3,
+where the hash covers text, voice and model, so they can be served with
+an immutable cache header. manifest.json maps phrase names to files.
+
+At request time /tts splits the fixed tail off an answer, synthesizes
+only the variable part and appends the pre-rendered tail.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Optional
+
+from .settings import settings
+
+# Keep in sync with App.jsx (intro) and SYSTEM_INSTRUCTION (closing line)
+PHRASES = {
+    "intro": "Hi, I’m TrustMedAI. I can answer educational questions about Type 2 Diabetes. What would you like to know?",
+    "closing": "Do you have any more questions? Or Would you like me to help you schedule an appointment with a doctor or clinic?",
+}
+
+MANIFEST_FILE = "manifest.json"
+
+# Trailing punctuation/whitespace ignored when matching (the frontend's
+# cleanForTTS turns "clinic?\n" into "clinic?.")
+_TRAILING = " \t\n.!?"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).rstrip(_TRAILING).lower()
+
+
+def render_key(text: str, voice_id: str, model_id: str) -> str:
+    return hashlib.sha1(f"{voice_id}|{model_id}|{text}".encode("utf-8")).hexdigest()[:12]
+
+
+def strip_id3(audio: bytes) -> bytes:
+    """Drop a leading ID3v2 tag so MP3 segments can be concatenated."""
+    if audio[:3] != b"ID3" or len(audio) < 10:
+        return audio
+    size = 0
+    for b in audio[6:10]:  # syncsafe integer
+        size = (size << 7) | (b & 0x7F)
+    return audio[10 + size:]
+
+
+# ============================================================
+# Rendered phrases (loaded lazily from the manifest)
+# ============================================================
+
+_lock = threading.Lock()
+_rendered = None  # name -> {"text", "file", "audio", "pattern"}
+
+counters = {"full_hits": 0, "tail_hits": 0, "chars_saved": 0}
+
+
+def load_manifest() -> dict:
+    path = settings.static_audio_dir / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def rendered() -> dict:
+    """Phrases whose audio was pre-rendered for the current voice/model."""
+    global _rendered
+    with _lock:
+        if _rendered is None:
+            from .tts import ELEVENLABS_VOICE_ID, MODEL_ID
+
+            _rendered = {}
+            for name, entry in load_manifest().items():
+                text = PHRASES.get(name)
+                path = settings.static_audio_dir / entry["file"]
+                if text is None or entry["key"] != render_key(text, ELEVENLABS_VOICE_ID, MODEL_ID):
+                    print(f"[WARN] Pre-rendered audio for '{name}' is stale; run `python -m app.static_audio build`")
+                    continue
+                if not path.exists():
+                    continue
+                _rendered[name] = {
+                    "text": text,
+                    "file": entry["file"],
+                    "audio": path.read_bytes(),
+                    "pattern": _tail_pattern(text),
+                }
+        return _rendered
+
+
+def _tail_pattern(text: str):
+    """Matches text at the end of a string, any whitespace, any case."""
+    words = _normalize(text).split()
+    return re.compile(
+        r"(?:^|(?<=[\s.!?]))" + r"\s+".join(map(re.escape, words)) + r"[\s.!?]*$",
+        re.IGNORECASE,
+    )
+
+
+def split_fixed_phrase(text: str) -> tuple:
+    """
+    -> (variable_text, phrase_name)
+
+    phrase_name is None when text does not end with a pre-rendered
+    phrase; variable_text is "" when text is exactly the phrase.
+    """
+    for name, entry in rendered().items():
+        match = entry["pattern"].search(text)
+        if match:
+            return text[: match.start()].rstrip(), name
+    return text, None
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[\w’']+", text.lower())
+
+
+def is_phrase_prefix(text: str) -> bool:
+    """True if text is the beginning (but not all) of a pre-rendered phrase."""
+    words = _words(text)
+    if not words:
+        return False
+    for entry in rendered().values():
+        full = _words(entry["text"])
+        if len(words) < len(full) and full[: len(words)] == words:
+            return True
+    return False
+
+
+def phrase_audio(name: str) -> bytes:
+    return rendered()[name]["audio"]
+
+
+def record_hit(name: str, variable_text: str):
+    counters["tail_hits" if variable_text else "full_hits"] += 1
+    counters["chars_saved"] += len(rendered()[name]["text"])
+
+
+def public_urls(prefix: str = "/tts/static") -> dict:
+    return {name: {"text": entry["text"], "url": f"{prefix}/{entry['file']}"} for name, entry in rendered().items()}
+
+
+def stats() -> dict:
+    return {"phrases": sorted(rendered()), **counters}
+
+
+# ============================================================
+# Build step
+# ============================================================
+
+def build(force: bool = False, names: Optional[list] = None) -> dict:
+    """Synthesize missing or changed phrases and rewrite the manifest."""
+    global _rendered
+    from .tts import ELEVENLABS_VOICE_ID, MODEL_ID, synthesize
+
+    out_dir = settings.static_audio_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+
+    for name, text in PHRASES.items():
+        if names and name not in names:
+            continue
+
+        key = render_key(text, ELEVENLABS_VOICE_ID, MODEL_ID)
+        filename = f"{name}-{key}.mp3"
+        entry = manifest.get(name)
+        if not force and entry and entry["key"] == key and (out_dir / filename).exists():
+            print(f"[INFO] {name}: up to date ({filename})")
+            continue
+
+        audio = synthesize(text)
+        tmp = out_dir / f".{filename}.tmp"
+        tmp.write_bytes(audio)
+        os.replace(tmp, out_dir / filename)
+
+        if entry and entry["file"] != filename and (out_dir / entry["file"]).exists():
+            (out_dir / entry["file"]).unlink()
+
+        manifest[name] = {"key": key, "file": filename, "chars": len(text), "bytes": len(audio)}
+        print(f"[INFO] {name}: rendered {len(text)} chars -> {filename} ({len(audio)} bytes)")
+
+    tmp = out_dir / f".{MANIFEST_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, out_dir / MANIFEST_FILE)
+
+    with _lock:
+        _rendered = None
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render audio for fixed assistant phrases")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="synthesize missing or changed phrases")
+    p_build.add_argument("--force", action="store_true", help="re-render everything")
+    p_build.add_argument("names", nargs="*", help=f"phrases to render (default: all of {', '.join(PHRASES)})")
+
+    sub.add_parser("list", help="show phrases and their rendered files")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.force, args.names)
+    else:
+        manifest = load_manifest()
+        for name, text in PHRASES.items():
+            entry = manifest.get(name)
+            print(f"{name:8s} {entry['file'] if entry else '(not rendered)':28s} {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,57 @@
 import os
 import base64
 import requests
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
+from . import static_audio
+from .settings import settings
+from .singleflight import SingleFlight
+
 router = APIRouter()
 
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY") 
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "DLsHlh26Ugcm6ELvS0qi")
 
-ELEVENLABS_TTS_URL = f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
+ELEVENLABS_TTS_URL = f"{settings.elevenlabs_base_url}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
+
+MODEL_ID = "eleven_turbo_v2"
+
+# Pre-rendered files are content-addressed (<name>-<hash>.mp3)
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 
 class TTSRequest(BaseModel):
   text: str
 
 
-@router.post("/tts")
-def generate_tts(req: TTSRequest):
-  """
-  Simple TTS endpoint using ElevenLabs.
-  Input:  { "text": "..." }
-  Output: { "audio": "<base64-encoded-mp3>" }
-  """
+class TTSError(Exception):
+  def __init__(self, message: str, details=None):
+    super().__init__(message)
+    self.details = details
 
-  print("🔵 Incoming ElevenLabs TTS request:", req.text)
+
+# Identical text requested concurrently (e.g. the frontend replaying the
+# same answer for many users) is synthesized once
+tts_flights = SingleFlight("ElevenLabs TTS", max_wait=settings.coalesce_max_wait_seconds)
+
+
+def synthesize(text: str) -> bytes:
+  """MP3 bytes for text; concurrent identical requests share one ElevenLabs call."""
+
+  if not settings.coalesce_requests:
+    return _call_elevenlabs(text)
+  audio, _ = tts_flights.do((text.strip(), ELEVENLABS_VOICE_ID, MODEL_ID), lambda: _call_elevenlabs(text))
+  return audio
+
+
+def _call_elevenlabs(text: str) -> bytes:
+  """One ElevenLabs round-trip; returns MP3 bytes or raises TTSError."""
 
   if not ELEVENLABS_API_KEY:
     print("❌ ELEVENLABS_API_KEY is missing")
-    return {"error": "Missing ELEVENLABS_API_KEY"}
+    raise TTSError("Missing ELEVENLABS_API_KEY")
 
   headers = {
     "xi-api-key": ELEVENLABS_API_KEY,
@@ -37,9 +60,9 @@ def generate_tts(req: TTSRequest):
   }
 
   payload = {
-    "text": req.text,
+    "text": text,
     # you can change model/voice settings here if you want
-    "model_id": "eleven_turbo_v2",
+    "model_id": MODEL_ID,
     "voice_settings": {
       "stability": 0.5,
       "similarity_boost": 0.75,
@@ -51,10 +74,15 @@ def generate_tts(req: TTSRequest):
   print("🟡 Sending request to ElevenLabs...")
 
   try:
-    response = requests.post(ELEVENLABS_TTS_URL, headers=headers, json=payload)
+    response = requests.post(
+      ELEVENLABS_TTS_URL,
+      headers=headers,
+      json=payload,
+      timeout=settings.tts_timeout_seconds,
+    )
   except Exception as e:
     print("🔴 Network error calling ElevenLabs:", e)
-    return {"error": "Network error calling ElevenLabs", "details": str(e)}
+    raise TTSError("Network error calling ElevenLabs", str(e))
 
   print("🟢 ElevenLabs status:", response.status_code)
 
@@ -62,15 +90,66 @@ def generate_tts(req: TTSRequest):
     # try to print any error info
     try:
       print("❌ ElevenLabs error JSON:", response.json())
-      return {"error": "TTS failed", "details": response.json()}
-    except Exception:
+      raise TTSError("TTS failed", response.json())
+    except ValueError:
       print("❌ ElevenLabs error (non-JSON):", response.text)
-      return {"error": "TTS failed", "details": response.text}
+      raise TTSError("TTS failed", response.text)
 
-  audio_bytes = response.content
-  print("📦 Received audio bytes:", len(audio_bytes))
+  print("📦 Received audio bytes:", len(response.content))
+  return response.content
+
+
+@router.post("/tts")
+def generate_tts(req: TTSRequest):
+  """
+  Simple TTS endpoint using ElevenLabs.
+  Input:  { "text": "..." }
+  Output: { "audio": "<base64-encoded-mp3>" }
+
+  Fixed phrases (intro, closing line) come from pre-rendered audio; for
+  answers ending with the closing line only the part before it is sent
+  to ElevenLabs.
+  """
+
+  print("🔵 Incoming ElevenLabs TTS request:", req.text)
+
+  text, phrase = static_audio.split_fixed_phrase(req.text)
+  audio_bytes = b""
+
+  try:
+    if text:
+      audio_bytes = synthesize(text)
+  except TTSError as e:
+    if e.details is None:
+      return {"error": str(e)}
+    return {"error": str(e), "details": e.details}
+
+  if phrase:
+    print(f"🟣 Appending pre-rendered '{phrase}' audio")
+    static_audio.record_hit(phrase, text)
+    tail = static_audio.phrase_audio(phrase)
+    audio_bytes += static_audio.strip_id3(tail) if audio_bytes else tail
 
   # base64 encode for frontend
   audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
 
   return {"audio": audio_b64}
+
+
+@router.get("/tts/static")
+def list_static_audio():
+  """Pre-rendered phrases: { name: { "text", "url" } }"""
+  return static_audio.public_urls()
+
+
+@router.get("/tts/static/{filename}")
+def get_static_audio(filename: str):
+  entry = next((e for e in static_audio.rendered().values() if e["file"] == filename), None)
+  if entry is None:
+    raise HTTPException(status_code=404, detail="Unknown audio file")
+
+  return FileResponse(
+    settings.static_audio_dir / filename,
+    media_type="audio/mpeg",
+    headers={"Cache-Control": STATIC_CACHE_CONTROL},
+  )
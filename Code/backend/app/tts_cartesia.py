@@ -4,21 +4,34 @@ import requests
 from fastapi import APIRouter
 from pydantic import BaseModel
 
+from .settings import settings
+from .singleflight import SingleFlight
+from .tts import TTSError
+
 router = APIRouter()
 
 CARTESIA_API_KEY = os.getenv("CARTESIA_API_KEY")
 CARTESIA_URL = "https://api.cartesia.ai/api/tts"
+CARTESIA_MODEL = "sonic"
+CARTESIA_VOICE = "lily"
+
+tts_flights = SingleFlight("Cartesia TTS", max_wait=settings.coalesce_max_wait_seconds)
 
 class TTSRequest(BaseModel):
     text: str
 
-@router.post("/tts")
-def generate_tts(req: TTSRequest):
-    print("🔵 Incoming TTS request:", req.text)
+def synthesize(text: str) -> bytes:
+    """MP3 bytes for text; concurrent identical requests share one Cartesia call."""
+    if not settings.coalesce_requests:
+        return _call_cartesia(text)
+    audio, _ = tts_flights.do((text.strip(), CARTESIA_VOICE, CARTESIA_MODEL), lambda: _call_cartesia(text))
+    return audio
 
+def _call_cartesia(text: str) -> bytes:
+    """One Cartesia round-trip; returns MP3 bytes or raises TTSError."""
     if not CARTESIA_API_KEY:
         print("❌ ERROR: CARTESIA_API_KEY is missing.")
-        return {"error": "Missing API key"}
+        raise TTSError("Missing API key")
 
     headers = {
         "Authorization": f"Bearer {CARTESIA_API_KEY}",
@@ -26,30 +39,45 @@ def generate_tts(req: TTSRequest):
     }
 
     payload = {
-        "model": "sonic",
-        "voice": "lily",
+        "model": CARTESIA_MODEL,
+        "voice": CARTESIA_VOICE,
         "format": "mp3",
-        "text": req.text
+        "text": text
     }
 
     print("🟡 Sending request to Cartesia...")
 
-    response = requests.post(CARTESIA_URL, json=payload, headers=headers)
+    try:
+        response = requests.post(CARTESIA_URL, json=payload, headers=headers, timeout=settings.tts_timeout_seconds)
+    except Exception as e:
+        print("🔴 Network error calling Cartesia:", e)
+        raise TTSError("Network error calling Cartesia", str(e))
 
     print("🟢 Cartesia responded with status:", response.status_code)
 
-    # Print body (cautiously)
-    try:
-        print("🟣 Cartesia JSON:", response.json())
-    except:
-        print("🔴 ERROR: Response is not JSON:", response.text)
-
     if response.status_code != 200:
         print("❌ Cartesia Error:", response.text)
-        return {"error": "TTS failed", "details": response.text}
+        raise TTSError("TTS failed", response.text)
 
-    audio_b64 = response.json().get("audio", "")
+    try:
+        audio_b64 = response.json().get("audio", "")
+    except ValueError:
+        print("🔴 ERROR: Response is not JSON:", response.text)
+        raise TTSError("TTS failed", response.text)
 
     print("📦 Audio Base64 Length:", len(audio_b64))
 
-    return {"audio": audio_b64}
+    return base64.b64decode(audio_b64)
+
+@router.post("/tts")
+def generate_tts(req: TTSRequest):
+    print("🔵 Incoming TTS request:", req.text)
+
+    try:
+        audio_bytes = synthesize(req.text)
+    except TTSError as e:
+        if e.details is None:
+            return {"error": str(e)}
+        return {"error": str(e), "details": e.details}
+
+    return {"audio": base64.b64encode(audio_bytes).decode("utf-8")}
@@ -0,0 +1,218 @@
+"""
+Compact storage options for the FAISS index.
+
+Indexes use inner product over unit-normalized embeddings (cosine
+similarity); metric="l2" is kept for indexes built before that.
+
+  storage   index                          bytes per 384-d vector
+  flat      IndexFlat (float32, exact)     1536
+  fp16      IndexScalarQuantizer (fp16)     768
+  pq        IndexPQ (pq_m x pq_nbits)       pq_m * pq_nbits / 8  (48 by default)
+
+With a compressed index the retriever over-fetches
+rescore_factor * fetch_k candidates and re-scores them exactly against
+vectors.npy, which is memory-mapped, so only the candidate rows are
+ever paged in.
+
+Pick a setting per deployment from the memory / recall trade-off on
+the real corpus:
+
+  python -m app.vector_compression eval --k 5 --rescore 1 2 4 8
+"""
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from .settings import settings
+
+STORAGE_TYPES = ("flat", "fp16", "pq")
+METRICS = {"ip": faiss.METRIC_INNER_PRODUCT, "l2": faiss.METRIC_L2}
+
+
+def make_index(vectors, storage: str = "flat", pq_m: int = 48, pq_nbits: int = 8, metric: str = "ip"):
+    """Build and fill an index of the requested storage type and metric."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    metric_type = METRICS[metric]
+
+    if storage == "flat":
+        index = faiss.IndexFlat(dim, metric_type)
+
+    elif storage == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, metric_type)
+
+    elif storage == "pq":
+        if dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+        # k-means needs more training points than centroids
+        nbits = min(pq_nbits, max(1, int(np.log2(max(2, len(vectors))))))
+        if nbits < pq_nbits:
+            print(f"[WARN] Only {len(vectors)} vectors: using {nbits}-bit PQ codes instead of {pq_nbits}")
+        index = faiss.IndexPQ(dim, pq_m, nbits, metric_type)
+
+    else:
+        raise ValueError(f"Unknown vector storage: {storage!r} (choose from {', '.join(STORAGE_TYPES)})")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def is_exact(index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def index_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def rescore(vectors, query_vecs, distances, indices, keep: int, metric_type=faiss.METRIC_INNER_PRODUCT):
+    """
+    Replace approximate scores by exact ones (inner product, or squared
+    L2 distance for L2 indexes) computed from the full-precision vectors
+    (may be a np.memmap) and keep the best `keep` candidates per query.
+
+    Returns: (distances, indices) shaped (n, keep), ordered and padded
+    like FAISS output for that metric (-1 ids).
+    """
+    n = len(query_vecs)
+    inner_product = metric_type == faiss.METRIC_INNER_PRODUCT
+    pad = -np.finfo(np.float32).max if inner_product else np.finfo(np.float32).max
+    out_d = np.full((n, keep), pad, dtype=np.float32)
+    out_i = np.full((n, keep), -1, dtype=np.int64)
+
+    for i in range(n):
+        rows = np.unique(indices[i][indices[i] >= 0])  # sorted: sequential reads from the mmap
+        if not rows.size:
+            continue
+
+        cand = np.asarray(vectors[rows], dtype=np.float32)
+        if inner_product:
+            exact = cand @ query_vecs[i]
+            best = np.argsort(-exact, kind="stable")[:keep]
+        else:
+            exact = ((cand - query_vecs[i]) ** 2).sum(axis=1)
+            best = np.argsort(exact, kind="stable")[:keep]
+
+        out_d[i, : len(best)] = exact[best]
+        out_i[i, : len(best)] = rows[best]
+
+    return out_d, out_i
+
+
+def search(index, vectors, query_vecs, k: int, rescore_factor: int = 1):
+    """index.search, plus exact re-scoring when the index is compressed."""
+    query_vecs = np.asarray(query_vecs, dtype=np.float32)
+    if is_exact(index):
+        return index.search(query_vecs, k)
+
+    distances, indices = index.search(query_vecs, k * max(1, rescore_factor))
+    return rescore(vectors, query_vecs, distances, indices, k, index.metric_type)
+
+
+# ============================================================
+# Memory vs. recall report
+# ============================================================
+
+def load_eval_queries(limit: int) -> list:
+    """Section and subsection titles of the corpus (forum sections are the questions)."""
+    with open(settings.meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    queries = sorted({m["section"] for m in metadata} | {m["subsection"] for m in metadata if m["subsection"]})
+    return queries[:limit]
+
+
+def evaluate(storages: list, rescore_factors: list, k: int, n_queries: int, pq_m: int, pq_nbits: int) -> list:
+    """
+    Recall@k of each storage / rescore setting against exact float32
+    search, with index size and per-query latency.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    from .reduction import load_reduction, project
+
+    vectors = np.load(settings.vectors_path, mmap_mode="r")
+    full = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    queries = load_eval_queries(n_queries)
+    model = SentenceTransformer(settings.embed_model)
+    query_vecs = model.encode(
+        queries,
+        batch_size=settings.embed_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+
+    # Reduced index: compare in its space (see reduction eval for the dimension trade-off)
+    reduction = load_reduction(settings.reduction_path)
+    if reduction is not None:
+        query_vecs = project(query_vecs, reduction)
+
+    exact = make_index(full, "flat")
+    _, truth = exact.search(query_vecs, k)
+
+    rows = []
+    for storage in storages:
+        index = make_index(full, storage, pq_m, pq_nbits)
+        for factor in ([1] if is_exact(index) else rescore_factors):
+            t0 = time.perf_counter()
+            _, found = search(index, vectors, query_vecs, k, factor)
+            latency = (time.perf_counter() - t0) / len(queries)
+
+            hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+            rows.append({
+                "storage": storage,
+                "rescore_factor": factor if not is_exact(index) else None,
+                "index_bytes": index_bytes(index),
+                "bytes_per_vector": index_bytes(index) / max(1, index.ntotal),
+                "recall": hits / max(1, (truth >= 0).sum()),
+                "latency_ms": latency * 1000,
+            })
+
+    return rows
+
+
+def print_report(rows: list, n_vectors: int, dim: int, k: int):
+    full_mb = n_vectors * dim * 4 / 2**20
+    print(f"{n_vectors} vectors x {dim}d, full-precision file {full_mb:.1f} MB (mmap'd, not resident)")
+    print(f"{'storage':8s} {'rescore':>7s} {'index MB':>9s} {'B/vec':>7s} {'recall@' + str(k):>9s} {'ms/query':>9s}")
+    for r in rows:
+        factor = "-" if r["rescore_factor"] is None else f"x{r['rescore_factor']}"
+        print(
+            f"{r['storage']:8s} {factor:>7s} {r['index_bytes'] / 2**20:9.2f} {r['bytes_per_vector']:7.1f} "
+            f"{r['recall']:9.3f} {r['latency_ms']:9.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact vector storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_eval = sub.add_parser("eval", help="report memory vs. recall for each storage option")
+    p_eval.add_argument("--storage", nargs="+", default=list(STORAGE_TYPES), choices=STORAGE_TYPES)
+    p_eval.add_argument("--rescore", nargs="+", type=int, default=[1, 2, 4, 8], help="rescore factors to try")
+    p_eval.add_argument("--k", type=int, default=settings.retrieval_k)
+    p_eval.add_argument("--queries", type=int, default=500)
+    p_eval.add_argument("--pq-m", type=int, default=settings.pq_m)
+    p_eval.add_argument("--pq-nbits", type=int, default=settings.pq_nbits)
+    p_eval.add_argument("--json", type=str, help="also write the rows to this file")
+
+    args = parser.parse_args()
+
+    rows = evaluate(args.storage, args.rescore, args.k, args.queries, args.pq_m, args.pq_nbits)
+    vectors = np.load(settings.vectors_path, mmap_mode="r")
+    print_report(rows, vectors.shape[0], vectors.shape[1], args.k)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
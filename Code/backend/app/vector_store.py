@@ -1,88 +1,201 @@
+import argparse
 import json
-import os
+from itertools import islice
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 
-PROCESSED_DIR = Path("/Users/kaushikrajesh/Desktop/SEM3/SWM/TrustMedAI/Data/processed")
-EMBED_DIR = Path("/Users/kaushikrajesh/Desktop/SEM3/SWM/TrustMedAI/Data/embeddings")
-EMBED_DIR.mkdir(exist_ok=True, parents=True)
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-def load_all_sources():
-    files = list(PROCESSED_DIR.glob("*.json"))
-    all_chunks = []
-
-    for fp in files:
-        source_id = fp.stem
-        with open(fp, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        for entry in data:
-            section_name = entry.get("section", "Unknown Section")
-
-            # -----------------------------
-            # CASE 1: structured medical docs
-            # -----------------------------
-            if "subsections" in entry:
-                for idx, sub in enumerate(entry["subsections"]):
-                    sub_title = sub.get("title", "")
-                    content_list = sub.get("content", [])
-
-                    text = "\n".join(content_list)
-
-                    chunk = {
-                        "text": text,
-                        "source": source_id,
-                        "source_type": "structured",
-                        "section": section_name,
-                        "subsection": sub_title,
-                        "chunk_id": f"{source_id}_{section_name}_{idx}"
-                    }
-                    all_chunks.append(chunk)
-
-            # -----------------------------
-            # CASE 2: forum datasets
-            # -----------------------------
-            elif "answer" in entry:
-                answer_list = entry.get("answer", [])
-                text = "\n".join(answer_list)
-
-                chunk = {
+from .calibration import calibration_queries, fit_calibration, save_calibration
+from .index_versions import activate, new_version_dir, prune
+from .reduction import fit_reduction, project, save_reduction
+from .settings import settings
+from .vector_compression import STORAGE_TYPES, index_bytes, make_index
+
+
+def iter_chunks(source_id: str, data: list):
+    """Yield the chunks of one processed source (parsed JSON entries)."""
+    for entry in data:
+        section_name = entry.get("section", "Unknown Section")
+
+        # -----------------------------
+        # CASE 1: structured medical docs
+        # -----------------------------
+        if "subsections" in entry:
+            for idx, sub in enumerate(entry["subsections"]):
+                sub_title = sub.get("title", "")
+                content_list = sub.get("content", [])
+
+                text = "\n".join(content_list)
+
+                yield {
                     "text": text,
                     "source": source_id,
-                    "source_type": "forum",
+                    "source_type": "structured",
                     "section": section_name,
-                    "subsection": None,
-                    "chunk_id": f"{source_id}_{section_name}"
+                    "subsection": sub_title,
+                    "chunk_id": f"{source_id}_{section_name}_{idx}"
                 }
-                all_chunks.append(chunk)
 
-    return all_chunks
-
-
-def build_faiss_index():
-    chunks = load_all_sources()
-    texts = [c["text"] for c in chunks]
-
-    embeddings = model.encode(texts, convert_to_numpy=True)
+        # -----------------------------
+        # CASE 2: forum datasets
+        # -----------------------------
+        elif "answer" in entry:
+            answer_list = entry.get("answer", [])
+            text = "\n".join(answer_list)
+
+            yield {
+                "text": text,
+                "source": source_id,
+                "source_type": "forum",
+                "section": section_name,
+                "subsection": None,
+                "chunk_id": f"{source_id}_{section_name}"
+            }
+
+
+def iter_source_file(fp: Path):
+    """Yield the chunks of Data/processed/<source_id>.json."""
+    with open(fp, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    yield from iter_chunks(fp.stem, data)
+
+
+def load_all_sources(processed_dir: Path = None):
+    processed_dir = Path(processed_dir or settings.processed_dir)
+    files = sorted(processed_dir.glob("*.json"))
+    return [chunk for fp in files for chunk in iter_source_file(fp)]
+
+
+def embed_chunk_stream(model, chunks, batch_size: int = None) -> tuple:
+    """
+    Embed chunks from any iterable in batches as they arrive, so the
+    producer (e.g. a parser) never has to materialize the whole source.
+
+    Returns: (list of chunks, float32 unit-normalized embeddings)
+    """
+    batch_size = batch_size or settings.embed_batch_size
+    chunks_iter = iter(chunks)
+    kept, parts = [], []
+
+    while True:
+        batch = list(islice(chunks_iter, batch_size))
+        if not batch:
+            break
+        kept.extend(batch)
+        parts.append(model.encode(
+            [c["text"] for c in batch],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32, copy=False))
+
+    dim = model.get_sentence_embedding_dimension()
+    return kept, (np.vstack(parts) if parts else np.zeros((0, dim), dtype=np.float32))
+
+
+def write_vector_db(chunks: list, embeddings, model, embed_dir: Path = None, storage: str = None, batch_size: int = None):
+    """
+    Write the FAISS index, raw vectors, chunk metadata and relevance
+    calibration for already embedded chunks as a new index version under
+    embed_dir, then make it the live version (see index_versions).
+    With settings.reduce_dims set, everything is stored in the reduced
+    dimension and the projection is saved with it (see reduction).
+
+    Returns: the new version name
+    """
+    embed_dir = Path(embed_dir or settings.embed_dir)
+    version, out_dir = new_version_dir(embed_dir)
+
+    # Optional dimensionality reduction, fitted on this corpus
+    reduction = None
+    if settings.reduce_dims is not None:
+        reduction = fit_reduction(embeddings, settings.reduce_dims, settings.reduce_method)
+        save_reduction(reduction, out_dir / settings.reduction_file)
+        print(
+            f"[INFO] {reduction['method']} reduction {embeddings.shape[1]}d -> {settings.reduce_dims}d "
+            f"({reduction['retained']:.1%} of the vector energy kept)"
+        )
+        embeddings = project(embeddings, reduction)
     dim = embeddings.shape[1]
 
     # Create FAISS index
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    storage = storage or settings.vector_storage
+    index = make_index(embeddings, storage, settings.pq_m, settings.pq_nbits)
+    print(f"[INFO] {storage} index: {index_bytes(index) / 2**20:.2f} MB for {index.ntotal} x {dim}d vectors")
 
     # Save index + metadata
-    faiss.write_index(index, str(EMBED_DIR / "t2dm_index.faiss"))
-    np.save(str(EMBED_DIR / "vectors.npy"), embeddings)
+    faiss.write_index(index, str(out_dir / settings.index_file))
+    np.save(str(out_dir / settings.vectors_file), embeddings.astype(np.float32, copy=False))
 
-    with open(EMBED_DIR / "metadata.json", "w", encoding="utf-8") as f:
+    with open(out_dir / settings.metadata_file, "w", encoding="utf-8") as f:
         json.dump(chunks, f, indent=2)
 
+    # Fit cosine -> P(relevant) on title queries vs. their own / other chunks
+    query_vecs = model.encode(
+        calibration_queries(chunks),
+        batch_size=batch_size or settings.embed_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    if reduction is not None:
+        query_vecs = project(query_vecs, reduction)
+    calibration = fit_calibration(query_vecs, embeddings, [f"{c['source']}|{c['section']}" for c in chunks])
+    save_calibration(calibration, out_dir / settings.calibration_file)
+    print(
+        f"[INFO] Relevance calibration: a={calibration['a']:.2f} b={calibration['b']:.2f} "
+        f"(median cosine {calibration['positive_cosine_median']:.2f} relevant / "
+        f"{calibration['negative_cosine_median']:.2f} unrelated)"
+    )
+
     print("[INFO] Vector DB created with", len(chunks), "chunks.")
 
+    # Running retrievers pick the new version up and swap to it
+    activate(version, embed_dir)
+    prune(embed_dir=embed_dir)
+    return version
+
+
+def build_faiss_index(
+    processed_dir: Path = None,
+    embed_dir: Path = None,
+    model_name: str = None,
+    batch_size: int = None,
+    storage: str = None,
+):
+    """
+    Chunk every processed source, embed the chunks and write the FAISS
+    index, raw vectors and chunk metadata to a new version in embed_dir.
+    Arguments default to the deployment settings.
+
+    Embeddings are unit-normalized and indexed by inner product, so
+    search scores are cosine similarities. A relevance calibration
+    (cosine -> P(relevant), see calibration.py) is fitted on the same
+    corpus and saved next to the index.
+
+    storage selects the index encoding (flat / fp16 / pq); vectors.npy
+    always keeps full precision for exact re-scoring. settings.reduce_dims
+    optionally lowers the dimension of both (see reduction).
+
+    For incremental rebuilds that only re-embed changed sources, use
+    `python -m app.pipeline run`.
+    """
+    model = SentenceTransformer(model_name or settings.embed_model)
+    chunks, embeddings = embed_chunk_stream(model, load_all_sources(processed_dir), batch_size)
+    return write_vector_db(chunks, embeddings, model, embed_dir, storage, batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store")
+    parser.add_argument("--processed-dir", type=Path, default=settings.processed_dir)
+    parser.add_argument("--embed-dir", type=Path, default=settings.embed_dir)
+    parser.add_argument("--model", default=settings.embed_model)
+    parser.add_argument("--batch-size", type=int, default=settings.embed_batch_size)
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default=settings.vector_storage)
+    args = parser.parse_args()
+
+    build_faiss_index(args.processed_dir, args.embed_dir, args.model, args.batch_size, args.storage)
+
 
 if __name__ == "__main__":
-    build_faiss_index()
+    main()
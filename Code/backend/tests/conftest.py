@@ -0,0 +1,79 @@
+"""
+Shared test setup. Run from Code/backend:
+
+  python -m pytest -q
+
+Settings are read once at import, so the environment is fixed here,
+before any app module is imported: no hot-swap watcher, the offline
+Gemini stand-in, and throwaway data directories for anything a test
+writes.
+"""
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ["TRUSTMED_INDEX_WATCH_SECONDS"] = "0"
+os.environ["TRUSTMED_LLM_BACKEND"] = "fake"
+os.environ.pop("TRUSTMED_SETTINGS_FILE", None)
+os.environ.pop("TRUSTMED_EMBED_CACHE_DIR", None)
+os.environ.setdefault("TRUSTMED_EMBED_DIR", tempfile.mkdtemp(prefix="trustmedai-test-embeddings-"))
+
+
+class HashEmbedder:
+    """
+    Offline stand-in for the SentenceTransformer model: a bag of hashed
+    words. Texts sharing words get similar vectors, which is all the
+    retrieval tests need.
+    """
+
+    dim = 64
+
+    def __init__(self, name=None, *args, **kwargs):
+        self.name = name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            seed = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vec += np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vec
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        vecs = np.array([self._vector(t) for t in ([texts] if single else texts)], dtype=np.float32).reshape(-1, self.dim)
+        if normalize_embeddings:
+            vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+        return vecs[0] if single else vecs
+
+
+@pytest.fixture(scope="session")
+def retriever():
+    """
+    app.retriever over an index of the committed Data/processed chunks,
+    embedded with HashEmbedder (the real model needs a download).
+    """
+    import sentence_transformers
+
+    from app import vector_store
+
+    model = HashEmbedder()
+    chunks, vectors = vector_store.embed_chunk_stream(model, vector_store.load_all_sources())
+    vector_store.write_vector_db(chunks, vectors, model)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(sentence_transformers, "SentenceTransformer", HashEmbedder)
+        from app import retriever
+    return retriever
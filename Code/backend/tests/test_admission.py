@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.admission import AdmissionController, AdmissionMiddleware, Rejected, RequestClass, TokenBuckets
+
+ROUTES = {"/chat": "chat", "/tts": "tts"}
+
+
+def controller(capacity: int = 1, rate: float = 0.0, burst: int = 10) -> AdmissionController:
+    classes = [
+        RequestClass("chat", 0, max_queue=4, deadline=10.0, rate_per_minute=rate),
+        RequestClass("tts", 1, max_queue=4, deadline=5.0, rate_per_minute=rate),
+        RequestClass("batch", 2, max_queue=2, deadline=2.0, rate_per_minute=rate),
+    ]
+    return AdmissionController(capacity, classes, ROUTES, burst)
+
+
+def test_classify():
+    c = controller()
+
+    assert c.classify("/chat/").name == "chat"
+    assert c.classify("/health") is None
+    assert c.classify("/chat", "batch").name == "batch"
+    assert c.classify("/tts", "chat").name == "tts"  # cannot raise its own priority
+    assert c.classify("/chat", "unknown").name == "chat"
+
+
+def test_waiters_are_admitted_by_priority():
+    async def scenario():
+        c = controller(capacity=1)
+        chat, tts, batch = (c.classes[n] for n in ("chat", "tts", "batch"))
+        order = []
+
+        async def request(cls, tag):
+            await c.acquire(cls, "client")
+            order.append(tag)
+            c.release(cls, 0.01)
+
+        await c.acquire(chat, "client")  # occupies the only slot
+        tasks = []
+        for cls, tag in ((batch, "batch"), (tts, "tts"), (chat, "chat-2"), (chat, "chat-3")):
+            tasks.append(asyncio.create_task(request(cls, tag)))
+            await asyncio.sleep(0)
+        c.release(chat, 0.01)
+        await asyncio.gather(*tasks)
+        return order, c.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["chat-2", "chat-3", "tts", "batch"]
+    assert stats["running"] == 0 and stats["queued"] == 0
+
+
+def test_batch_is_shed_before_interactive_work():
+    async def scenario():
+        c = controller(capacity=1)
+        chat, batch = c.classes["chat"], c.classes["batch"]
+        for cls in (chat, batch):
+            cls.service_ewma = 1.5
+
+        await c.acquire(chat, "client")
+        waiting = asyncio.create_task(c.acquire(chat, "client"))
+        await asyncio.sleep(0)
+
+        # 1.5 s queued + half a running request: over batch's 2 s deadline, within chat's 10 s
+        with pytest.raises(Rejected) as shed:
+            await c.acquire(batch, "client")
+        chat_wait = c.expected_wait(chat)
+
+        waiting.cancel()
+        return shed.value, chat_wait, batch.counters
+
+    rejected, chat_wait, counters = asyncio.run(scenario())
+    assert (rejected.status, rejected.reason) == (503, "overloaded")
+    assert rejected.retry_after >= 1
+    assert chat_wait < 10.0
+    assert counters["shed_deadline"] == 1
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        c = controller(capacity=1)
+        batch = c.classes["batch"]
+        await c.acquire(c.classes["chat"], "client")
+        waiters = [asyncio.create_task(c.acquire(batch, "client")) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            await c.acquire(batch, "client")
+        finally:
+            for w in waiters:
+                w.cancel()
+
+    with pytest.raises(Rejected, match="queue_full"):
+        asyncio.run(scenario())
+
+
+def test_token_bucket_limits_each_client():
+    cls = RequestClass("chat", 0, 4, 10.0, rate_per_minute=60)
+    buckets = TokenBuckets(burst=2)
+
+    assert buckets.take("a", cls) == 0.0
+    assert buckets.take("a", cls) == 0.0
+    assert buckets.take("a", cls) == pytest.approx(1.0, abs=0.05)  # one token per second
+    assert buckets.take("b", cls) == 0.0
+
+
+def test_middleware_returns_retry_after():
+    def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/chat", ok, methods=["POST"]), Route("/health", ok)])
+    c = controller(rate=60, burst=1)
+    client = TestClient(AdmissionMiddleware(app, c))
+
+    assert client.post("/chat").status_code == 200
+    limited = client.post("/chat")
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "1"
+    assert limited.json()["error"] == "rate_limited"
+
+    # Own bucket per class; ungated routes pass straight through
+    assert client.post("/chat", headers={"X-Request-Class": "batch"}).status_code == 200
+    assert client.get("/health").status_code == 200
+    assert c.stats()["classes"]["chat"]["admitted"] == 1
+
+
+def test_slot_granted_as_the_deadline_fires_is_kept(monkeypatch):
+    async def scenario():
+        c = controller(capacity=1)
+        chat = c.classes["chat"]
+        await c.acquire(chat, "client")
+
+        async def deadline_races_release(future, timeout):
+            c.release(chat, 0.01)  # hands the slot to this waiter...
+            raise asyncio.TimeoutError  # ...as its deadline fires
+
+        monkeypatch.setattr(asyncio, "wait_for", deadline_races_release)
+        await c.acquire(chat, "client")
+        c.release(chat, 0.01)
+        return c.stats(), chat
+
+    stats, chat = asyncio.run(scenario())
+    assert stats["running"] == 0 and chat.running == 0
+    assert chat.counters["admitted"] == 2 and chat.counters["shed_timeout"] == 0
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from app.calibration import DEFAULT_CALIBRATION, calibrate, fit_calibration, fit_logistic, load_calibration
+
+
+def test_fit_logistic_recovers_parameters():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1, 1, 20000)
+    y = (rng.random(len(x)) < calibrate(x, {"a": 6.0, "b": -1.5})).astype(float)
+
+    params = fit_logistic(x, y)
+
+    assert params["a"] == pytest.approx(6.0, rel=0.1)
+    assert params["b"] == pytest.approx(-1.5, rel=0.1)
+
+
+def test_fit_calibration_separates_own_section_from_others():
+    rng = np.random.default_rng(1)
+    chunks = rng.standard_normal((60, 16))
+    chunks /= np.linalg.norm(chunks, axis=1, keepdims=True)
+    queries = chunks + 0.5 * rng.standard_normal(chunks.shape)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    params = fit_calibration(queries, chunks, [f"sec{i // 2}" for i in range(60)])
+
+    assert params["positives"] == 60 and params["negatives"] == 300
+    assert params["positive_cosine_median"] > params["negative_cosine_median"]
+    assert params["a"] > 0
+    assert calibrate(params["positive_cosine_median"], params) > 0.5 > calibrate(params["negative_cosine_median"], params)
+
+
+def test_missing_calibration_falls_back_to_defaults(tmp_path):
+    assert load_calibration(tmp_path / "calibration.json") == DEFAULT_CALIBRATION
+
+
+def test_search_is_cosine_and_scores_are_calibrated(retriever):
+    vec = retriever.embed_query("metformin side effects")
+    assert np.linalg.norm(vec) == pytest.approx(1.0, abs=1e-5)
+
+    hits = retriever.search_chunks(vec, k=5)
+    scaled = retriever.search_chunks(7.5 * vec, k=5)  # query length must not matter
+
+    assert [h.chunk_id for h in scaled] == [h.chunk_id for h in hits]
+    scores = [h.score for h in hits]
+    assert all(0.0 <= s <= 1.0 for s in scores)
+    assert scores == sorted(scores, reverse=True)
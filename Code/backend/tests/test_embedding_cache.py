@@ -0,0 +1,94 @@
+import os
+import time
+
+import numpy as np
+
+from app.embedding_cache import EmbeddingCache, cache_namespace, normalize_query
+
+
+def vec(seed: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is\tA1C?\n") == "What is A1C?"
+    assert normalize_query("What is A1C?", lowercase=True) == "what is a1c?"
+
+
+def test_memory_lru_is_capped_in_bytes():
+    entry = vec(0).nbytes + len("q0")
+    cache = EmbeddingCache(max_bytes=3 * entry)
+
+    for i in range(3):
+        cache.put(f"q{i}", vec(i))
+    cache.get("q0")           # q1 is now least recently used
+    cache.put("q3", vec(3))
+
+    assert cache.get("q1") is None
+    assert np.array_equal(cache.get("q0"), vec(0))
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_cached_vectors_are_read_only():
+    cache = EmbeddingCache()
+    stored = cache.put("q", vec(0))
+    assert not stored.flags.writeable
+
+
+def test_casing_follows_the_model():
+    cased, uncased = EmbeddingCache(lowercase=False), EmbeddingCache(lowercase=True)
+    for cache in (cased, uncased):
+        cache.put("Metformin  dose", vec(0))
+
+    assert cased.get("metformin dose") is None
+    assert cased.get("Metformin dose") is not None
+    assert uncased.get("metformin dose") is not None
+
+
+def test_disk_tier_is_shared_per_model_and_dim(tmp_path):
+    ns = cache_namespace("all-MiniLM-L6-v2", 8)
+    EmbeddingCache(disk_dir=tmp_path, namespace=ns, dim=8).put("q", vec(0))
+
+    # Another worker of the same model reads it from disk
+    other = EmbeddingCache(disk_dir=tmp_path, namespace=ns, dim=8)
+    assert np.array_equal(other.get("q"), vec(0))
+    assert other.stats()["disk_hits"] == 1
+
+    # A different model never sees it
+    assert EmbeddingCache(disk_dir=tmp_path, namespace=cache_namespace("other-model", 8), dim=8).get("q") is None
+
+
+def test_disk_tier_ignores_vectors_of_another_dim(tmp_path):
+    EmbeddingCache(disk_dir=tmp_path, dim=8).put("q", vec(0))
+    assert EmbeddingCache(disk_dir=tmp_path, dim=16).get("q") is None
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    probe = EmbeddingCache(disk_dir=tmp_path / "probe", dim=8)
+    probe.put("q", vec(0))
+    file_size = probe._disk_path("q").stat().st_size
+
+    cache = EmbeddingCache(disk_dir=tmp_path / "cache", disk_max_bytes=4 * file_size, dim=8)
+
+    for i in range(4):
+        cache.put(f"q{i}", vec(i))
+        path = cache._disk_path(f"q{i}")
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    for i in range(4, 8):
+        cache.put(f"q{i}", vec(i))
+
+    stats = cache.stats()
+    assert stats["disk_evictions"] > 0
+    assert stats["disk_bytes"] <= cache.disk_max_bytes
+    assert sum(f.stat().st_size for f in cache.disk_dir.glob("*.npy")) <= cache.disk_max_bytes
+    assert not cache._disk_path("q0").exists()   # oldest went first
+    assert cache._disk_path("q7").exists()
+
+
+def test_rewriting_a_file_does_not_count_it_twice(tmp_path):
+    cache = EmbeddingCache(disk_dir=tmp_path, dim=8)
+    for _ in range(5):
+        cache.put("q", vec(0))
+
+    assert cache.stats()["disk_bytes"] == cache._disk_path("q").stat().st_size
+    assert cache.stats()["disk_evictions"] == 0
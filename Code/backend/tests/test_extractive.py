@@ -0,0 +1,98 @@
+import numpy as np
+
+from app.extractive import CLOSING_LINES, extractive_answer, select_sentences, split_sentences
+from app.hits import Hit
+
+CHUNK = (
+    "- Home\n"
+    "- What Is The A1C Test?\n"
+    "The A1C test measures your average blood glucose over the past three months. "
+    "It is also called the hemoglobin A1C test. Results are given as a percentage.\n"
+    "Symptoms can include:\n"
+    "- Blurry vision\n"
+    "Ok then."
+)
+
+
+def hit(text: str = CHUNK, score: float = 0.95, source: str = "ada_t2dm", source_type: str = "structured") -> Hit:
+    return Hit(1, 0.1, text, source, source_type, "A1C", None, f"{source}_A1C_0", score=score)
+
+
+def test_split_sentences():
+    assert split_sentences(CHUNK) == [
+        "The A1C test measures your average blood glucose over the past three months.",
+        "It is also called the hemoglobin A1C test.",
+        "Results are given as a percentage.",
+        "Blurry vision",
+    ]
+
+
+def test_select_sentences_skips_near_duplicates_and_keeps_document_order():
+    query = np.array([1.0, 0.0, 0.0])
+    sentences = np.array([
+        [0.2, 1.0, 0.0],   # unrelated
+        [1.0, 0.6, 0.0],   # second best
+        [1.0, 0.0, 0.1],   # best
+        [1.0, 0.0, 0.11],  # copy of the best
+    ])
+
+    chosen, cosine = select_sentences(query, sentences, max_sentences=2)
+
+    assert chosen == [1, 2]
+    assert int(np.argmax(cosine)) == 2
+
+
+def fake_embed(sentences):
+    """Sentences mentioning "A1C" are close to QUERY (and not to each other), the rest orthogonal."""
+    vecs = []
+    for i, s in enumerate(sentences):
+        if "A1C" in s:
+            vecs.append([1.0, 0.6 * (i % 2), 0.6 * (1 - i % 2), 0.0])
+        else:
+            vecs.append([0.0, 0.0, 0.0, 1.0])
+    return np.array(vecs)
+
+
+QUERY = np.array([1.0, 0.0, 0.0, 0.0])
+
+
+def test_extracts_matching_sentences():
+    answer, detail = extractive_answer(QUERY, [hit()], fake_embed)
+
+    assert answer == (
+        "* The A1C test measures your average blood glucose over the past three months.\n"
+        "* It is also called the hemoglobin A1C test.\n"
+        "* Results are given as a percentage.\n\n" + CLOSING_LINES  # "Blurry vision" repeats it
+    )
+    assert detail == {"reason": "extracted", "chunk_id": "ada_t2dm_A1C_0", "best_cosine": 0.857}
+
+
+def test_gate_sends_other_chunks_to_gemini():
+    assert extractive_answer(QUERY, [], fake_embed)[0] is None
+    assert extractive_answer(QUERY, [hit(score=0.5)], fake_embed)[0] is None
+    assert extractive_answer(QUERY, [hit(source="forums_t2dm")], fake_embed)[0] is None
+    assert extractive_answer(QUERY, [hit(source_type="forum")], fake_embed)[0] is None
+
+    answer, detail = extractive_answer(QUERY, [hit(text="Results are given as a percentage.")], fake_embed)
+    assert answer is None and detail["reason"].startswith("best sentence cosine")
+
+
+def test_failed_extraction_falls_back_to_gemini(retriever, monkeypatch):
+    from app import answer_generator
+    from app.sessions import Session
+
+    def broken(*args):
+        raise RuntimeError("tokenizer crashed")
+
+    chunks = [hit()]
+    monkeypatch.setattr(answer_generator, "extractive_answer", broken)
+    monkeypatch.setattr(answer_generator.retrieval, "search_chunks", lambda *args, **kwargs: chunks)
+    errors = answer_generator.answer_stats["extractive_errors"]
+    llm_answers = answer_generator.answer_stats["llm_answers"]
+
+    answer, _, used, _ = answer_generator.answer_turn("What is the A1C test?", 5, None, Session("s", 2))
+
+    assert answer
+    assert used == chunks
+    assert answer_generator.answer_stats["extractive_errors"] == errors + 1
+    assert answer_generator.answer_stats["llm_answers"] == llm_answers + 1
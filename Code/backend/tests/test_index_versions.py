@@ -0,0 +1,104 @@
+import pytest
+
+from app import index_versions
+from app.index_versions import activate, current_version, list_versions, new_version_dir, prune, version_sort_key
+from app.settings import settings
+
+
+def make_versions(embed_dir, names: list):
+    for name in names:
+        path = index_versions.versions_root(embed_dir) / name
+        path.mkdir(parents=True)
+        (path / settings.index_file).write_bytes(b"index")
+
+
+def test_counter_suffixes_sort_numerically():
+    names = ["20250101-120000-10", "20250101-120000", "20250101-120000-2", "20241231-235959-3", "20250101-120001"]
+
+    assert sorted(names, key=version_sort_key) == [
+        "20241231-235959-3",
+        "20250101-120000",
+        "20250101-120000-2",
+        "20250101-120000-10",
+        "20250101-120001",
+    ]
+
+
+def test_new_versions_are_listed_in_build_order(tmp_path):
+    built = [new_version_dir(tmp_path) for _ in range(12)]
+    for _, path in built:
+        (path / settings.index_file).write_bytes(b"index")
+
+    assert list_versions(tmp_path) == [version for version, _ in built]
+
+
+def test_incomplete_versions_are_not_listed(tmp_path):
+    make_versions(tmp_path, ["20250101-120000"])
+    (index_versions.versions_root(tmp_path) / "20250101-130000").mkdir()  # build still running
+
+    assert list_versions(tmp_path) == ["20250101-120000"]
+
+
+def test_prune_keeps_newest_and_current(tmp_path):
+    names = [f"20250101-120000-{n}" for n in range(2, 12)]  # -2 ... -11
+    make_versions(tmp_path, ["20250101-120000"] + names)
+    activate("20250101-120000-3", tmp_path)  # rolled back
+
+    removed = prune(keep=3, embed_dir=tmp_path)
+
+    assert list_versions(tmp_path) == ["20250101-120000-3", "20250101-120000-9", "20250101-120000-10", "20250101-120000-11"]
+    assert "20250101-120000-10" not in removed
+
+
+def test_activate_requires_a_built_version(tmp_path):
+    assert current_version(tmp_path) == index_versions.LEGACY_VERSION
+    with pytest.raises(FileNotFoundError):
+        activate("20250101-120000", tmp_path)
+
+    make_versions(tmp_path, ["20250101-120000"])
+    activate("20250101-120000", tmp_path)
+    assert current_version(tmp_path) == "20250101-120000"
+
+
+def test_hot_swap_waits_for_leases(retriever):
+    from app import vector_store
+    from conftest import HashEmbedder
+
+    original = retriever.index_version()
+    model = HashEmbedder()
+    chunks, vectors = vector_store.embed_chunk_stream(model, vector_store.load_all_sources()[:10])
+    new_version = vector_store.write_vector_db(chunks, vectors, model)
+
+    with retriever.lease() as old:
+        retriever.swap_to(retriever.load_version(new_version), drain_seconds=0.1)
+        assert retriever.index_version() == new_version
+        # Still leased, so not closed: the request finishes on its version
+        assert old.version == original and old.index is not None
+        assert old.search_many(retriever.embed_query("insulin"), k=3)[0]
+
+    assert retriever.active.index.ntotal == 10
+    assert retriever.search_chunks(retriever.embed_query("insulin"), k=3)[0].index_version == new_version
+
+    # Roll back through the CURRENT pointer, as a running worker would see it
+    activate(original)
+    watcher = retriever.IndexWatcher(interval=3600)
+    try:
+        watcher.check()
+    finally:
+        watcher.stop()
+    assert retriever.index_version() == original
+
+
+def test_stats_describe_the_version_they_leased(retriever, monkeypatch):
+    before = retriever.active
+    replacement = retriever.load_version(before.version)
+
+    def swap_meanwhile():
+        retriever.swap_to(replacement, drain_seconds=0.1)
+        return {}
+
+    monkeypatch.setattr(retriever.query_cache, "stats", swap_meanwhile)
+    stats = retriever.stats()
+
+    assert retriever.active is replacement
+    assert stats["index_version"] == before.version and stats["chunks"] == before.index.ntotal
@@ -0,0 +1,43 @@
+import pytest
+
+from app.loadtest import Workload, arrival_rate, percentile
+
+SCENARIO = {
+    "mix": {"/chat": 0.6, "/tts": 0.3, "/health": 0.1},
+    "followup_rate": 0.3,
+    "questions": {"source": "faq", "zipf_s": 1.1},
+}
+
+
+def requests(seed: int, n: int = 200) -> list:
+    workload = Workload(SCENARIO, seed)
+    out = []
+    for i in range(n):
+        endpoint, payload = workload.next_request()
+        if endpoint == "/chat" and i % 3 == 0:
+            workload.remember_session(f"s{i}")
+        out.append((endpoint, payload))
+    return out
+
+
+def test_same_seed_same_workload(retriever):
+    # The retriever fixture writes the index metadata the TTS texts come from
+    first = requests(seed=7)
+
+    assert first == requests(seed=7)
+    assert first != requests(seed=8)
+    assert {endpoint for endpoint, _ in first} == {"/chat", "/tts", "/health"}
+
+
+def test_arrival_rate():
+    bursty = {"type": "bursty", "period_s": 10, "burst_s": 2, "burst_rate": 50, "base_rate": 5}
+
+    assert arrival_rate({"rate": 12}, 3.0) == 12
+    assert arrival_rate(bursty, 11.0) == 50
+    assert arrival_rate(bursty, 15.0) == 5
+
+
+@pytest.mark.parametrize("q, expected", [(0.0, 1), (0.5, 6), (0.95, 10), (1.0, 10)])
+def test_percentile(q, expected):
+    assert percentile(list(range(1, 11)), q) == expected
+    assert percentile([], q) == 0.0
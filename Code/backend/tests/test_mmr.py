@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.hits import default_fetch_k, mmr_order
+
+
+def naive_mmr(query, cand, k, lambda_):
+    """Textbook MMR, one similarity at a time."""
+    cos = lambda a, b: float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+    selected, rest = [], list(range(len(cand)))
+    while rest and len(selected) < k:
+        score = lambda i: lambda_ * cos(cand[i], query) - (1 - lambda_) * max((cos(cand[i], cand[j]) for j in selected), default=0.0)
+        best = max(rest, key=score) if selected else max(rest, key=lambda i: cos(cand[i], query))
+        selected.append(best)
+        rest.remove(best)
+    return selected
+
+
+def test_matches_naive_mmr():
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(32)
+    cand = rng.standard_normal((40, 32))
+
+    for lambda_ in (0.0, 0.3, 0.7, 1.0):
+        assert mmr_order(query, cand, 10, lambda_).tolist() == naive_mmr(query, cand, 10, lambda_)
+
+
+def test_lambda_one_is_relevance_order():
+    rng = np.random.default_rng(1)
+    query = rng.standard_normal(16)
+    cand = rng.standard_normal((12, 16))
+    relevance = cand @ query / np.linalg.norm(cand, axis=1)
+
+    assert mmr_order(query, cand, 5, 1.0).tolist() == np.argsort(-relevance)[:5].tolist()
+
+
+def test_skips_near_duplicates():
+    query = np.array([1.0, 0.0, 0.0])
+    cand = np.array([
+        [0.9, 0.1, 0.0],
+        [0.9, 0.1001, 0.0],  # near copy of the best candidate
+        [0.6, 0.0, 0.8],
+    ])
+
+    assert mmr_order(query, cand, 2, 1.0).tolist() == [0, 1]
+    assert mmr_order(query, cand, 2, 0.5).tolist() == [0, 2]
+
+
+def test_edge_cases():
+    query = np.ones(4)
+    assert mmr_order(query, np.zeros((0, 4)), 3).tolist() == []
+    assert mmr_order(query, np.eye(4), 0).tolist() == []
+    assert sorted(mmr_order(query, np.eye(4), 10).tolist()) == [0, 1, 2, 3]
+
+
+def test_default_fetch_k_over_fetches_for_reranking():
+    assert default_fetch_k(5) == 5
+    assert default_fetch_k(5, mmr_lambda=0.5) == 20
+    assert default_fetch_k(5, dedupe_sections=True) == 20
+
+
+def test_search_with_mmr(retriever):
+    vec = retriever.embed_query("blood sugar levels and diabetes treatment")
+
+    plain = retriever.search_chunks(vec, k=5)
+    relevance_only = retriever.search_chunks(vec, k=5, mmr_lambda=1.0, fetch_k=5)
+    diverse = retriever.search_chunks(vec, k=5, mmr_lambda=0.3)
+
+    assert [h.chunk_id for h in relevance_only] == [h.chunk_id for h in plain]
+    assert diverse[0].chunk_id == plain[0].chunk_id
+    assert [h.rank for h in diverse] == [1, 2, 3, 4, 5]
+    assert len({h.chunk_id for h in diverse}) == 5
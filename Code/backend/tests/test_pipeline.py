@@ -0,0 +1,108 @@
+from app.pipeline import PipelineRunner, Stage
+
+
+def build(tmp_path, log: list, fail=()):
+    """
+    raw.txt -> parse -> parsed.txt -> index -> index.txt
+               chunk ~~> embed -> vectors.txt ---^
+    """
+    raw, parsed, vectors, index = (tmp_path / n for n in ("raw.txt", "parsed.txt", "vectors.txt", "index.txt"))
+
+    def step(name, fn):
+        def run(ctx):
+            log.append(name)
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            return fn(ctx)
+        return run
+
+    def parse_stage(ctx):
+        parsed.write_text(raw.read_text().upper())
+        return parsed.read_text().split()
+
+    def chunk_stage(ctx):
+        # Parsed entries are handed over in memory when parse ran in this run
+        words = ctx.result("parse") or parsed.read_text().split()
+        yield from words
+
+    def embed_stage(ctx):
+        words = list(ctx.stream("chunk"))
+        vectors.write_text(",".join(str(len(w)) for w in words))
+        return words
+
+    def index_stage(ctx):
+        index.write_text(vectors.read_text())
+
+    return [
+        Stage("parse", step("parse", parse_stage), inputs=[raw], outputs=[parsed]),
+        Stage("chunk", step("chunk", chunk_stage), inputs=[parsed], stream=True),
+        Stage("embed", step("embed", embed_stage), outputs=[vectors], streams_from="chunk", params={"model": "test"}),
+        Stage("index", step("index", index_stage), inputs=[vectors], outputs=[index]),
+    ]
+
+
+def run(tmp_path, force=(), fail=()) -> tuple:
+    log = []
+    report = PipelineRunner(build(tmp_path, log, fail), tmp_path / "state.json", force=force).run()
+    return log, {name: r["status"] for name, r in report["stages"].items()}, report
+
+
+def test_unchanged_inputs_skip_every_stage(tmp_path):
+    (tmp_path / "raw.txt").write_text("glucose insulin a1c")
+
+    log, status, report = run(tmp_path)
+    assert log == ["parse", "embed", "chunk", "index"]
+    assert report["stages"]["chunk"]["items"] == 3
+    assert (tmp_path / "index.txt").read_text() == "7,7,3"
+
+    log, status, _ = run(tmp_path)
+    assert log == []
+    assert set(status.values()) == {"skipped"}
+
+
+def test_changed_input_reruns_only_downstream(tmp_path):
+    (tmp_path / "raw.txt").write_text("glucose insulin")
+    run(tmp_path)
+
+    (tmp_path / "raw.txt").write_text("glucose insulin")  # same content, new mtime
+    assert run(tmp_path)[0] == []
+
+    (tmp_path / "raw.txt").write_text("glucose")
+    log, status, _ = run(tmp_path)
+    assert log == ["parse", "embed", "chunk", "index"]
+    assert (tmp_path / "index.txt").read_text() == "7"
+
+
+def test_forced_stage_runs_and_unchanged_outputs_stop_propagation(tmp_path):
+    (tmp_path / "raw.txt").write_text("glucose")
+    run(tmp_path)
+
+    log, status, _ = run(tmp_path, force=["parse"])
+    assert log == ["parse"]  # same parsed.txt, so embed and index stay skipped
+    assert status["parse"] == "ran" and status["index"] == "skipped"
+
+
+def test_failed_stage_blocks_dependents(tmp_path):
+    (tmp_path / "raw.txt").write_text("glucose")
+
+    log, status, report = run(tmp_path, fail=["embed"])
+
+    assert "index" not in log
+    assert status["embed"] == "failed" and status["index"] == "blocked"
+    assert not report["ok"]
+
+    # The failure was not recorded as a success: the next run retries it
+    assert run(tmp_path)[0] == ["embed", "chunk", "index"]
+
+
+def test_ingestion_graph_wiring(tmp_path):
+    from app.pipeline import build_stages
+
+    runner = PipelineRunner(build_stages(from_raw=True), tmp_path / "state.json")
+    embeds = sorted(name for name in runner.stages if name.startswith("embed:"))
+
+    assert runner.deps("index") == embeds
+    for name in embeds:
+        source = name.split(":", 1)[1]
+        assert f"chunk:{source}" in runner.stages
+    assert [name for name, _, _ in runner.plan()][-1] == "index"
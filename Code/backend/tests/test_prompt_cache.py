@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+from app.fake_gemini import FakeGeminiClient
+from app.hits import Hit
+from app.prompt_cache import ContextCacheRegistry
+
+
+class FakeCaches:
+    """client.caches of google-genai, recording calls."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("Cached content is too small")
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append(name)
+        return SimpleNamespace(name=name, usage_metadata=SimpleNamespace(total_token_count=5000))
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+def registry(fail: bool = False, min_tokens: int = 0, **kwargs) -> ContextCacheRegistry:
+    client = SimpleNamespace(caches=FakeCaches(fail))
+    return ContextCacheRegistry(client, "gemini-test", "system", lambda chunks: "ctx", "Context:", min_tokens=min_tokens, **kwargs)
+
+
+def chunks(*ids) -> list:
+    return [Hit(i + 1, 0.1, "text", "src", "structured", "sec", None, cid, index_version="v1") for i, cid in enumerate(ids)]
+
+
+def test_chunk_set_is_uploaded_once_it_is_hot():
+    reg = registry(min_uses=2)
+
+    assert reg.acquire_context(chunks("a", "b")) is None
+    handle = reg.acquire_context(chunks("b", "a"))  # same set, other order
+    reg.release(handle)
+    again = reg.acquire_context(chunks("a", "b"))
+
+    assert handle is not None and again is handle
+    assert reg.client.caches.created == [handle.name]
+    assert reg.stats()["reused"] == 1
+
+
+def test_evicted_handle_is_deleted_after_its_last_lease():
+    reg = registry(min_uses=1, max_handles=1)
+    first = reg.acquire_context(chunks("a"))
+    second = reg.acquire_context(chunks("b"))  # evicts the leased first handle
+
+    assert reg.client.caches.deleted == []
+    reg.release(first)
+    assert reg.client.caches.deleted == [first.name]
+    reg.release(second)
+
+
+def test_failed_create_is_not_retried_until_retry_after():
+    reg = registry(fail=True, min_uses=1, retry_after=300)
+
+    assert reg.acquire_context(chunks("a")) is None
+    assert reg.acquire_context(chunks("a")) is None
+    assert reg.stats()["create_failures"] == 1
+
+    reg.retry_after = 0
+    assert reg.acquire_context(chunks("a")) is None
+    assert reg.stats()["create_failures"] == 2
+
+
+def test_failed_creates_are_bounded():
+    reg = registry(fail=True, min_uses=1, max_handles=2)
+    for i in range(100):
+        reg.acquire_context(chunks(f"c{i}"))
+
+    assert reg.stats()["failed_keys"] <= 2 * 16
+
+
+def test_record_usage_counts_cached_tokens():
+    reg = registry()
+    usage = SimpleNamespace(prompt_token_count=1200, cached_content_token_count=1000)
+
+    assert reg.record_usage(usage) == {"input_tokens": 1200, "cached_input_tokens": 1000, "uncached_input_tokens": 200}
+    assert reg.stats()["avg_tokens_saved_per_request"] == 1000
+
+
+def test_content_below_the_minimum_is_never_uploaded(retriever):
+    from app.answer_generator import SYSTEM_INSTRUCTION
+
+    client = FakeGeminiClient()  # rejects caches under 1024 tokens, like Gemini
+    reg = ContextCacheRegistry(client, "gemini-test", SYSTEM_INSTRUCTION, lambda chunks: "ctx " * (4 * len(chunks)), "Context:", min_uses=1)
+
+    assert reg.acquire_system() is None
+    assert reg.acquire_context(chunks("a")) is None
+    handle = reg.acquire_context(chunks(*(f"c{i}" for i in range(1024))))
+
+    assert handle is not None
+    assert client.caches.created == 1
+    assert reg.stats()["create_failures"] == 0 and reg.stats()["skipped_small"] == 2
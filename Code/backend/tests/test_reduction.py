@@ -0,0 +1,81 @@
+import shutil
+
+import faiss
+import numpy as np
+import pytest
+
+from app.reduction import fit_reduction, load_reduction, project, save_reduction
+from app.settings import settings
+from app.vector_compression import make_index
+
+
+def unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def low_rank():
+    """Unit vectors in 32 dims that only span 8 of them."""
+    rng = np.random.default_rng(0)
+    basis = np.linalg.qr(rng.standard_normal((32, 8)))[0].T
+    return unit(rng.standard_normal((300, 8)) @ basis)
+
+
+def test_pca_keeps_all_energy_at_the_data_rank(low_rank):
+    reduction = fit_reduction(low_rank, 8)
+    assert reduction["components"].shape == (8, 32)
+    assert reduction["retained"] == pytest.approx(1.0, abs=1e-5)
+
+    # Inner products, and so the search order, are unchanged
+    reduced = project(low_rank, reduction)
+    assert np.allclose(reduced @ reduced[:5].T, low_rank @ low_rank[:5].T, atol=1e-4)
+
+
+def test_fewer_dims_keep_less_energy(low_rank):
+    retained = [fit_reduction(low_rank, d)["retained"] for d in (2, 4, 6)]
+    assert retained == sorted(retained) and retained[-1] < 1.0
+
+    truncated = fit_reduction(low_rank, 4, "truncate")
+    assert np.array_equal(truncated["components"], np.eye(32, dtype=np.float32)[:4])
+
+
+def test_invalid_reductions(low_rank):
+    with pytest.raises(ValueError):
+        fit_reduction(low_rank, 64)
+    with pytest.raises(ValueError):
+        fit_reduction(low_rank, 4, "random")
+
+
+def test_save_and_load(tmp_path, low_rank):
+    reduction = fit_reduction(low_rank, 4)
+    save_reduction(reduction, tmp_path / settings.reduction_file)
+
+    loaded = load_reduction(tmp_path / settings.reduction_file)
+    assert loaded["method"] == "pca" and loaded["retained"] == pytest.approx(reduction["retained"])
+    assert np.array_equal(loaded["components"], reduction["components"])
+    assert load_reduction(tmp_path / "missing.npz") is None
+
+
+def test_reduced_version_takes_full_dimension_queries(retriever, tmp_path, monkeypatch):
+    full = retriever.active
+    source = retriever.version_dir(full.version)
+    vectors = np.load(source / settings.vectors_file)
+
+    # The live version, re-stored at 48 of its 64 dimensions
+    reduction = fit_reduction(vectors, 48)
+    reduced = project(vectors, reduction)
+    faiss.write_index(make_index(reduced), str(tmp_path / settings.index_file))
+    np.save(tmp_path / settings.vectors_file, reduced)
+    save_reduction(reduction, tmp_path / settings.reduction_file)
+    for name in (settings.metadata_file, settings.calibration_file):
+        shutil.copy(source / name, tmp_path / name)
+
+    monkeypatch.setattr(retriever, "version_dir", lambda version: tmp_path)
+    idx = retriever.LoadedIndex("reduced")
+    assert (idx.index.d, idx.query_dim) == (48, 64)
+
+    queries = retriever.embed_queries(["What is the A1C test?", "insulin resistance", "healthy eating"])
+    for hits, exact in zip(idx.search_many(queries, 5), full.search_many(queries, 5)):
+        assert hits[0].chunk_id == exact[0].chunk_id
+        assert len({h.chunk_id for h in hits} & {h.chunk_id for h in exact}) >= 3
@@ -0,0 +1,81 @@
+import os
+import secrets
+import stat
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+
+import pytest
+
+from app.retrieval_sidecar import SidecarClient, _wait_for_sidecar, check_authkey, parse_address, prepare_socket_dir, serve
+
+
+@pytest.fixture(scope="module")
+def sidecar(retriever):
+    """A sidecar serving the test index on a private Unix socket (thread, not process)."""
+    address = os.path.join(tempfile.mkdtemp(prefix="trustmedai-test-sidecar-"), "retrieval.sock")
+    authkey = secrets.token_hex(16)
+    threading.Thread(target=serve, args=(address, authkey), daemon=True).start()
+    _wait_for_sidecar(address, authkey, timeout=30)
+    return address, authkey
+
+
+@pytest.mark.parametrize("authkey", ["", "trustmedai"])
+def test_public_authkeys_are_refused(authkey):
+    with pytest.raises(ValueError):
+        check_authkey(authkey)
+    with pytest.raises(ValueError):
+        serve("/nonexistent/retrieval.sock", authkey)
+
+
+def test_private_authkey_is_accepted():
+    check_authkey(secrets.token_hex(16))
+
+
+def test_socket_dir_must_be_private(tmp_path):
+    private = tmp_path / "private" / "retrieval.sock"
+    prepare_socket_dir(str(private))
+    assert stat.S_IMODE(os.stat(private.parent).st_mode) == 0o700
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o755)
+    shared.chmod(0o755)
+    with pytest.raises(PermissionError):
+        prepare_socket_dir(str(shared / "retrieval.sock"))
+
+
+def test_parse_address():
+    assert parse_address("/run/user/1000/trustmedai/retrieval.sock") == "/run/user/1000/trustmedai/retrieval.sock"
+    assert parse_address("10.0.0.5:7000") == ("10.0.0.5", 7000)
+
+
+def test_socket_is_owner_only(sidecar):
+    address, _ = sidecar
+    assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+
+
+def test_sidecar_answers_like_the_local_retriever(sidecar, retriever):
+    client = SidecarClient(*sidecar, timeout=30)
+    query = "How is type 2 diabetes diagnosed?"
+
+    remote = client.retrieve_chunks(query, k=4, dedupe_sections=True)
+    local = retriever.retrieve_chunks(query, k=4, dedupe_sections=True)
+
+    assert [h.chunk_id for h in remote] == [h.chunk_id for h in local]
+    assert client.index_version() == retriever.index_version()
+
+
+def test_wrong_or_missing_key_is_rejected(sidecar):
+    address, authkey = sidecar
+
+    with pytest.raises(AuthenticationError):
+        SidecarClient(address, authkey + "x").stats()
+    with pytest.raises(ConnectionError):
+        SidecarClient(address, "").stats()
+
+
+def test_missing_socket_reads_as_unavailable(tmp_path):
+    client = SidecarClient(str(tmp_path / "retrieval.sock"), secrets.token_hex(16), timeout=1)
+
+    with pytest.raises(ConnectionError, match="unavailable"):
+        client.stats()
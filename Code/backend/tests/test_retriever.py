@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def idx(retriever):
+    with retriever.lease() as idx:
+        yield idx
+
+
+def test_select_hits_drops_padding_and_far_hits(idx):
+    distances = np.array([[0.1, 0.2, 0.6, 0.0]], dtype=np.float32)
+    indices = np.array([[3, 7, 1, -1]], dtype=np.int64)
+
+    rows, dists = idx.select_hits(distances, indices, k=5, max_distance=0.5)
+
+    assert rows.tolist() == [3, 7]
+    assert dists.tolist() == pytest.approx([0.1, 0.2])
+
+
+def test_select_hits_keeps_best_hit_per_section(idx):
+    # Two rows of one (source, section) pair: only the nearer one stays
+    counts = np.bincount(idx.section_ids)
+    first, second = np.flatnonzero(idx.section_ids == np.argmax(counts))[:2].tolist()
+    other = int(np.flatnonzero(idx.section_ids != idx.section_ids[first])[0])
+
+    distances = np.array([[0.1, 0.2, 0.3]], dtype=np.float32)
+    indices = np.array([[first, other, second]], dtype=np.int64)
+
+    rows, _ = idx.select_hits(distances, indices, k=5, dedupe_sections=True)
+    assert rows.tolist() == [first, other]
+
+    rows, _ = idx.select_hits(distances, indices, k=1, dedupe_sections=True)
+    assert rows.tolist() == [first]
+
+
+def test_chunk_text_finds_its_own_chunk(retriever, idx):
+    row = max(range(len(idx.metadata)), key=lambda r: len(idx.metadata[r]["text"]))
+    chunk = idx.metadata[row]
+
+    hits = retriever.retrieve_chunks(chunk["text"], k=3)
+
+    assert hits[0].chunk_id == chunk["chunk_id"]
+    assert hits[0].distance == pytest.approx(0.0, abs=1e-4)
+    assert [h.rank for h in hits] == [1, 2, 3]
+    assert [h.distance for h in hits] == sorted(h.distance for h in hits)
+    assert all(h.index_version == idx.version for h in hits)
+    assert hits[0]["source"] == chunk["source"]  # dict-style access of old callers
+
+
+def test_batched_search_matches_single_searches(retriever):
+    queries = ["What is the A1C test?", "insulin resistance", "exercise and blood sugar"]
+    vecs = retriever.embed_queries(queries)
+
+    batched = retriever.search_many(vecs, k=4, dedupe_sections=True)
+
+    for vec, hits in zip(vecs, batched):
+        single = retriever.search_chunks(vec.reshape(1, -1), k=4, dedupe_sections=True)
+        assert [h.chunk_id for h in hits] == [h.chunk_id for h in single]
+
+
+def test_hits_for_chunk_ids_skips_unknown_ids(retriever, idx):
+    wanted = [idx.metadata[5]["chunk_id"], "no-such-chunk", idx.metadata[2]["chunk_id"]]
+
+    hits = retriever.hits_for_chunk_ids(wanted)
+
+    assert [h.chunk_id for h in hits] == [wanted[0], wanted[2]]
+    assert set(hits[0].to_dict()) >= {"text", "source", "section", "chunk_id", "distance", "score"}
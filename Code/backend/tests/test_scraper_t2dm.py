@@ -0,0 +1,20 @@
+import pytest
+
+from app import scraper_t2dm
+from app.settings import settings
+
+SOURCES = [src for src in scraper_t2dm.T2DM_SOURCES if (settings.raw_dir / f"{src['id']}.html").exists()]
+
+
+@pytest.mark.parametrize("fast", [True, False], ids=["strainer", "full-tree"])
+@pytest.mark.parametrize("src", SOURCES, ids=[src["id"] for src in SOURCES])
+def test_parsers_reproduce_committed_json(src, fast):
+    """Data/processed was written by the original parsers from the same Data/raw pages."""
+    data = scraper_t2dm.parse_source(src["site"], scraper_t2dm.load_raw_html(src["id"]), fast=fast)
+
+    committed = (settings.processed_dir / f"{src['id']}.json").read_bytes()
+    assert scraper_t2dm.dump_json(data) == committed
+
+
+def test_raw_fixtures_present():
+    assert SOURCES, "no Data/raw/*.html fixtures to test the parsers on"
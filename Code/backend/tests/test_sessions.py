@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.hits import blend_followup
+from app.sessions import SessionStore
+
+
+def test_session_keeps_last_turns_and_unique_chunks():
+    store = SessionStore(ttl_seconds=60, max_bytes=1 << 20, max_turns=2)
+    session = store.get_or_create()
+
+    session.add_turn("q1", "a1", np.zeros(4, np.float32), ["c1", "c2"])
+    session.add_turn("q2", "a2", np.zeros(4, np.float32), ["c2", "c3"])
+    session.add_turn("q3", "a3", np.ones(4, np.float32), ["c1"])
+
+    assert session.history_text() == "User: q2\nAssistant: a2\nUser: q3\nAssistant: a3"
+    assert session.chunk_ids == ["c1", "c2", "c3"]
+    assert store.get_or_create(session.id) is session
+
+
+def test_unknown_id_starts_a_session_under_a_fresh_id():
+    store = SessionStore(ttl_seconds=60, max_bytes=1 << 20, max_turns=2)
+    session = store.get_or_create("abc")
+
+    assert session.id != "abc" and len(session.id) == 32
+    assert store.get_or_create("abc") is not session
+    assert store.get_or_create().id != store.get_or_create().id
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl_seconds=60, max_bytes=1 << 20, max_turns=2)
+    old = store.get_or_create()
+    old.last_seen = time.time() - 120
+
+    fresh = store.get_or_create()
+
+    revived = store.get_or_create(old.id)
+    assert revived is not old and revived.id != old.id
+    assert store.get_or_create(fresh.id) is fresh
+    assert store.stats()["evicted"] == 1
+
+
+def test_byte_cap_drops_least_recently_used():
+    store = SessionStore(ttl_seconds=60, max_bytes=4000, max_turns=10)
+    first, second = store.get_or_create(), store.get_or_create()
+    store.get_or_create(first.id)  # second is now least recently used
+
+    first.add_turn("q" * 1000, "a" * 2000, np.zeros(4, np.float32), [])
+    store.update(first)
+
+    stats = store.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert store.get_or_create(first.id) is first
+    assert store.get_or_create(second.id) is not second
+
+
+def test_blend_followup_mixes_directions_and_keeps_norm():
+    q = np.array([2.0, 0.0], dtype=np.float32)
+    p = np.array([0.0, 5.0], dtype=np.float32)
+
+    mixed = blend_followup(q, p, weight=0.5)
+
+    assert mixed.shape == (1, 2)
+    assert np.linalg.norm(mixed) == pytest.approx(2.0)
+    assert mixed[0, 0] == pytest.approx(mixed[0, 1])
+    assert np.allclose(blend_followup(q, p, weight=0.0), q)
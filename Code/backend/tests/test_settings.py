@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app.settings import ENV_PREFIX, load_settings
+
+
+def test_env_values_are_coerced(monkeypatch):
+    monkeypatch.setenv(ENV_PREFIX + "RETRIEVAL_K", "7")
+    monkeypatch.setenv(ENV_PREFIX + "EMBED_CACHE_LOWERCASE", "no")
+    monkeypatch.setenv(ENV_PREFIX + "MMR_LAMBDA", "none")
+    monkeypatch.setenv(ENV_PREFIX + "DATA_DIR", "~/trustmed-data")
+
+    s = load_settings()
+
+    assert s.retrieval_k == 7
+    assert s.embed_cache_lowercase is False
+    assert s.mmr_lambda is None
+    assert s.data_dir == Path("~/trustmed-data").expanduser()
+    assert s.processed_dir == s.data_dir / "processed"  # derived paths follow data_dir
+
+
+def test_env_overrides_file(tmp_path, monkeypatch):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"retrieval_k": 3, "parse_workers": 5}))
+    monkeypatch.setenv(ENV_PREFIX + "RETRIEVAL_K", "9")
+
+    s = load_settings(str(path))
+
+    assert (s.retrieval_k, s.parse_workers) == (9, 5)
+
+
+def test_unknown_file_settings_are_rejected(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"retrieval_kk": 3}))
+
+    with pytest.raises(ValueError, match="retrieval_kk"):
+        load_settings(str(path))
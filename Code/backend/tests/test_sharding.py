@@ -0,0 +1,151 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.hits import Hit
+from app.sharding import ShardedClient, build_shards, merge_hits, partition
+
+OPTIONS = [
+    {},
+    {"dedupe_sections": True},
+    {"max_distance": 0.6},
+    {"mmr_lambda": 0.5},
+    {"mmr_lambda": 0.7, "dedupe_sections": True},
+]
+QUERIES = ["What is the A1C test?", "insulin and blood sugar", "diet and exercise", "symptoms of diabetes"]
+
+
+class LocalShard:
+    """A LoadedIndex behind the SidecarClient methods ShardedClient calls."""
+
+    def __init__(self, idx):
+        self.idx = idx
+
+    def search_chunks(self, query_vec, k, **kwargs):
+        return self.idx.search_many(query_vec, k, **kwargs)[0]
+
+    def candidates(self, query_vec, fetch_k, **kwargs):
+        return self.idx.candidates(query_vec, fetch_k, **kwargs)
+
+    def stats(self):
+        return {"index_version": self.idx.version, "chunks": self.idx.index.ntotal}
+
+
+class DownShard:
+    """Every call fails like an unreachable sidecar."""
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            raise ConnectionError("Retrieval sidecar unavailable")
+        return call
+
+
+class HungShard:
+    """Answers nothing until released, like a wedged sidecar."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def stats(self):
+        self.release.wait(5)
+        return None
+
+
+def sharded(shards: list, timeout: float = 10) -> ShardedClient:
+    client = ShardedClient(["unused.sock"] * len(shards), "test-key", timeout=timeout)
+    client.shards = [LocalShard(idx) for idx in shards]
+    return client
+
+
+@pytest.fixture(scope="module")
+def hash_shards(retriever, tmp_path_factory):
+    """The test index split three ways by chunk_id."""
+    dirs = build_shards(3, "hash", shard_root=tmp_path_factory.mktemp("shards"))
+    version = retriever.index_version()
+    shards = []
+    with pytest.MonkeyPatch.context() as mp:
+        for shard_dir in dirs:
+            mp.setattr(retriever, "version_dir", lambda v, d=shard_dir: d / "versions" / v)
+            shards.append(retriever.LoadedIndex(version))
+    return shards
+
+
+def hit(distance: float, source: str = "src", section: str = "sec", chunk_id: str = "c") -> Hit:
+    return Hit(0, distance, "text", source, "structured", section, None, chunk_id)
+
+
+def test_merge_hits_takes_global_top_then_dedupes():
+    shard_a = [hit(0.1, section="a", chunk_id="a1"), hit(0.3, section="a", chunk_id="a2"), hit(0.5, section="c", chunk_id="c1")]
+    shard_b = [hit(0.2, section="b", chunk_id="b1"), hit(0.25, section="a", chunk_id="a3")]
+
+    pool = merge_hits([shard_a, shard_b], keep=4)
+    assert [h.chunk_id for h, _ in pool] == ["a1", "b1", "a3", "a2"]
+    assert [pos for _, pos in pool] == [(0, 0), (1, 0), (1, 1), (0, 1)]
+
+    # c1 is outside the global top 4, exactly as in one unsharded index
+    pool = merge_hits([shard_a, shard_b], keep=4, dedupe_sections=True)
+    assert [h.chunk_id for h, _ in pool] == ["a1", "b1"]
+
+
+def test_partition_covers_every_row_once():
+    metadata = [{"chunk_id": f"c{i}", "source": f"s{i % 3}"} for i in range(30)]
+
+    for by in ("hash", "source"):
+        rows = np.concatenate(partition(metadata, 3, by))
+        assert sorted(rows.tolist()) == list(range(30))
+    with pytest.raises(ValueError):
+        partition(metadata, 4, "source")
+
+
+@pytest.mark.parametrize("options", OPTIONS, ids=lambda o: ",".join(o) or "plain")
+def test_single_shard_matches_local_search(retriever, options):
+    client = sharded([retriever.active])
+    vecs = retriever.embed_queries(QUERIES)
+
+    local = retriever.active.search_many(vecs, 5, **options)
+    for vec, expected in zip(vecs, local):
+        hits = client.search_chunks(vec.reshape(1, -1), 5, **options)
+        assert [h.chunk_id for h in hits] == [h.chunk_id for h in expected]
+        assert [h.rank for h in hits] == list(range(1, len(hits) + 1))
+
+
+@pytest.mark.parametrize("options", OPTIONS, ids=lambda o: ",".join(o) or "plain")
+def test_hash_shards_match_local_search(retriever, hash_shards, options):
+    client = sharded(hash_shards)
+    vecs = retriever.embed_queries(QUERIES)
+
+    local = retriever.active.search_many(vecs, 5, **options)
+    for vec, expected in zip(vecs, local):
+        hits = client.search_chunks(vec.reshape(1, -1), 5, **options)
+        # Chunks with identical text tie; the distances must agree exactly
+        assert [h.distance for h in hits] == pytest.approx([h.distance for h in expected], abs=1e-6)
+        assert [h.score for h in hits] == pytest.approx([h.score for h in expected], abs=1e-6)
+
+
+def test_missing_shard_gives_partial_results(retriever, hash_shards):
+    client = sharded(hash_shards)
+    client.shards[1] = DownShard()
+
+    hits = client.search_chunks(retriever.embed_query("insulin"), 5)
+
+    assert len(hits) == 5
+    assert client.counters["partial_results"] == 1 and client.counters["shard_errors"] == 1
+    assert client.index_version() == retriever.index_version()
+
+
+def test_stats_wait_at_most_the_shard_timeout(retriever, hash_shards):
+    client = sharded(hash_shards, timeout=0.2)
+    hung = client.shards[2] = HungShard()
+
+    t0 = time.monotonic()
+    try:
+        stats = client.stats()
+    finally:
+        hung.release.set()
+
+    assert time.monotonic() - t0 < 2
+    assert [s["up"] for s in stats["shards"]] == [True, True, False]
+    assert stats["index_version"] == retriever.index_version()
+    assert client.counters["shard_timeouts"] == 1
@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def run_concurrently(flight: SingleFlight, fn, release: threading.Event, n: int = 5) -> list:
+    """
+    n callers of one key: the first one is the leader, the rest join
+    while it runs, then fn is released.
+    """
+    with ThreadPoolExecutor(n) as pool:
+        futures = [pool.submit(flight.do, "q", fn)]
+        while not flight.stats()["in_flight"]:
+            time.sleep(0.001)
+        futures += [pool.submit(flight.do, "q", fn) for _ in range(n - 1)]
+        while flight.stats()["followers"] < n - 1:
+            time.sleep(0.001)
+        release.set()
+    return futures
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    futures = run_concurrently(flight, fn, release)
+    results = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert results[0] == ("answer", False)
+    assert results[1:] == [("answer", True)] * 4
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 4, "errors": 0, "follower_timeouts": 0}
+
+
+def test_nothing_is_cached_between_calls():
+    flight = SingleFlight("test")
+    assert flight.do("q", lambda: 1) == (1, False)
+    assert flight.do("q", lambda: 2) == (2, False)
+
+
+def test_followers_get_their_own_copy_of_the_error():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise UpstreamError("Gemini 503", status=503)
+
+    futures = run_concurrently(flight, fn, release, n=3)
+    errors = [f.exception() for f in futures]
+
+    assert all(isinstance(e, UpstreamError) and e.status == 503 for e in errors)
+    leader_error = errors[0]
+    assert errors[1] is not leader_error and errors[2] is not errors[1]
+    assert errors[1].__cause__ is leader_error
+    assert flight.stats()["errors"] == 1
+
+
+def test_follower_past_max_wait_calls_upstream_itself():
+    flight = SingleFlight("test", max_wait=0.05)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append("leader")
+        release.wait(5)
+        return "slow"
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "q", slow)
+        while not flight.stats()["in_flight"]:
+            time.sleep(0.001)
+
+        assert flight.do("q", lambda: "own") == ("own", False)
+        release.set()
+        assert leader.result() == ("slow", False)
+
+    assert calls == ["leader"]
+    assert flight.stats()["follower_timeouts"] == 1
+
+
+def test_interrupted_leader_does_not_strand_followers():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise KeyboardInterrupt
+
+    futures = run_concurrently(flight, fn, release, n=2)
+
+    with pytest.raises(KeyboardInterrupt):
+        futures[0].result()
+    with pytest.raises(RuntimeError, match="aborted"):
+        futures[1].result()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+import time
+from typing import get_args
+
+import pytest
+
+from app.speech import PROVIDERS, ProviderName, SentenceSplitter, SpeechPipeline, TTSProvider
+
+ANSWER = (
+    "**Type 2 diabetes** is a chronic condition. It affects how the body uses glucose!\n"
+    "- Check your A1C regularly.\n"
+    "Ok.\n"
+    "Ask your [care team] today.\n"
+    "-----\n"
+    "Sources: ADA, CDC."
+)
+
+
+class FakeProvider(TTSProvider):
+    """Later sentences finish first; sentences containing "fail" raise."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def synthesize(self, text: str) -> bytes:
+        with self.lock:
+            self.calls.append(text)
+            delay = 0.05 / len(self.calls)
+        time.sleep(delay)
+        if "fail" in text:
+            raise RuntimeError("upstream 500")
+        return text.encode("utf-8")
+
+
+def split_streamed(text: str, step: int) -> list:
+    splitter = SentenceSplitter()
+    sentences = []
+    for i in range(0, len(text), step):
+        sentences += splitter.feed(text[i:i + step])
+    return sentences + splitter.close()
+
+
+def test_provider_names_match_registry():
+    assert set(get_args(ProviderName)) == set(PROVIDERS)
+
+
+def test_streamed_splitting_does_not_depend_on_chunking():
+    expected = [
+        "Type 2 diabetes is a chronic condition.",
+        "It affects how the body uses glucose!",
+        "Check your A1C regularly.",
+        "Ok. Ask your care team today.",  # short fragment joined to the next sentence
+    ]
+    for step in (1, 7, len(ANSWER)):
+        assert split_streamed(ANSWER, step) == expected
+
+
+def test_segments_arrive_in_sentence_order():
+    provider = FakeProvider()
+    segments = []
+    pipeline = SpeechPipeline(lambda *segment: segments.append(segment), provider, max_parallel=4)
+
+    pipeline.feed("First sentence is here. This one will fail badly. ")
+    pipeline.feed("Third sentence comes last.")
+    pipeline.close()
+    pipeline.join(timeout=5)
+
+    assert [index for index, *_ in segments] == [0, 1, 2]
+    assert segments[0][2] == b"First sentence is here."
+    assert segments[1][2] is None and "upstream 500" in segments[1][3]
+    assert segments[2][2] == b"Third sentence comes last."
+    assert pipeline.stats()["segments"] == 3
+
+
+def test_unknown_provider_is_a_validation_error(retriever):
+    from pydantic import ValidationError
+
+    from app.main import SpeechChatRequest
+
+    assert SpeechChatRequest(message="hi", tts_provider="cartesia").tts_provider == "cartesia"
+    with pytest.raises(ValidationError):
+        SpeechChatRequest(message="hi", tts_provider="polly")
+
+
+def test_cancelled_pipeline_stops_synthesizing():
+    provider = FakeProvider()
+    segments = []
+    pipeline = SpeechPipeline(lambda *segment: segments.append(segment), provider, max_parallel=1)
+
+    pipeline.feed("".join(f"Sentence number {i} is here. " for i in range(20)))
+    pipeline.cancel()
+    pipeline.feed("One more sentence after the cancel. ")
+    pipeline.close()
+    pipeline.join(timeout=5)
+
+    assert len(provider.calls) < 20 and len(segments) < 20
+    assert "One more sentence after the cancel." not in provider.calls
+
+
+def test_speech_stream_stops_when_the_client_disconnects(retriever, monkeypatch):
+    from app import main
+
+    delivered, finished = [], threading.Event()
+
+    def generate_answer(message, disease, session, on_text):
+        try:
+            for i in range(200):
+                on_text(f"Sentence number {i} is here. ")
+                delivered.append(i)
+                time.sleep(0.005)
+            return {"answer": "", "sources": [], "session_id": session.id, "usage": None, "index_version": None}
+        finally:
+            finished.set()
+
+    provider = FakeProvider()
+    monkeypatch.setattr(main, "generate_answer", generate_answer)
+    monkeypatch.setattr(main, "get_provider", lambda name: provider)
+
+    async def request():
+        first_chunk = asyncio.Event()
+        messages = [{"type": "http.request", "body": json.dumps({"message": "hi"}).encode(), "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await first_chunk.wait()  # then hang up
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                first_chunk.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/chat/speech", "raw_path": b"/chat/speech", "root_path": "",
+            "query_string": b"", "headers": [(b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 5000), "server": ("testserver", 80),
+        }
+        await main.app(scope, receive, send)
+
+    asyncio.run(request())
+
+    assert finished.wait(5)
+    assert len(delivered) < 200 and len(provider.calls) < 200
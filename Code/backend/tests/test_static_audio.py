@@ -0,0 +1,36 @@
+import pytest
+
+from app import static_audio
+from app.static_audio import PHRASES, is_phrase_prefix, split_fixed_phrase, strip_id3
+
+
+@pytest.fixture
+def closing_rendered(monkeypatch):
+    """Pretend only the closing phrase was pre-rendered."""
+    text = PHRASES["closing"]
+    monkeypatch.setattr(static_audio, "_rendered", {
+        "closing": {"text": text, "file": "closing.mp3", "audio": b"mp3", "pattern": static_audio._tail_pattern(text)},
+    })
+
+
+def test_strip_id3():
+    frame = b"\xff\xfb\x90\x00"
+    tag = b"ID3\x04\x00\x00" + bytes([0, 0, 1, 0]) + b"x" * 128  # syncsafe size 128
+
+    assert strip_id3(tag + frame) == frame
+    assert strip_id3(frame) == frame
+
+
+def test_answer_ending_in_the_closing_line(closing_rendered):
+    answer = "* Check your A1C.\n\n" + PHRASES["closing"].upper() + ".\n"
+
+    assert split_fixed_phrase(answer) == ("* Check your A1C.", "closing")
+    assert split_fixed_phrase(PHRASES["closing"]) == ("", "closing")
+    assert split_fixed_phrase("Do you have any more questions?") == ("Do you have any more questions?", None)
+
+
+def test_phrase_prefix(closing_rendered):
+    assert is_phrase_prefix("Do you have any more questions?")
+    assert not is_phrase_prefix(PHRASES["closing"])  # the whole phrase is not a prefix
+    assert not is_phrase_prefix("Do you have diabetes?")
+    assert not is_phrase_prefix("")
@@ -0,0 +1,57 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.vector_compression import index_bytes, is_exact, make_index, rescore, search
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((600, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[:20] + 0.1 * rng.standard_normal((20, 32)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def test_compressed_indexes_are_smaller(data):
+    vectors, _ = data
+    sizes = {storage: index_bytes(make_index(vectors, storage, pq_m=8)) for storage in ("flat", "fp16", "pq")}
+
+    assert sizes["pq"] < sizes["fp16"] < sizes["flat"]
+
+
+@pytest.mark.parametrize("storage", ["fp16", "pq"])
+def test_rescored_search_matches_exact_top_hit(data, storage):
+    vectors, queries = data
+    exact_d, exact_i = make_index(vectors, "flat").search(queries, 5)
+
+    index = make_index(vectors, storage, pq_m=8)
+    assert not is_exact(index)
+    distances, indices = search(index, vectors, queries, 5, rescore_factor=8)
+
+    assert (indices[:, 0] == exact_i[:, 0]).all()
+    # Re-scored distances are the exact inner products
+    assert np.allclose(distances, np.einsum("nd,nkd->nk", queries, vectors[indices]), atol=1e-5)
+
+
+def test_rescore_orders_and_pads_like_faiss():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]], dtype=np.float32)
+    query = np.array([[1.0, 0.0]], dtype=np.float32)
+    indices = np.array([[1, 2, 0, -1, 2]])  # approximate order, padding and a repeat
+
+    d, i = rescore(vectors, query, np.zeros_like(indices, dtype=np.float32), indices, keep=4)
+    assert i.tolist() == [[0, 2, 1, -1]]
+    assert d[0, :3].tolist() == pytest.approx([1.0, 0.8, 0.0])
+
+    d, i = rescore(vectors, query, np.zeros_like(indices, dtype=np.float32), indices, keep=2, metric_type=faiss.METRIC_L2)
+    assert i.tolist() == [[0, 2]]
+    assert d[0].tolist() == pytest.approx([0.0, 0.4])
+
+
+def test_invalid_storage_options(data):
+    with pytest.raises(ValueError):
+        make_index(data[0], "pq", pq_m=7)
+    with pytest.raises(ValueError):
+        make_index(data[0], "ivf")
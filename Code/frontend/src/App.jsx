@@ -29,6 +29,9 @@ function App() {
   const recognitionRef = useRef(null);
   const audioRef = useRef(null);
   const introPlayedRef = useRef(false);
+  const staticAudioRef = useRef({});
+  const speechQueueRef = useRef([]);
+  const sessionIdRef = useRef(null); // server-side conversation id
 
   const disease = "Type 2 Diabetes";
 
@@ -97,6 +100,7 @@ function App() {
   };
 
 const stopSpeaking = () => {
+  speechQueueRef.current = [];
   if (audioRef.current) {
     audioRef.current.pause();
     audioRef.current.currentTime = 0;
@@ -146,16 +150,21 @@ const requestTTS = async (text) => {
       audioRef.current.currentTime = 0;
     }
 
-    const res = await fetch("http://127.0.0.1:8000/tts", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ text }),
-    });
+    // Fixed phrases (intro) are pre-rendered static files
+    let url = staticAudioRef.current[text];
 
-    const data = await res.json();
+    if (!url) {
+      const res = await fetch("http://127.0.0.1:8000/tts", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ text }),
+      });
+
+      const data = await res.json();
+      if (data.audio) url = `data:audio/mp3;base64,${data.audio}`;
+    }
 
-    if (data.audio && audioRef.current) {
-      const url = `data:audio/mp3;base64,${data.audio}`;
+    if (url && audioRef.current) {
       audioRef.current.src = url;
 
       setIsSpeaking(true);
@@ -178,6 +187,42 @@ const requestTTS = async (text) => {
 };
 
 
+  // ===========================================================
+  // STREAMED SPEECH ("full" mode): play segments in order
+  // ===========================================================
+  const playNextSegment = () => {
+    const next = speechQueueRef.current.shift();
+    if (!next || !audioRef.current) {
+      setIsSpeaking(false);
+      return;
+    }
+    audioRef.current.src = `data:audio/mp3;base64,${next}`;
+    audioRef.current.onended = playNextSegment;
+    setIsSpeaking(true);
+    audioRef.current.play().catch(() => setIsSpeaking(false));
+  };
+
+  const enqueueSegment = (audio) => {
+    speechQueueRef.current.push(audio);
+    if (audioRef.current && audioRef.current.paused) playNextSegment();
+  };
+
+  // ===========================================================
+  // PRE-RENDERED PHRASES (text → static audio URL)
+  // ===========================================================
+  useEffect(() => {
+    fetch("http://127.0.0.1:8000/tts/static")
+      .then((res) => res.json())
+      .then((phrases) => {
+        const urls = {};
+        Object.values(phrases).forEach((p) => {
+          urls[p.text] = `http://127.0.0.1:8000${p.url}`;
+        });
+        staticAudioRef.current = urls;
+      })
+      .catch(() => {});
+  }, []);
+
   // ===========================================================
   // AUTOPLAY UNLOCK (Chrome)
   // ===========================================================
@@ -217,7 +262,11 @@ const requestTTS = async (text) => {
       const res = await fetch("http://127.0.0.1:8000/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: msg, disease }),
+        body: JSON.stringify({
+          message: msg,
+          disease,
+          session_id: sessionIdRef.current,
+        }),
       });
 
       if (!res.ok) {
@@ -227,7 +276,9 @@ const requestTTS = async (text) => {
           disclaimer: "",
         };
       }
-      return await res.json();
+      const data = await res.json();
+      if (data.session_id) sessionIdRef.current = data.session_id;
+      return data;
     } catch {
       return {
         answer: "⚠️ Network error contacting backend.",
@@ -237,6 +288,50 @@ const requestTTS = async (text) => {
     }
   };
 
+  // Answer + speech segments streamed as newline-delimited JSON
+  const callBackendSpeech = async (msg) => {
+    try {
+      const res = await fetch("http://127.0.0.1:8000/chat/speech", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          message: msg,
+          disease,
+          session_id: sessionIdRef.current,
+        }),
+      });
+
+      if (!res.ok) return callBackend(msg);
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let result = null;
+
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+          if (event.type === "audio") enqueueSegment(event.audio);
+          else if (event.type === "done") result = event;
+          else if (event.type === "error") console.error("Speech chat error:", event.error);
+        }
+      }
+
+      if (!result) return callBackend(msg);
+      if (result.session_id) sessionIdRef.current = result.session_id;
+      return result;
+    } catch {
+      return callBackend(msg);
+    }
+  };
+
   // ===========================================================
   // SEND MESSAGE
   // ===========================================================
@@ -250,7 +345,12 @@ const requestTTS = async (text) => {
     setIsLoading(true);
 
     try {
-      const backend = await callBackend(trimmed);
+      // Full mode: speech is synthesized sentence by sentence while the
+      // answer is generated, so it starts playing before it completes
+      const streamed = ttsMode === "full";
+      const backend = streamed
+        ? await callBackendSpeech(trimmed)
+        : await callBackend(trimmed);
 
       const botMsg = {
         role: "assistant",
@@ -266,13 +366,9 @@ const requestTTS = async (text) => {
       setMessages((prev) => [...prev, botMsg]);
 
       // --- TTS MODE handling ---
-      let speakText = "";
-      if (ttsMode === "summary") {
-        speakText = summarizeForTTS(backend.answer);
-      } else {
-        speakText = cleanForTTS(backend.answer);
+      if (!streamed) {
+        requestTTS(summarizeForTTS(backend.answer));
       }
-      requestTTS(speakText);
     } finally {
       setIsLoading(false);
     }